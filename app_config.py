@@ -0,0 +1,24 @@
+# app_config.py
+import os
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def ensure_env_loaded() -> None:
+    """
+    Loads the .env file once per process.
+    Called by the lazy client factories instead of at module import.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """
+    Reads a boolean environment variable ("1", "true", "yes" are truthy).
+    """
+    ensure_env_loaded()
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes"}
@@ -1,7 +1,137 @@
+import atexit
+import copy
+import itertools
 import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextvars import ContextVar
 
+import orjson
 
+from app_config import ensure_env_loaded
 
+# Id of the HTTP request being served, stamped on every record logged while serving it
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Default sampling rates for noisy events (1 in N kept); override with LOG_SAMPLE_<EVENT>=<rate>
+SAMPLED_EVENTS = {
+    "null_metric": 0.1,
+    "incomplete_metric": 0.1,
+}
+
+
+class Truncated:
+    """
+    Log argument that renders `text` cut to `limit` characters. Passed as a
+    %-style argument, the slice is only built if the record is emitted.
+    """
+    __slots__ = ("text", "limit")
+
+    def __init__(self, text: str, limit: int = 1000):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if len(self.text) <= self.limit:
+            return self.text
+        return f"{self.text[:self.limit]}... [{len(self.text) - self.limit} more chars]"
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamps records with the current request id and keeps only a sample of
+    records tagged with a sampled event (`extra={"event": ...}`).
+    """
+    def __init__(self):
+        super().__init__()
+        self.rates = {
+            event: float(os.getenv(f"LOG_SAMPLE_{event.upper()}", rate))
+            for event, rate in SAMPLED_EVENTS.items()
+        }
+        self.counters = {event: itertools.count() for event in self.rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        # Deterministic 1-in-N sampling: keeps the first occurrence, then every Nth
+        every = round(1 / rate)
+        if next(self.counters[record.event]) % every:
+            return False
+        record.sampled_every = every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, request id, message, plus
+    the event name, sampling rate and exception when present.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for field in ("event", "sampled_every"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records for the listener thread. Only the message is rendered on
+    the caller's thread; JSON/text formatting and the write happen off it.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """
+    Routes all logging through an unbounded queue drained by a background
+    thread writing to stderr. LOG_FORMAT is "json" (default) or "text";
+    LOG_LEVEL defaults to INFO.
+    """
+    ensure_env_loaded()
+    stream = logging.StreamHandler(sys.stderr)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        stream.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s"))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    handler = _QueueHandler(queue.SimpleQueue())
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # flushes queued records on shutdown
+    return listener
+
+
+_listener = configure_logging()
 logger = logging.getLogger(__name__)
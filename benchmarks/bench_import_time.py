@@ -0,0 +1,83 @@
+"""
+Cold-start benchmark for importing the FastAPI app.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters,
+reports the median wall time and the slowest top-level imports, and can
+append each run to a JSON-lines history file so cold start can be tracked
+over time (e.g. from CI).
+
+Run from the repository root:
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --history import_time_history.jsonl
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def run_once(module: str):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        raise RuntimeError(f"import {module} failed: {tail[0]}")
+
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    top_level = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue  # nested import or header row
+        top_level[name.strip()] = int(cumulative.strip())
+    return wall, top_level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--history", help="JSON-lines file to append this run to")
+    args = parser.parse_args()
+
+    walls, imports = [], {}
+    for _ in range(args.runs):
+        wall, top_level = run_once(args.module)
+        walls.append(wall)
+        for name, us in top_level.items():
+            imports.setdefault(name, []).append(us)
+
+    median_wall = statistics.median(walls)
+    slowest = sorted(
+        ((statistics.median(us), name) for name, us in imports.items()), reverse=True
+    )[: args.top]
+
+    print(f"import {args.module}: median {median_wall * 1e3:.1f} ms over {args.runs} runs")
+    for us, name in slowest:
+        print(f"  {us / 1e3:9.1f} ms  {name}")
+
+    if args.history:
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "module": args.module,
+            "python": sys.version.split()[0],
+            "median_wall_ms": round(median_wall * 1e3, 2),
+            "slowest_imports_ms": {name: round(us / 1e3, 2) for us, name in slowest},
+        }
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
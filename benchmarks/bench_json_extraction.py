@@ -0,0 +1,88 @@
+"""
+Benchmark for extracting JSON from large agent outputs.
+
+Compares the legacy non-greedy regex extraction against the single-pass
+JsonObjectLocator, both on whole outputs and on token-sized streamed chunks.
+
+Run from the repository root:
+    python -m benchmarks.bench_json_extraction
+"""
+import json
+import re
+import time
+
+from json_locator import JsonObjectLocator, locate_json_object
+
+
+def legacy_extract(raw_output: str):
+    match = re.search(r"```json\s*(\{.*?\})\s*```", raw_output, re.DOTALL)
+    if match:
+        return json.loads(match.group(1))
+    match = re.search(r"(\{.*?\})", raw_output, re.DOTALL)
+    if match:
+        return json.loads(match.group(1))
+    raise ValueError("No valid JSON found in agent output")
+
+
+def build_output(n_versions: int, fenced: bool) -> str:
+    versions = [f"45.1.{i}.0" for i in range(n_versions)]
+    metrics = {
+        "release_scope": {
+            "Release Epics": {v: {"Total": i, "Open": i % 3} for i, v in enumerate(versions)},
+            "Release PIRs": {v: {"Total": i * 2, "Open": 0} for i, v in enumerate(versions)},
+        },
+        "health_trends": {
+            "Unit Test Coverage": {
+                v: {"Criteria": ">= 80%", "Previous": "20%", "Current": "25%",
+                    "Status": "WIP", "Summary": "Braces {in} strings \"quoted\" are fine"}
+                for v in versions
+            }
+        },
+    }
+    body = json.dumps(metrics, indent=2)
+    if fenced:
+        return f"Here is the structured output:\n```json\n{body}\n```\nLet me know if you need anything else."
+    return f"Here is the structured output:\n{body}\nLet me know if you need anything else."
+
+
+def timeit(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    for fenced, n_versions in [(f, n) for f in (True, False) for n in (10, 100, 1000, 10000)]:
+        raw = build_output(n_versions, fenced)
+        expected = locate_json_object(raw)
+        assert expected is not None and len(expected["release_scope"]["Release Epics"]) == n_versions
+
+        try:
+            legacy_extract(raw)
+            legacy = f"{timeit(lambda: legacy_extract(raw)) * 1e3:8.2f} ms"
+        except (ValueError, json.JSONDecodeError):
+            legacy = "  FAILED   "
+
+        whole = timeit(lambda: locate_json_object(raw))
+
+        chunks = [raw[i:i + 4] for i in range(0, len(raw), 4)]
+
+        def streamed():
+            locator = JsonObjectLocator()
+            for chunk in chunks:
+                if locator.feed(chunk) is not None:
+                    break
+            return locator.close()
+
+        stream = timeit(streamed)
+        print(
+            f"{'fenced' if fenced else 'loose ':6} {len(raw) / 1024:9.1f} KiB | legacy {legacy} | "
+            f"locator {whole * 1e3:8.2f} ms | streamed(4-char) {stream * 1e3:8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
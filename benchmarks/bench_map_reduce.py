@@ -0,0 +1,92 @@
+"""
+Latency of the multi-release pipeline vs. the number of releases, structuring
+them in one prompt (MAP_REDUCE_MODE=never) or one release per prompt in
+parallel (MAP_REDUCE_MODE=always).
+
+Payloads of N releases are built from the first release of 3file.md with its
+version renumbered. Every LLM call is mocked with a latency modelled on a
+hosted chat model: --prefill-ms per 1000 prompt tokens plus --decode-ms per
+output token, where the structurer writes --tokens-per-release output tokens
+for each release in its prompt and the other crews a fixed 300.
+
+Run from the repository root (requires the app's dependencies installed):
+    python -m benchmarks.bench_map_reduce --releases 3,6,12,24
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from benchmarks.soak_analyze_markdown import FakeChatLLM, fake_crew_llm_call
+
+VERSION = re.compile(r"\b\d{2}\.\d{1,2}\.\d{1,2}\.\d{1,2}\b")
+MARKER = "\n------------------------------End of Release Extract--------------------------------------\n"
+
+
+def build_payload(template: str, releases: int) -> str:
+    first = template.split("End of Release Extract")[0].rstrip("-\n ")
+    original = VERSION.search(first).group()
+    return MARKER.join(first.replace(original, f"45.{1 + k // 90}.{10 + k % 90}.0") for k in range(releases))
+
+
+def timed_crew_call(prefill_ms: float, decode_ms: float, tokens_per_release: int):
+    def call(self, messages, *args, **kwargs):
+        text = json.dumps(messages) if not isinstance(messages, str) else messages
+        output_tokens = 300
+        if "Data Architect" in text:
+            output_tokens = tokens_per_release * max(len(set(VERSION.findall(text))), 1)
+        time.sleep((len(text) / 3 / 1000 * prefill_ms + output_tokens * decode_ms) / 1000)
+        return fake_crew_llm_call(self, messages, *args, **kwargs)
+    return call
+
+
+async def measure(markdown_text: str, mode: str) -> float:
+    from pipeline import analyze_markdown_text
+
+    os.environ["MAP_REDUCE_MODE"] = mode
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(32))  # as the app's lifespan does
+    start = time.perf_counter()
+    await analyze_markdown_text(markdown_text, "WST")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--releases", default="3,6,12,24")
+    parser.add_argument("--prefill-ms", type=float, default=20.0, help="per 1000 prompt tokens")
+    parser.add_argument("--decode-ms", type=float, default=2.0, help="per output token")
+    parser.add_argument("--tokens-per-release", type=int, default=700)
+    parser.add_argument("--concurrency", type=int, default=8, help="MAP_CONCURRENCY and WST_LLM_CONCURRENCY")
+    parser.add_argument("--payload", default="3file.md")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "MAP_CONCURRENCY": str(args.concurrency),
+        "WST_LLM_CONCURRENCY": str(args.concurrency),
+        "MODEL_CONTEXT_TOKENS": "10000000",  # measure single pass past the real window too
+        "LLM_CACHE_BACKEND": "none",
+        "METRICS_HISTORY": "false",
+        "LOG_LEVEL": "ERROR",
+    })
+    from crewai import LLM
+
+    with open(args.payload) as f:
+        template = json.load(f)["markdown_text"]
+
+    call = timed_crew_call(args.prefill_ms, args.decode_ms, args.tokens_per_release)
+    print(f"{'releases':>8} | {'single pass s':>13} | {'map-reduce s':>12} | speedup")
+    with mock.patch.object(LLM, "call", call), \
+            mock.patch("utils.get_azure_chat_llm", lambda max_tokens: FakeChatLLM()):
+        for releases in (int(n) for n in args.releases.split(",")):
+            markdown_text = build_payload(template, releases)
+            single = asyncio.run(measure(markdown_text, "never"))
+            mapped = asyncio.run(measure(markdown_text, "always"))
+            print(f"{releases:8d} | {single:13.2f} | {mapped:12.2f} | {single / mapped:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
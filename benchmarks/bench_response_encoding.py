@@ -0,0 +1,97 @@
+"""
+Benchmark for the /analyze_markdown response path on large multi-release results.
+
+"before" is the previous path: the report serialized with json.dumps(indent=2)
+for the judge, the response validated by MultiFileAnalysisResponse, then
+encoded by FastAPI's jsonable_encoder and JSONResponse. "after" is the current
+path: a compact orjson dump for the judge, model_construct, and ORJSONResponse
+over the model's fields.
+
+Run from the repository root:
+    python -m benchmarks.bench_response_encoding
+"""
+import json
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from main import json_response
+from models import MultiFileAnalysisResponse
+
+
+def build_result(n_versions: int) -> dict:
+    versions = [f"45.1.{i}.0" for i in range(n_versions)]
+    metrics = {
+        "release_scope": {
+            "Target Customers": {v: "H&M, BP" for v in versions},
+            "Release Epics": {v: {"Total": i, "Open": i % 3} for i, v in enumerate(versions)},
+            "Release PIRs": {v: {"Total": i * 2, "Open": 0} for i, v in enumerate(versions)},
+            "SFDC Defects Fixed": {v: {"ATLs Fixed": 80 + i, "BTLs Fixed": 26} for i, v in enumerate(versions)},
+        },
+        "critical_metrics": {
+            "System / Solution Test Coverage": {v: {"Value": 90.0, "Status": "MEDIUM RISK"} for v in versions},
+            "Security Test Metrics": {v: {"Total": 20, "Open": 0, "Status": "NO RISK"} for v in versions},
+        },
+        "health_trends": {
+            "Unit Test Coverage": {
+                v: {"Criteria": ">= 80%", "Previous": "20%", "Current": "25%",
+                    "Status": "WIP", "Summary": "This is an ongoing effort with ETA of Q3 2026"}
+                for v in versions
+            }
+        },
+    }
+    report = {
+        "release_scope": [{"version": v, "Total": i, "Open": i % 3, "trend": "up"} for i, v in enumerate(versions)],
+        "risks": [f"Open defects in {v}" for v in versions],
+        "summary": "Quality improved across the releases. " * 20,
+    }
+    charts = {"charts": [
+        {"type": "line", "data": {"labels": versions, "datasets": [{"label": "Epics", "data": list(range(n_versions))}]}}
+        for _ in range(4)
+    ]}
+    return {
+        "metrics": metrics,
+        "report": report,
+        "evaluation": {"total": 88, "evaluation": "Accurate and clear."},
+        "brief_summary": "- Scope grew\n- Coverage steady\n- No security risk",
+        "visualization_json": charts,
+    }
+
+
+def before(result: dict) -> bytes:
+    json.dumps(result["report"], indent=2)
+    response = MultiFileAnalysisResponse(**result)
+    return JSONResponse(jsonable_encoder(response)).body
+
+
+def after(result: dict) -> bytes:
+    orjson.dumps(result["report"]).decode()
+    response = MultiFileAnalysisResponse.model_construct(**result)
+    return json_response(response).body
+
+
+def timeit(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    for n_versions in (3, 30, 300, 3000):
+        result = build_result(n_versions)
+        assert json.loads(before(result)) == json.loads(after(result))
+        old = timeit(lambda: before(result))
+        new = timeit(lambda: after(result))
+        print(
+            f"{n_versions:5} releases {len(after(result)) / 1024:9.1f} KiB | "
+            f"before {old * 1e3:8.2f} ms | after {new * 1e3:8.2f} ms | {old / new:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
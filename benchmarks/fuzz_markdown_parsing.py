@@ -0,0 +1,203 @@
+"""
+Adversarial fuzz and scaling suite for the parsing layer, which runs on
+untrusted input before any LLM call.
+
+1. Differential fuzz: random documents built from the tokens the parsers key
+   on (marker characters, whitespace, the marker phrase, headings, labels)
+   are parsed by the current release-marker scanner, stakeholder split and
+   JSON locator and by the code they replaced; the results must be identical.
+2. Scaling: every parser (sanitize, split, extract, harmonize, preflight,
+   JSON location) runs on inputs crafted to trigger backtracking, at --size
+   and 8x --size characters. Linear code takes ~8x as long on the larger
+   input, quadratic code ~64x; the run fails when any ratio exceeds
+   --max-ratio or any input takes more than --max-us-per-char.
+
+With --reference, the replaced regexes are timed on the same inputs too (at
+--size only; they are quadratic).
+
+Run from the repository root:
+    python -m benchmarks.fuzz_markdown_parsing --iterations 20000 --size 25000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+from json_locator import JsonObjectLocator, locate_json_object
+from preflight import plan_analysis
+from utils import find_release_markers, sanitize_incoming_payload, split_joined_markdown_text, split_release_chunks
+from wst_markdown_processor import _STAKEHOLDER_COLUMN, Wst_MarkdownExtractor, Wst_MarkdownHarmonizer
+
+# The patterns replaced for being quadratic on long runs
+REFERENCE_MARKER = re.compile(r"[-=~*#]{2,}\s*End of Release Extract\s*[-=~*#]{2,}")
+REFERENCE_STAKEHOLDER_COLUMN = re.compile(r"\n+(Functional Group|Approver|Functional Lead)\n+")
+
+
+def reference_decode_first_object(text: str, pos: int):
+    """
+    JSON location before candidates were prefiltered and capped: quadratic on stray braces.
+    """
+    brace = text.find("{", pos)
+    while brace >= 0:
+        try:
+            return json.JSONDecoder().raw_decode(text, brace)[0]
+        except json.JSONDecodeError:
+            brace = text.find("{", brace + 1)
+    return None
+
+
+def reference_locate_json_object(text: str):
+    fence = text.find("```json")
+    if fence >= 0:
+        structured = reference_decode_first_object(text, fence + len("```json"))
+        if structured is not None:
+            return structured
+    return reference_decode_first_object(text, 0)
+
+TOKENS = [
+    "-", "--", "----", "=", "~", "*", "#", "##", " ", "  ", "\n", "\n\n", "\t", "\x0b", " ",
+    "End of Release Extract", "End of Release", "Extract", "45.1.15.0", "45.1.16.0", "145.1.1.0",
+    "x", "**", "**Key Stakeholders:**", "Functional Group", "Approver", "Functional Lead", ":",
+    "{", "}", '"', '"a"', ": 1", ",", "```json",
+]
+
+ADVERSARIAL = {
+    "marker char run": lambda n: "45.1.15.0\n" + "-" * n,
+    "mixed marker chars": lambda n: "45.1.15.0\n" + "-=~*#" * (n // 5),
+    "phrase without runs": lambda n: "45.1.15.0\n" + "-- End of Release Extract " * (n // 26),
+    "runs and whitespace": lambda n: "45.1.15.0\n" + ("--" + " \n" * 10) * (n // 22),
+    "stakeholder blank lines": lambda n: "**Key Stakeholders:**\n-\nx" + "\n" * n + "x",
+    "stakeholder labels": lambda n: "**Key Stakeholders:**\n-\nx" + "\n\nApprover" * (n // 10) + "\nx",
+    "noisy lookahead": lambda n: "**Key Stakeholders:**\n-\n" + ("\n**" + ":" * 40) * (n // 43),
+    "noisy dash lines": lambda n: ("**Release Health Trends:**\n" + "-" * 60) * (n // 87),
+    "repeated clean heading": lambda n: ("## 📦 Release Scope" + " " * 100) * (n // 118),
+    "repeated trend heading": lambda n: ("### Release Health Trends" + " \t" * 50) * (n // 125),
+    "numbered items": lambda n: "**Critical Release Metrics:**\n-\nx" + "\n**1" * (n // 4) + "x",
+    "open braces": lambda n: "{" * n,
+    "unterminated strings": lambda n: '{"a": "' * (n // 7),
+    "token soup": lambda n: soup(random.Random(n), n),
+}
+
+
+def soup(rng: random.Random, size: int) -> str:
+    parts, length = [], 0
+    while length < size:
+        token = rng.choice(TOKENS)
+        parts.append(token)
+        length += len(token)
+    return "".join(parts)
+
+
+def extract(text: str) -> None:
+    Wst_MarkdownExtractor(text).extract()
+
+
+def harmonize(text: str) -> None:
+    Wst_MarkdownHarmonizer().harmonize({"45.1.15.0": text})
+
+
+def stream_json(text: str, chunk_size: int = 4096):
+    locator = JsonObjectLocator()
+    for start in range(0, len(text), chunk_size):
+        if locator.feed(text[start:start + chunk_size]) is not None:
+            break
+    return locator.close()
+
+
+PARSERS = {
+    "sanitize": lambda text: sanitize_incoming_payload({"markdown_text": text, "product": "WST"}),
+    "split": split_release_chunks,
+    "split_joined": split_joined_markdown_text,
+    "extract": extract,
+    "harmonize": harmonize,
+    "preflight": lambda text: plan_analysis(text, single_release=False),
+    "json": locate_json_object,
+    "json_stream": stream_json,
+}
+
+REFERENCE_PARSERS = {
+    "old marker split": REFERENCE_MARKER.split,
+    "old stakeholder": REFERENCE_STAKEHOLDER_COLUMN.split,
+    "old json": reference_locate_json_object,
+}
+
+
+def differential(iterations: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for i in range(iterations):
+        text = soup(rng, rng.randint(1, 400))
+        checks = {
+            "markers": (
+                list(find_release_markers(text)),
+                [m.span() for m in REFERENCE_MARKER.finditer(text)],
+            ),
+            "split_joined": (
+                split_joined_markdown_text(text),
+                [part.strip() for part in REFERENCE_MARKER.split(text) if part.strip()],
+            ),
+            "stakeholder split": (_STAKEHOLDER_COLUMN.split(text), REFERENCE_STAKEHOLDER_COLUMN.split(text)),
+            "json": (locate_json_object(text), reference_locate_json_object(text)),
+            "json streamed": (stream_json(text, chunk_size=7), reference_decode_first_object(text, 0)),
+        }
+        for name, (current, reference) in checks.items():
+            if current != reference:
+                failures += 1
+                if failures <= 5:
+                    print(f"MISMATCH {name} on {json.dumps(text)}:\n  {current}\n  {reference}")
+    print(f"differential: {iterations} documents, {failures} mismatches")
+    return failures
+
+
+def timed(fn, text: str) -> float:
+    start = time.perf_counter()
+    try:
+        fn(text)
+    except Exception:
+        pass  # rejected input (e.g. a 400/413 from sanitize) still counts as handled
+    return time.perf_counter() - start
+
+
+def scaling(size: int, max_ratio: float, max_us_per_char: float, reference: bool) -> int:
+    failures = 0
+    print(f"{'input':<24} | {'parser':<17} | {size:>9} chars s | {size * 8:>9} chars s | ratio")
+    for input_name, make in ADVERSARIAL.items():
+        small, large = make(size), make(size * 8)
+        for parser_name, parse in PARSERS.items():
+            small_s, large_s = timed(parse, small), timed(parse, large)
+            ratio = large_s / max(small_s, 1e-4)
+            too_slow = large_s / len(large) * 1e6 > max_us_per_char or (large_s > 0.01 and ratio > max_ratio)
+            failures += too_slow
+            print(
+                f"{input_name:<24} | {parser_name:<17} | {small_s:15.4f} | {large_s:15.4f} | "
+                f"{ratio:5.1f}{'  FAIL' if too_slow else ''}"
+            )
+        if reference:
+            for parser_name, parse in REFERENCE_PARSERS.items():
+                print(f"{input_name:<24} | {parser_name:<17} | {timed(parse, small):15.4f} | {'-':>15} |")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=25000)
+    parser.add_argument("--max-ratio", type=float, default=20.0, help="large/small time; 8 is linear")
+    parser.add_argument("--max-us-per-char", type=float, default=5.0)
+    parser.add_argument("--reference", action="store_true", help="also time the replaced regexes")
+    args = parser.parse_args()
+
+    failures = differential(args.iterations, args.seed)
+    failures += scaling(args.size, args.max_ratio, args.max_us_per_char, args.reference)
+    print("FAILED" if failures else "OK: all parsers linear on adversarial inputs")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Load test for multi-worker mode.
+
+Starts 1, 2 and 4 app workers sharing one SQLite backend (WORKER_BACKEND=sqlite),
+each with every LLM call mocked to take --llm-latency seconds, and sends them
+--requests distinct analyses, each twice, from concurrent clients spread over
+the workers. Reports throughput per worker count, and how many of the repeated
+requests were answered from the shared result cache instead of a second run.
+
+Run from the repository root (requires the app's dependencies installed):
+    python -m benchmarks.load_multiworker --requests 24 --llm-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import mock
+
+from benchmarks.soak_analyze_markdown import SOAK_TOKEN, FakeChatLLM, fake_crew_llm_call
+
+BASE_PORT = 8700
+LOAD_TENANTS = {"tenants": {"load": {
+    "tokens": [SOAK_TOKEN], "rate_per_minute": 10**9, "burst": 10**9, "max_concurrency": 64, "max_queue": 1024,
+}}}
+
+
+def serve(port: int, env: dict, latency: float, runs) -> None:
+    os.environ.update(env)
+    from crewai import LLM
+    import uvicorn
+
+    def slow_crew_call(self, messages, *args, **kwargs):
+        time.sleep(latency)
+        return fake_crew_llm_call(self, messages, *args, **kwargs)
+
+    class SlowChatLLM(FakeChatLLM):
+        async def ainvoke(self, prompt):
+            await asyncio.sleep(latency)
+            return await super().ainvoke(prompt)
+
+        def invoke(self, prompt):
+            time.sleep(latency)
+            return super().invoke(prompt)
+
+    def counted_harmonize(original):
+        def harmonize(*args, **kwargs):
+            with runs.get_lock():
+                runs.value += 1  # one per pipeline run
+            return original(*args, **kwargs)
+        return harmonize
+
+    import pipeline
+
+    with mock.patch.object(LLM, "call", slow_crew_call), \
+            mock.patch("utils.get_azure_chat_llm", lambda max_tokens: SlowChatLLM()), \
+            mock.patch.object(pipeline, "harmonize_releases", counted_harmonize(pipeline.harmonize_releases)):
+        uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+async def wait_ready(client, ports):
+    for port in ports:
+        for _ in range(600):
+            try:
+                await client.get(f"http://127.0.0.1:{port}/docs")
+                break
+            except Exception:
+                await asyncio.sleep(0.1)
+
+
+async def drive(ports, payloads, concurrency: int) -> dict:
+    import httpx
+
+    headers = {"Authorization": f"Bearer {SOAK_TOKEN}"}
+    # Every payload is sent twice, to two different workers
+    jobs = [(payload, ports[(i + k) % len(ports)]) for k in (0, 1) for i, payload in enumerate(payloads)]
+    outcomes = {}
+    gate = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=600) as client:
+        await wait_ready(client, ports)
+        start = time.perf_counter()
+
+        async def send(payload, port):
+            async with gate:
+                r = await client.post(f"http://127.0.0.1:{port}/analyze_markdown", json=payload, headers=headers)
+                outcomes[r.status_code] = outcomes.get(r.status_code, 0) + 1
+
+        await asyncio.gather(*(send(payload, port) for payload, port in jobs))
+        elapsed = time.perf_counter() - start
+    return {"requests": len(jobs), "seconds": elapsed, "outcomes": outcomes}
+
+
+def run(workers: int, payloads, latency: float, concurrency: int) -> None:
+    workdir = tempfile.mkdtemp()
+    tenants_file = os.path.join(workdir, "tenants.json")
+    with open(tenants_file, "w") as f:
+        json.dump(LOAD_TENANTS, f)
+    env = {
+        "TENANTS_CONFIG": tenants_file,
+        "WORKER_BACKEND": "sqlite",
+        "WORKER_BACKEND_PATH": os.path.join(workdir, "workers.sqlite3"),
+        "LLM_CACHE_BACKEND": "none",
+        "WST_LLM_CONCURRENCY": "4",
+        "LOG_LEVEL": "WARNING",
+    }
+    ports = [BASE_PORT + i for i in range(workers)]
+    ctx = multiprocessing.get_context("spawn")
+    runs = ctx.Value("i", 0)
+    processes = [ctx.Process(target=serve, args=(port, env, latency, runs), daemon=True) for port in ports]
+    for p in processes:
+        p.start()
+    try:
+        result = asyncio.run(drive(ports, payloads, concurrency))
+    finally:
+        for p in processes:
+            p.terminate()
+            p.join()
+    print(
+        f"{workers:7d} | {result['requests']:8d} | {result['seconds']:7.1f} | "
+        f"{result['requests'] / result['seconds']:6.2f} | {runs.value:13d} | {result['outcomes']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=24, help="distinct analyses (each sent twice)")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight from the client")
+    parser.add_argument("--payload", default="3file.md", help="JSON request body to vary")
+    parser.add_argument("--workers", default="1,2,4")
+    args = parser.parse_args()
+
+    with open(args.payload) as f:
+        base = json.load(f)
+    payloads = [{**base, "markdown_text": f"<!-- load {i} -->\n{base['markdown_text']}"} for i in range(args.requests)]
+
+    print(f"{'workers':>7} | {'requests':>8} | {'seconds':>7} | {'req/s':>6} | {'pipeline runs':>13} | outcomes")
+    for workers in (int(w) for w in args.workers.split(",")):
+        run(workers, payloads, args.llm_latency, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
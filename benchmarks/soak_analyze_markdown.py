@@ -0,0 +1,158 @@
+"""
+Soak test for long-running workers.
+
+Runs thousands of requests through `main.analyze_markdown` in one process with
+every LLM call mocked (crewAI `LLM.call` and the LangChain judge/summary
+clients), and periodically reports RSS, live object counts and crew memory
+size, so growth under each CREW_MEMORY_POLICY can be compared.
+
+Run from the repository root (requires the app's dependencies installed):
+    CREW_MEMORY_POLICY=shared CREW_MEMORY_CAPACITY=128 \
+        python -m benchmarks.soak_analyze_markdown --requests 5000 --every 250
+"""
+import argparse
+import asyncio
+import collections
+import gc
+import json
+import os
+import resource
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+METRICS = {
+    "release_scope": {
+        "Target Customers": "H&M",
+        "Release Epics": {"45.1.15.0": {"Total": 11, "Open": 0}, "45.1.16.0": {"Total": 11, "Open": 0}},
+        "Release PIRs": {"45.1.15.0": {"Total": 0, "Open": 0}, "45.1.16.0": {"Total": 93, "Open": 0}},
+        "SFDC Defects Fixed": {"45.1.15.0": {"ATLs Fixed": 83, "BTLs Fixed": 26}, "45.1.16.0": {"ATLs Fixed": 88, "BTLs Fixed": 41}},
+    },
+    "critical_metrics": {},
+    "health_trends": {},
+}
+REPORT = {"Overview": "45.1.15.0, 45.1.16.0", "Metrics Summary": {}, "Key findings": "-", "Recommendations": "-"}
+CHARTS = {"charts": []}
+SOAK_TOKEN = "soak-test-token"
+# The soak client is its own tenant with limits high enough to never be throttled
+SOAK_TENANTS = {"tenants": {"soak": {"tokens": [SOAK_TOKEN], "rate_per_minute": 10**9, "burst": 10**9}}}
+BRIEF = "- Scope stable\n- No open epics\n- PIRs up"
+
+
+def fake_crew_llm_call(self, messages, *args, **kwargs):
+    text = json.dumps(messages) if not isinstance(messages, str) else messages
+    if "Data Architect" in text:
+        answer = json.dumps(METRICS)
+    elif "Technical Writer" in text:
+        answer = json.dumps(REPORT)
+    elif "Data Visualization" in text:
+        answer = json.dumps(CHARTS)
+    else:
+        answer = BRIEF
+    return f"Thought: I now can give a great answer\nFinal Answer: {answer}"
+
+
+class FakeChatLLM:
+    RESPONSE = "Data accuracy: 45\nAnalysis depth: 25\nClarity: 18\nTOTAL: 88\nEvaluation: Mocked."
+
+    def invoke(self, prompt):
+        return SimpleNamespace(content=self.RESPONSE)
+
+    async def ainvoke(self, prompt):
+        return SimpleNamespace(content=self.RESPONSE)
+
+
+class ConnectedRequest:
+    headers = {}
+
+    async def is_disconnected(self):
+        return False
+
+
+def rss_mib() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, not current
+
+
+def type_counts() -> collections.Counter:
+    return collections.Counter(type(o).__name__ for o in gc.get_objects())
+
+
+def crew_memory_items() -> int:
+    import wst_product_config
+
+    total = 0
+    for pool in wst_product_config._crew_pools.values():
+        bundles = []
+        while not pool.empty():
+            bundles.append(pool.get_nowait())
+        for bundle in bundles:
+            total += bundle[1].size()
+            pool.put(bundle)
+    return total
+
+
+async def soak(n_requests: int, every: int, payload: dict):
+    import main
+    from models import MarkdownAnalysisRequest
+
+    token = SimpleNamespace(credentials=SOAK_TOKEN)
+    outcomes = collections.Counter()
+    gc.collect()
+    baseline_types = type_counts()
+    start = time.perf_counter()
+
+    print(f"{'requests':>9} | {'rss MiB':>8} | {'objects':>9} | {'mem items':>9} | {'req/s':>7} | outcomes")
+    for i in range(1, n_requests + 1):
+        try:
+            await main.analyze_markdown(MarkdownAnalysisRequest(**payload), ConnectedRequest(), token=token)
+            outcomes["ok"] += 1
+        except Exception as e:
+            outcomes[getattr(e, "status_code", type(e).__name__)] += 1
+
+        if i % every == 0 or i == n_requests:
+            gc.collect()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{i:9d} | {rss_mib():8.1f} | {len(gc.get_objects()):9d} | "
+                f"{crew_memory_items():9d} | {i / elapsed:7.1f} | {dict(outcomes)}"
+            )
+
+    growth = type_counts()
+    growth.subtract(baseline_types)
+    print("\nLargest object-count growth by type:")
+    for name, delta in growth.most_common(10):
+        print(f"  {delta:+8d}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--every", type=int, default=200)
+    parser.add_argument("--payload", default="3file.md", help="JSON request body to replay")
+    args = parser.parse_args()
+
+    with open(args.payload) as f:
+        payload = json.load(f)
+
+    tenants_file = os.path.join(tempfile.mkdtemp(), "tenants.json")
+    with open(tenants_file, "w") as f:
+        json.dump(SOAK_TENANTS, f)
+    os.environ["TENANTS_CONFIG"] = tenants_file
+
+    from crewai import LLM
+
+    with mock.patch.object(LLM, "call", fake_crew_llm_call), \
+            mock.patch("utils.get_azure_chat_llm", lambda max_tokens: FakeChatLLM()):
+        asyncio.run(soak(args.requests, args.every, payload))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# crew_memory.py
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from crewai.memory import EntityMemory, LongTermMemory, ShortTermMemory
+
+from app_config import ensure_env_loaded
+
+MEMORY_POLICIES = ("none", "ephemeral", "shared")
+
+_WORD = re.compile(r"\w+")
+
+
+def _tokens(text: str) -> set:
+    return set(_WORD.findall(str(text).lower()))
+
+
+class BoundedMemoryStorage:
+    """
+    In-process storage for crewAI short-term and entity memory.
+
+    Holds at most `capacity` items and evicts the oldest first. Search is a
+    keyword-overlap score rather than an embedding lookup, so saving a memory
+    never creates embeddings or vector-store files.
+    (No __len__: crewAI falls back to its default storage when a storage is falsy.)
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def save(self, value: Any, metadata: Dict[str, Any]) -> None:
+        item = {"context": str(value), "metadata": metadata or {}, "tokens": _tokens(value)}
+        with self._lock:
+            self._items[self._next_id] = item
+            self._next_id += 1
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def search(self, query: str, limit: int = 3, score_threshold: float = 0.35) -> List[Dict[str, Any]]:
+        query_tokens = _tokens(query)
+        if not query_tokens:
+            return []
+        with self._lock:
+            items = list(self._items.items())
+
+        scored = []
+        for item_id, item in items:
+            score = len(query_tokens & item["tokens"]) / len(query_tokens)
+            if score >= score_threshold:
+                scored.append({"id": item_id, "context": item["context"], "metadata": item["metadata"], "score": score})
+        scored.sort(key=lambda r: r["score"], reverse=True)
+        return scored[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def size(self) -> int:
+        return len(self._items)
+
+
+class BoundedLongTermStorage:
+    """
+    In-process replacement for crewAI's SQLite long-term memory storage,
+    keeping the `capacity` most recent task evaluations.
+    """
+
+    def __init__(self, capacity: int):
+        self._items = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def save(self, task_description: str, metadata: Dict[str, Any], datetime: str, score: float) -> None:
+        with self._lock:
+            self._items.append({"task_description": task_description, "metadata": metadata, "datetime": datetime, "score": score})
+
+    def load(self, task_description: str, latest_n: int) -> List[Dict[str, Any]] | None:
+        with self._lock:
+            matches = [i for i in reversed(self._items) if i["task_description"] == task_description]
+        if not matches:
+            return None
+        return [{"metadata": i["metadata"], "datetime": i["datetime"], "score": i["score"]} for i in matches[:latest_n]]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def size(self) -> int:
+        return len(self._items)
+
+
+class CrewMemory:
+    """
+    Memory configuration for one crew bundle under a given policy:
+
+    - "none": crews run without memory.
+    - "ephemeral": the bundle gets its own bounded stores, cleared after each request.
+    - "shared": all bundles share one set of bounded stores; old items are evicted
+      once `capacity` is reached.
+    """
+
+    def __init__(self, policy: str, capacity: int):
+        if policy not in MEMORY_POLICIES:
+            raise ValueError(f"Unknown crew memory policy '{policy}', expected one of {MEMORY_POLICIES}")
+        self.policy = policy
+        self.capacity = capacity
+        if policy != "none":
+            self.short_term = BoundedMemoryStorage(capacity)
+            self.entity = BoundedMemoryStorage(capacity)
+            self.long_term = BoundedLongTermStorage(capacity)
+
+    def crew_kwargs(self) -> dict:
+        """
+        Keyword arguments for `Crew(...)` wiring in this policy's stores.
+        """
+        if self.policy == "none":
+            return {"memory": False}
+        return {
+            "memory": True,
+            "short_term_memory": ShortTermMemory(storage=self.short_term),
+            "entity_memory": EntityMemory(storage=self.entity),
+            "long_term_memory": LongTermMemory(storage=self.long_term),
+        }
+
+    def end_request(self) -> None:
+        """
+        Called when a request hands its crew bundle back to the pool.
+        """
+        if self.policy == "ephemeral":
+            self.short_term.reset()
+            self.entity.reset()
+            self.long_term.reset()
+
+    def size(self) -> int:
+        if self.policy == "none":
+            return 0
+        return self.short_term.size() + self.entity.size() + self.long_term.size()
+
+
+def memory_settings() -> tuple:
+    """
+    Reads CREW_MEMORY_POLICY (none | ephemeral | shared, default none) and
+    CREW_MEMORY_CAPACITY (items per store, default 256).
+    """
+    ensure_env_loaded()
+    policy = os.getenv("CREW_MEMORY_POLICY", "none").strip().lower()
+    capacity = int(os.getenv("CREW_MEMORY_CAPACITY", "256"))
+    return policy, capacity
+
+
+@lru_cache(maxsize=None)
+def _shared_memory(capacity: int) -> CrewMemory:
+    return CrewMemory("shared", capacity)
+
+
+def new_crew_memory(policy: str | None = None, capacity: int | None = None) -> CrewMemory:
+    """
+    Returns the memory for a newly built crew bundle: a fresh one per bundle,
+    or the single process-wide instance for the "shared" policy.
+    """
+    default_policy, default_capacity = memory_settings()
+    policy = policy or default_policy
+    capacity = capacity or default_capacity
+    if policy == "shared":
+        return _shared_memory(capacity)
+    return CrewMemory(policy, capacity)
@@ -0,0 +1,70 @@
+# dashboard_store.py
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
+from app_config import ensure_env_loaded
+
+
+class DashboardAnalysis:
+    """
+    What the last analysis of one dashboard produced, kept so the next request
+    for the same dashboard only redoes the releases that changed.
+    """
+    def __init__(self):
+        self.chunk_extractions = {}  # release chunk -> extracted markdown
+        self.section_cache = {}      # extracted markdown -> harmonizer sections
+        self.release_metrics = {}    # version -> (extracted markdown, structurer metrics)
+        self.metrics = None          # merged metrics across releases
+        self.response = None         # MultiFileAnalysisResponse built from `metrics`
+
+
+class LruStore:
+    """
+    Thread-safe, size-bounded map. The least recently used entry is dropped
+    once `capacity` is reached.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.lock = Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        with self.lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value) -> None:
+        with self.lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+class DashboardStore(LruStore):
+    """
+    Map of dashboard key -> DashboardAnalysis.
+    """
+
+
+@lru_cache(maxsize=1)
+def get_dashboard_store() -> DashboardStore:
+    """
+    Process-wide store, sized by DASHBOARD_CACHE_SIZE (default 128 dashboards).
+    """
+    ensure_env_loaded()
+    return DashboardStore(capacity=int(os.getenv("DASHBOARD_CACHE_SIZE", "128")))
+
+
+@lru_cache(maxsize=1)
+def get_summary_cache() -> LruStore:
+    """
+    Process-wide single-release summaries by content hash, sized by
+    SUMMARY_CACHE_SIZE (default 512 summaries).
+    """
+    ensure_env_loaded()
+    return LruStore(capacity=int(os.getenv("SUMMARY_CACHE_SIZE", "512")))
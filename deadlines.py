@@ -0,0 +1,115 @@
+# deadlines.py
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+
+from app_config import ensure_env_loaded
+from app_logging import logger
+
+# Default time budget per pipeline stage, in seconds; override with STAGE_TIMEOUT_<STAGE>
+STAGE_BUDGETS = {
+    "summary": 60.0,
+    "structurer": 120.0,
+    "reporter": 90.0,
+    "brief": 45.0,
+    "viz": 60.0,
+    "judge": 45.0,
+}
+
+# CPU seconds a parsing stage may spend on one payload; override with STAGE_CPU_<STAGE>
+STAGE_CPU_BUDGETS = {
+    "extract": 2.0,
+}
+
+# Stages whose output the response can do without; the rest fail the request with a 504
+OPTIONAL_STAGES = {"brief", "viz", "judge"}
+
+# Absolute (time.monotonic) deadline of the analysis running in the current task
+request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class StageTimeout(Exception):
+    """
+    Raised by `run_stage` when an optional stage overruns its budget.
+    """
+    def __init__(self, stage: str):
+        super().__init__(f"{stage} stage timed out")
+        self.stage = stage
+
+
+class CpuBudget:
+    """
+    CPU time a synchronous parsing stage may use on one payload, measured on
+    the calling thread. The stage calls `check()` between units of work (e.g.
+    per release): a unit cannot be interrupted, so the stage is bounded by its
+    budget plus one unit, which the linear-time parsers keep proportional to
+    the unit's size.
+    """
+    def __init__(self, stage: str):
+        ensure_env_loaded()
+        self.stage = stage
+        self.limit = float(os.getenv(f"STAGE_CPU_{stage.upper()}", STAGE_CPU_BUDGETS[stage]))
+        self.start = time.thread_time()
+
+    def check(self) -> None:
+        used = time.thread_time() - self.start
+        if used > self.limit:
+            logger.warning(f"Stage '{self.stage}' used {used:.2f}s of CPU, over its {self.limit:.2f}s budget")
+            raise HTTPException(
+                status_code=422,
+                detail=f"Payload is too expensive to parse: the {self.stage} stage went over its CPU budget",
+            )
+
+
+def request_deadline_seconds() -> float:
+    """
+    Time budget of a whole analysis, REQUEST_DEADLINE_SECONDS (default 300).
+    """
+    ensure_env_loaded()
+    return float(os.getenv("REQUEST_DEADLINE_SECONDS", "300"))
+
+
+def start_request_deadline() -> None:
+    """
+    Starts the current analysis' deadline, `request_deadline_seconds()` from now.
+    Tasks and threads started afterwards inherit it.
+    """
+    request_deadline.set(time.monotonic() + request_deadline_seconds())
+
+
+def stage_timeout(stage: str) -> float:
+    """
+    Seconds `stage` may run: its budget, capped by what is left of the request deadline.
+    """
+    ensure_env_loaded()
+    budget = float(os.getenv(f"STAGE_TIMEOUT_{stage.upper()}", STAGE_BUDGETS[stage]))
+    deadline = request_deadline.get()
+    if deadline is not None:
+        budget = min(budget, deadline - time.monotonic())
+    return max(budget, 0.0)
+
+
+async def run_stage(stage: str, work):
+    """
+    Awaits `work` within the stage's timeout. On overrun, an optional stage
+    raises StageTimeout and any other stage a 504.
+    """
+    timeout = stage_timeout(stage)
+    try:
+        return await asyncio.wait_for(work, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Stage '{stage}' timed out after {timeout:.1f}s")
+        if stage in OPTIONAL_STAGES:
+            raise StageTimeout(stage)
+        raise HTTPException(status_code=504, detail=f"Analysis timed out in the {stage} stage")
+
+
+def llm_timeout() -> float:
+    """
+    Per-call HTTP timeout for the LLM clients, LLM_TIMEOUT_SECONDS (default 120).
+    """
+    ensure_env_loaded()
+    return float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
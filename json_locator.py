@@ -0,0 +1,168 @@
+# json_locator.py
+import json
+import re
+from typing import List, Optional
+
+# Characters that matter while inside an object but outside a string
+_STRUCTURAL = re.compile(r'[{}"]')
+# Characters that end or escape inside a JSON string
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+# Where a JSON object can start: '{', optional whitespace, then a key or '}'
+_OBJECT_START = re.compile(r'\{\s*["}]')
+
+# Candidates that fail to parse before giving up. Every failure costs a pass
+# over the text (json's error position, or a rescan), so this keeps adversarial
+# output linear; real LLM output has a handful of stray braces at most.
+MAX_FAILED_CANDIDATES = 64
+
+_DECODER = json.JSONDecoder()
+
+
+class JsonObjectLocator:
+    """
+    Incremental locator for the outermost JSON object in LLM output.
+
+    Text can be fed in one piece or token by token while the model is still
+    streaming. Every character is visited once; braces inside JSON strings are
+    ignored, and code fences, preambles and trailing prose are skipped.
+
+    Usage:
+        locator = JsonObjectLocator()
+        for chunk in stream:
+            obj = locator.feed(chunk)
+            if obj is not None:
+                break
+        obj = obj or locator.close()
+    """
+
+    def __init__(self):
+        self.result: Optional[dict] = None
+        self._failed = 0
+        self._reset_candidate()
+
+    def _reset_candidate(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._chunks: List[str] = []
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        """
+        Scans the next piece of text.
+        Returns the parsed object once the first complete top-level object closes, else None.
+        """
+        if self.result is not None or self._failed >= MAX_FAILED_CANDIDATES:
+            return self.result
+
+        pending = chunk
+        while pending and self._failed < MAX_FAILED_CANDIDATES:
+            pending = self._scan(pending)
+            if self.result is not None:
+                break
+        return self.result
+
+    def close(self) -> Optional[dict]:
+        """
+        Signals end of input. If an opening brace never balanced (e.g. a stray '{'
+        in prose before the real JSON), the rest of the text after it is now
+        complete, so it is searched like `locate_json_object` does.
+        """
+        if self.result is None and self._chunks and self._failed < MAX_FAILED_CANDIDATES:
+            leftover = "".join(self._chunks)
+            self._reset_candidate()
+            self.result = _decode_first_object(leftover, 1)
+        return self.result
+
+    def _scan(self, chunk: str) -> str:
+        """
+        Advances the scanner over `chunk`.
+        Returns text that must be rescanned after a failed candidate, else "".
+        """
+        pos = 0
+        n = len(chunk)
+        # Offset of the candidate's opening brace within `chunk` (0 if it began in an earlier chunk)
+        candidate_from = 0
+
+        while pos < n:
+            if self._depth == 0:
+                brace = chunk.find("{", pos)
+                if brace < 0:
+                    return ""
+                self._depth = 1
+                candidate_from = brace
+                pos = brace + 1
+                continue
+
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+
+            if self._in_string:
+                match = _STRING_SPECIAL.search(chunk, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                continue
+
+            match = _STRUCTURAL.search(chunk, pos)
+            if match is None:
+                break
+            pos = match.end()
+            token = match.group()
+            if token == '"':
+                self._in_string = True
+            elif token == "{":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._chunks.append(chunk[candidate_from:pos])
+                    candidate = "".join(self._chunks)
+                    self._reset_candidate()
+                    try:
+                        parsed = json.loads(candidate)
+                    except json.JSONDecodeError:
+                        # Balanced but not JSON (e.g. "{version}" in prose): retry just after it
+                        self._failed += 1
+                        return candidate[1:] + chunk[pos:]
+                    self.result = parsed
+                    return ""
+
+        if self._depth > 0:
+            self._chunks.append(chunk[candidate_from:])
+        return ""
+
+
+def locate_json_object(raw_output: str) -> Optional[dict]:
+    """
+    Returns the outermost JSON object in `raw_output`, or None if there is none.
+    A ```json fenced block is preferred when present.
+
+    For complete text this decodes in place from each candidate '{' with the C
+    decoder, which stops at the end of the object and ignores trailing prose.
+    Gives up (None) after MAX_FAILED_CANDIDATES candidates that do not parse.
+    """
+    fence = raw_output.find("```json")
+    if fence >= 0:
+        structured = _decode_first_object(raw_output, fence + len("```json"))
+        if structured is not None:
+            return structured
+    return _decode_first_object(raw_output, 0)
+
+
+def _decode_first_object(text: str, pos: int) -> Optional[dict]:
+    start = _OBJECT_START.search(text, pos)
+    for _ in range(MAX_FAILED_CANDIDATES):
+        if start is None:
+            break
+        try:
+            return _DECODER.raw_decode(text, start.start())[0]
+        except json.JSONDecodeError:
+            start = _OBJECT_START.search(text, start.start() + 1)
+    return None
@@ -0,0 +1,250 @@
+# llm_cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from app_config import ensure_env_loaded, env_flag
+from app_logging import logger
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt) -> str:
+    """
+    Canonical text of a prompt (a string or a list of chat messages) with
+    whitespace runs collapsed, so formatting-only differences share a cache entry.
+    """
+    if isinstance(prompt, str):
+        return _WHITESPACE.sub(" ", prompt).strip()
+    if isinstance(prompt, dict):
+        return json.dumps({k: normalize_prompt(v) for k, v in prompt.items()}, sort_keys=True, ensure_ascii=False)
+    if isinstance(prompt, (list, tuple)):
+        return json.dumps([normalize_prompt(item) for item in prompt], ensure_ascii=False)
+    return str(prompt)
+
+
+def cache_applies(temperature: float | None, opt_in: bool = False) -> bool:
+    """
+    Responses are only reused for deterministic calls (temperature 0) unless the caller opts in.
+    """
+    return opt_in or temperature == 0
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU of key -> response text, evicting least recently used
+    entries once their total size exceeds `max_bytes`.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        size = len(key) + len(value.encode("utf-8"))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(key) + len(previous.encode("utf-8"))
+            self._entries[key] = value
+            self.size += size
+            while self.size > self.max_bytes and self._entries:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.size -= len(old_key) + len(old_value.encode("utf-8"))
+
+
+class SqliteCacheBackend:
+    """
+    SQLite-backed cache, persistent across restarts, evicting least recently
+    used rows once the stored responses exceed `max_bytes`. The total size is
+    kept in a one-row table, updated in the same transaction as the rows, so
+    workers sharing the file agree on it without summing the table per insert.
+    """
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS prompt_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS prompt_cache_used ON prompt_cache (used)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS prompt_cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)"
+        )
+        # Caches created before the size row existed start from their current contents
+        self._db.execute(
+            "INSERT OR IGNORE INTO prompt_cache_size (id, total) SELECT 0, COALESCE(SUM(size), 0) FROM prompt_cache"
+        )
+
+    def _write(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM prompt_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE prompt_cache SET used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        size = len(key) + len(value.encode("utf-8"))
+
+        def put(db):
+            replaced = db.execute("SELECT size FROM prompt_cache WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, value, size, used) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            total = db.execute(
+                "UPDATE prompt_cache_size SET total = total + ? WHERE id = 0 RETURNING total",
+                (size - (replaced[0] if replaced else 0),),
+            ).fetchall()[0][0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for old_key, old_size in db.execute("SELECT key, size FROM prompt_cache ORDER BY used"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append((old_key,))
+                total -= old_size
+            db.executemany("DELETE FROM prompt_cache WHERE key = ?", evicted)
+            db.execute("UPDATE prompt_cache_size SET total = ? WHERE id = 0", (total,))
+
+        self._write(put)
+
+
+class PromptCache:
+    """
+    LLM responses keyed by model, temperature and normalized prompt hash.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, temperature: float | None, prompt) -> str:
+        digest = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+        return f"{model}|{temperature}|{digest}"
+
+    def get(self, key: str) -> str | None:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        self.backend.put(key, value)
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__, "hits": self.hits, "misses": self.misses}
+
+
+@lru_cache(maxsize=1)
+def get_prompt_cache() -> PromptCache | None:
+    """
+    Process-wide prompt cache configured by LLM_CACHE_BACKEND (memory | sqlite | none,
+    default memory), LLM_CACHE_MAX_MB (default 64) and, for sqlite, LLM_CACHE_PATH
+    (default llm_cache.sqlite3).
+    """
+    ensure_env_loaded()
+    backend_name = os.getenv("LLM_CACHE_BACKEND", "memory").strip().lower()
+    max_bytes = int(float(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024)
+    if backend_name == "none":
+        return None
+    if backend_name == "sqlite":
+        backend = SqliteCacheBackend(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"), max_bytes)
+    elif backend_name == "memory":
+        backend = MemoryCacheBackend(max_bytes)
+    else:
+        raise ValueError(f"Unknown LLM_CACHE_BACKEND '{backend_name}', expected memory, sqlite or none")
+    logger.info(f"LLM prompt cache: {backend_name}, {max_bytes // (1024 * 1024)} MB")
+    return PromptCache(backend)
+
+
+def crew_cache_opt_in() -> bool:
+    """
+    The crewAI agents run at temperature 0.1; LLM_CACHE_CREW=true opts them into the cache.
+    """
+    return env_flag("LLM_CACHE_CREW")
+
+
+def cached_call(model: str, temperature: float | None, prompt, call, opt_in: bool = False) -> str:
+    """
+    Returns the cached response for `prompt` or runs `call()` and caches its text
+    result, when the cache is enabled and applies to `temperature` / `opt_in`.
+    """
+    cache = get_prompt_cache()
+    if cache is None or not cache_applies(temperature, opt_in):
+        return call()
+    key = cache.key(model, temperature, prompt)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    result = call()
+    if isinstance(result, str):
+        cache.put(key, result)
+    return result
+
+
+@lru_cache(maxsize=1)
+def langchain_prompt_cache():
+    """
+    The prompt cache as a LangChain `BaseCache`, for `AzureChatOpenAI(cache=...)`.
+    LangChain's `llm_string` carries the model and temperature. Cached generations
+    drop their token usage, so cache hits are not counted as LLM spend.
+    """
+    from langchain_core.caches import BaseCache
+    from langchain_core.messages import messages_from_dict, message_to_dict
+    from langchain_core.outputs import ChatGeneration
+
+    class LangChainPromptCache(BaseCache):
+        def lookup(self, prompt: str, llm_string: str):
+            cache = get_prompt_cache()
+            if cache is None:
+                return None
+            value = cache.get(cache.key(llm_string, None, prompt))
+            if value is None:
+                return None
+            messages = messages_from_dict(json.loads(value))
+            for message in messages:
+                message.usage_metadata = None
+            return [ChatGeneration(message=message) for message in messages]
+
+        def update(self, prompt: str, llm_string: str, return_val) -> None:
+            cache = get_prompt_cache()
+            if cache is None or not all(isinstance(g, ChatGeneration) for g in return_val):
+                return
+            messages = [message_to_dict(g.message) for g in return_val]
+            cache.put(cache.key(llm_string, None, prompt), json.dumps(messages, ensure_ascii=False))
+
+        def clear(self, **kwargs) -> None:
+            pass
+
+    return LangChainPromptCache()
@@ -0,0 +1,70 @@
+# llm_usage.py
+import threading
+from contextvars import ContextVar
+
+
+class LlmUsage:
+    """
+    Thread-safe counter of LLM calls and tokens. Usage added to it is also
+    added to `parent`, if given (e.g. a run's usage to its tenant's total).
+    """
+    def __init__(self, parent: "LlmUsage | None" = None):
+        self.lock = threading.Lock()
+        self.parent = parent
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.abandoned = False
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, calls: int = 1, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        with self.lock:
+            self.calls += calls
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+        if self.parent is not None:
+            self.parent.add(calls, prompt_tokens, completion_tokens)
+
+    def add_usage(self, other: "LlmUsage") -> None:
+        self.add(other.calls, other.prompt_tokens, other.completion_tokens)
+
+    def abandon(self) -> None:
+        """
+        Marks this analysis as abandoned: its usage so far, and anything still
+        recorded later by calls that were already running, counts as wasted.
+        """
+        with self.lock:
+            self.abandoned = True
+        wasted_usage.add_usage(self)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+            }
+
+
+# Usage of the analysis running in the current task (and the worker threads it starts)
+current_usage: ContextVar[LlmUsage | None] = ContextVar("current_usage", default=None)
+
+# Process-wide totals: all LLM usage, and usage spent on analyses abandoned by their clients
+llm_usage = LlmUsage()
+wasted_usage = LlmUsage()
+
+
+def record_llm_usage(calls: int = 1, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    """
+    Adds LLM usage to the process totals and to the current analysis, if any.
+    """
+    llm_usage.add(calls, prompt_tokens, completion_tokens)
+    usage = current_usage.get()
+    if usage is not None:
+        usage.add(calls, prompt_tokens, completion_tokens)
+        if usage.abandoned:
+            wasted_usage.add(calls, prompt_tokens, completion_tokens)
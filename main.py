@@ -1,33 +1,111 @@
 from fastapi import FastAPI, Depends, Body
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer
 from fastapi.openapi.utils import get_openapi
-from fastapi import Depends, FastAPI, HTTPException, status, Security
-from pydantic import ValidationError
-from models import MarkdownAnalysisRequest, SingleFileSummaryResponse, MultiFileAnalysisResponse
-from visualization import visualize
-from wst__markdown_processor import Wst_MarkdownExtractor,Wst_MarkdownHarmonizer
-from wst_product_config import setup_crew_wst
-from shared_state import shared_state
+from fastapi import Depends, FastAPI, HTTPException, Query, status, Security
+from pydantic import BaseModel, ValidationError
+from models import MarkdownAnalysisRequest, SingleFileSummaryResponse, MultiFileAnalysisResponse, BatchAnalysisRequest, DashboardSourceRequest
+from pipeline import analyze_markdown_text, analyze_dashboard, BatchAnalyzer, is_single_release, preflight, stream_single_release_summary
+from app_config import env_flag
+from tenants import authenticate, current_tenant, get_tenant_registry, run_usage
+from singleflight import content_key, get_analysis_flights, summary_stream_flights
+from shared_backend import WORKER_ID, get_shared_backend
+from llm_usage import current_usage, llm_usage, wasted_usage
+from deadlines import request_deadline_seconds, start_request_deadline
+from llm_cache import get_prompt_cache
+from products import product_name
+from snapshots import get_snapshot_store
+from metrics_history import get_metrics_history
+from profiling import RequestProfile, current_profile, load_profile, store_profile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import os
 import time
 import asyncio 
+from typing import List
+import uuid
 from utils import (
-    split_joined_markdown_text,
-    extract_versions_wst,
-    generate_single_file_summary,
-    evaluate_with_llm_judge,
     sanitize_incoming_payload,
     verify_auth_token
 )
-from app_logging import logger
-import json
+from app_logging import logger, request_id
+import orjson
 
-app = FastAPI()
+
+def prewarm_clients():
+    """
+    Imports crewAI/LangChain/OpenAI and builds the shared LLM clients and one
+    crew bundle ahead of the first request. Runs in a worker thread from the lifespan hook.
+    """
+    start = time.perf_counter()
+    from wst_product_config import get_llm, checkout_wst_crews
+    from utils import get_azure_chat_llm
+    from visualization import get_client
+
+    get_llm()
+    with checkout_wst_crews():
+        pass  # builds one crew bundle and leaves it idle in the pool
+    get_azure_chat_llm(max_tokens=1024)
+    get_azure_chat_llm(max_tokens=512)
+    get_client()
+    logger.info(f"Pre-warmed LLM clients in {time.perf_counter() - start:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup/shutdown hook. Set PREWARM_CLIENTS=true to pay the heavy imports and
+    client construction at startup instead of on the first multi-release request.
+    Runs the snapshot refresher and, in multi-worker mode, consumes the shared batch job queue.
+    Crew kickoffs block a thread for the whole LLM call, so the default thread
+    pool is sized by LLM_THREADS (default 32) rather than the CPU count.
+    """
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(int(os.getenv("LLM_THREADS", "32"))))
+    if env_flag("PREWARM_CLIENTS"):
+        await asyncio.to_thread(prewarm_clients)
+    backend = get_shared_backend()
+    consumer = asyncio.create_task(consume_batch_jobs(backend)) if backend is not None else None
+    refresher = asyncio.create_task(refresh_snapshots())
+    yield
+    refresher.cancel()
+    if consumer is not None:
+        consumer.cancel()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 bearer_scheme = HTTPBearer()
 
 
+class RequestIdMiddleware:
+    """
+    Tags each HTTP request with an id, the client's X-Request-ID or a new one,
+    which is stamped on its log records and echoed in the response headers.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        rid = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = request_id.set(rid)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+app.add_middleware(RequestIdMiddleware)
+
 # Allow frontend calls (if re-enabled in future)
 app.add_middleware(
     CORSMiddleware,
@@ -49,88 +127,222 @@ app.add_middleware(
 #     request: MarkdownAnalysisRequest,
 #     _=Depends(verify_auth_token)
 #     ):
+
+
+async def cancel_on_disconnect(http_request: Request, work):
+    """
+    Runs `work` as a task, polling every DISCONNECT_POLL_SECONDS (default 1) whether
+    the client is still connected, and cancels it if the client went away.
+    Returns None after a disconnect.
+    """
+    poll_seconds = float(os.getenv("DISCONNECT_POLL_SECONDS", "1"))
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait([task], timeout=poll_seconds)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected; cancelling its analysis")
+                task.cancel()
+                return None
+    finally:
+        task.cancel()
+
+
+async def stream_until_disconnect(http_request: Request, stream):
+    """
+    Yields from the async iterator `stream`, polling like `cancel_on_disconnect`
+    while waiting for each item, and stops (closing `stream`) if the client went away.
+    """
+    poll_seconds = float(os.getenv("DISCONNECT_POLL_SECONDS", "1"))
+    step = None
+    try:
+        while True:
+            step = asyncio.ensure_future(anext(stream))
+            while not (await asyncio.wait([step], timeout=poll_seconds))[0]:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected; cancelling its stream")
+                    return
+            try:
+                item = step.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if step is not None and not step.done():
+            step.cancel()
+            await asyncio.wait([step])
+        await stream.aclose()
+
+
 @app.post("/analyze_markdown")
 async def analyze_markdown(
     request: MarkdownAnalysisRequest,
+    http_request: Request,
     token: str = Security(bearer_scheme)
 ):
     
-    # ✅ Step 0A: Check token
-    if token.credentials != "asdfghjkl123456788":
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
+    # ✅ Step 0A: Resolve the tenant and admit the request (401 / 429 before any work)
+    tenant = authenticate(token)
+    current_tenant.set(tenant)
+
+    if request.stream and is_single_release(request.markdown_text):
+        return await stream_summary(request, http_request, tenant)
+
+    profile = RequestProfile() if profile_requested(http_request, tenant) else None
+    profile_token = current_profile.set(profile)
     try:
-        # Step 0: Sanitize payload
-        sanitized_input = sanitize_incoming_payload(request.dict())
-        markdown_text = sanitized_input["markdown_text"]
-        product = sanitized_input["product"].upper()
+        async with tenant.admission():
+            response = json_response(await cancel_on_disconnect(http_request, run_analysis(request)))
+    except HTTPException as e:
+        # Failed requests (413, 422 over the CPU budget, 504...) are the ones most worth profiling
+        if profile is not None:
+            e.headers = {**(e.headers or {}), "X-Profile-Id": request_id.get()}
+        raise
+    finally:
+        current_profile.reset(profile_token)
+        if profile is not None:
+            await save_profile(profile)
+    if profile is not None and response is not None:
+        response.headers["X-Profile-Id"] = request_id.get()
+    return response
 
-        # Step 1: Extract versions from the markdown text
-        versions = extract_versions_wst(markdown_text)
 
-        # Step 2: Split stitched markdown into parts
-        split_parts = split_joined_markdown_text(markdown_text)
+async def save_profile(profile: RequestProfile) -> None:
+    try:
+        await asyncio.to_thread(store_profile, request_id.get(), profile)
+    except Exception as e:
+        logger.error(f"Could not store profile of request {request_id.get()}: {e}")
 
-        # Step 3: Handle single release summary
-        if "End of Release Extract" not in markdown_text:
-            summary = await generate_single_file_summary(markdown_text, product)
-            return MultiFileAnalysisResponse(
-            metrics=None,
-            report=None,
-            evaluation=None,
-            brief_summary=summary
-        )
 
-        # Step 4: Extract each chunk using Wst_MarkdownExtractor
-        version_to_extracted_md = {}
-        for version, chunk in zip(versions, split_parts):
-            try:
-                extractor = Wst_MarkdownExtractor(chunk)
-                extracted_md = extractor.extract()
-                version_to_extracted_md[version] = extracted_md
-            except Exception as e:
-                logger.error(f"Extractor failed for version {version}: {e}")
-                raise HTTPException(status_code=500, detail=f"Extractor failed for version {version}")
-
-        # Step 5: Harmonize extracted markdowns
-        harmonizer = Wst_MarkdownHarmonizer()
-        harmonized_text = harmonizer.harmonize(version_to_extracted_md)
-        logger.info("============= Final Harmonized Markdown =============")
-        logger.info(harmonized_text[:1000])  # Truncated log for preview
-
-        # Step 6: Route to crew setup
-        if product == "WST":
-            data_crew, report_crew, brief_crew, viz_crew = setup_crew_wst(harmonized_text, versions)
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported product type: {product}")
+def profile_requested(http_request: Request, tenant) -> bool:
+    """
+    True when an admin tenant asks for the request to be profiled with `X-Profile: true`
+    (see profiling.py); 403 for other tenants.
+    """
+    if http_request.headers.get("x-profile", "").strip().lower() not in ("1", "true", "yes"):
+        return False
+    if not tenant.admin:
+        raise HTTPException(status_code=403, detail="Profiling is restricted to admin tenants")
+    return True
 
-        # Step 7: Run Data Crew first
-        data_crew.kickoff()
 
-        # Step 8: Run Report and Brief Crews in parallel
-        report_crew.kickoff()
-        brief_crew.kickoff()
-        viz_crew.kickoff()
+def json_response(result):
+    """
+    Encodes an analysis result with orjson. The pipeline's responses hold plain
+    JSON values it has already validated, so their fields are encoded as they
+    are, skipping FastAPI's jsonable_encoder pass and Pydantic serialization.
+    """
+    if result is None or isinstance(result, Response):
+        return result
+    if isinstance(result, BaseModel):
+        result = dict(result)
+    return ORJSONResponse(result)
 
-        # Step 9: Evaluate generated report
-        evaluation_result = evaluate_with_llm_judge(
-            source_text=harmonized_text,
-            generated_report=json.dumps(shared_state.report_parts.get("structured_report", {}), indent=2)
-        )
 
-        # Step 10: Generate visualization data
-        # visualization_json = visualize(shared_state.metrics)
-        visualization_json = shared_state.visualization_json
-
-        # Step 11: Return structured response
-        return MultiFileAnalysisResponse(
-            metrics=shared_state.metrics,
-            report=shared_state.report_parts.get("structured_report", {}),
-            evaluation=evaluation_result,
-            brief_summary=shared_state.report_parts.get("brief_summary", ""),
-            visualization_json=json.loads(visualization_json)
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    NDJSON stream that holds a tenant's running slot (from `tenant.acquire`)
+    and releases it when the response ends, however it ends: the body was
+    fully sent, the client disconnected before or during it, or sending failed.
+    The request counts as failed unless the body iterator was exhausted.
+    """
+    def __init__(self, content, tenant, started: float):
+        self.content = content
+        self.tenant = tenant
+        self.started = started
+        self.completed = False
+        self.released = False
+        super().__init__(self.tracked(), media_type="application/x-ndjson")
+
+    async def tracked(self):
+        async for chunk in self.content:
+            yield chunk
+        self.completed = True
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.content.aclose()  # stops work nobody will read
+            self.release()
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.tenant.release(self.started, failed=not self.completed)
+
+
+def admitted_stream(tenant, started: float, make_content) -> AdmittedStreamingResponse:
+    """
+    Builds the stream for an admitted request; the slot is released if that fails.
+    """
+    try:
+        return AdmittedStreamingResponse(make_content(), tenant, started)
+    except BaseException:
+        tenant.release(started, failed=True)
+        raise
+
+
+async def stream_summary(request: MarkdownAnalysisRequest, http_request: Request, tenant):
+    """
+    Streams a single-release summary as NDJSON: one {"bullet": ...} line per bullet,
+    or a final {"timed_out": ["summary"]} line if the summary stage runs out of time.
+    The request is admitted before any work, as for /analyze_markdown, and the
+    tenant's running slot is held until the stream ends.
+    As for other analyses, identical streams in flight share one LLM call, the
+    summary runs within the request deadline and its LLM usage is recorded,
+    and it is cancelled once every client reading it has disconnected.
+    """
+    started = await tenant.acquire()
+    try:
+        sanitized_input = sanitize_incoming_payload(request.dict())
+        markdown_text = sanitized_input["markdown_text"]
+        product = sanitized_input["product"].upper()
+        await asyncio.to_thread(preflight, markdown_text)
+    except BaseException:
+        tenant.release(started, failed=True)
+        raise
+
+    async def summarize():
+        usage = run_usage()
+        current_usage.set(usage)  # local to the shared stream's task
+        start_request_deadline()
+        try:
+            async for bullet in stream_single_release_summary(markdown_text, product):
+                yield bullet
+        except asyncio.CancelledError:
+            usage.abandon()
+            logger.info(f"Abandoned summary stream had used {usage.calls} LLM calls / {usage.total_tokens} tokens")
+            raise
+
+    async def stream_bullets():
+        bullets = stream_until_disconnect(
+            http_request, summary_stream_flights.stream(content_key("stream", product, markdown_text), summarize)
         )
+        try:
+            async for bullet in bullets:
+                yield orjson.dumps({"bullet": bullet}) + b"\n"
+        except TimeoutError:
+            logger.warning("Streamed summary timed out")
+            yield orjson.dumps({"timed_out": ["summary"]}) + b"\n"
+        finally:
+            await bullets.aclose()
+
+    return admitted_stream(tenant, started, stream_bullets)
+
+
+async def run_analysis(request: MarkdownAnalysisRequest):
+    try:
+        # Step 0: Sanitize payload
+        sanitized_input = sanitize_incoming_payload(request.dict())
+        markdown_text = sanitized_input["markdown_text"]
+        product = sanitized_input["product"].upper()
+        return await analyze_sanitized(markdown_text, product, request.dashboard_key)
 
+    except HTTPException:
+        raise
     except ValidationError as ve:
         logger.error(f"Validation Error: {ve}")
         raise HTTPException(status_code=422, detail="Invalid request schema.")
@@ -138,3 +350,318 @@ async def analyze_markdown(
         logger.exception("Unexpected error during markdown analysis.")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+async def analyze_sanitized(markdown_text: str, product: str, dashboard_key: str | None):
+    """
+    Steps 1-11: summary for a single release, otherwise
+    extract -> harmonize -> structure -> report/brief/viz -> judge.
+    Identical requests already in flight share one run. Complete analyses of
+    a dashboard become its snapshot.
+    Pre-flight runs first: oversized payloads get a 413 before any LLM call.
+    """
+    plan = await asyncio.to_thread(preflight, markdown_text)
+
+    async def analyze():
+        usage = run_usage()
+        current_usage.set(usage)  # local to this run's task and the tasks/threads it starts
+        start_request_deadline()
+        try:
+            if dashboard_key:
+                return await analyze_dashboard(markdown_text, product, dashboard_key, plan=plan)
+            return await analyze_markdown_text(markdown_text, product, plan=plan)
+        except asyncio.CancelledError:
+            # Every client waiting for this run went away
+            usage.abandon()
+            logger.info(f"Abandoned analysis had used {usage.calls} LLM calls / {usage.total_tokens} tokens")
+            raise
+
+    key = content_key(product, dashboard_key, markdown_text)
+    if dashboard_key:
+        store = get_snapshot_store()
+        await asyncio.to_thread(store.set_source, product, dashboard_key, markdown_text, key)
+    if current_profile.get() is not None:
+        response = await analyze()  # profiled requests run their own stages, never a shared run
+    else:
+        response = await get_analysis_flights().do(key, analyze)
+    if dashboard_key:
+        await asyncio.to_thread(store.save, product, dashboard_key, key, response)
+    return response
+
+
+@app.post("/analyze_markdown/batch")
+async def analyze_markdown_batch(
+    request: BatchAnalysisRequest,
+    token: str = Security(bearer_scheme)
+):
+    """
+    Analyzes many dashboards in one call, sharing extraction and structurer work
+    across items and running LLM calls within BATCH_LLM_CONCURRENCY (default 4).
+    Streams one NDJSON line per item ({"index", "status_code", "result" | "detail"})
+    in completion order.
+    The batch takes one of the tenant's running slots and one rate-limit token
+    per item; batches of more items than the tenant's burst are a 413.
+    In multi-worker mode the items are queued instead and analyzed by all workers.
+    """
+    tenant = authenticate(token)
+    current_tenant.set(tenant)
+    started = await tenant.acquire(cost=len(request.items))
+
+    async def stream_results():
+        items = [item.dict() for item in request.items]
+        backend = get_shared_backend()
+        if backend is not None:
+            item_results = queued_batch_results(backend, items, tenant.name)
+        else:
+            current_usage.set(run_usage())
+            analyzer = BatchAnalyzer(concurrency=int(os.getenv("BATCH_LLM_CONCURRENCY", "4")))
+            item_results = analyzer.run(items)
+        try:
+            async for item_result in item_results:
+                yield orjson.dumps(item_result) + b"\n"
+        finally:
+            await item_results.aclose()
+
+    return admitted_stream(tenant, started, stream_results)
+
+
+BATCH_JOB_QUEUE = "batch"
+
+
+async def queued_batch_results(backend, items: list, tenant_name: str):
+    """
+    Puts each batch item on the shared job queue, tagged with the tenant whose
+    LLM usage it counts towards, and yields
+    {"index", "status_code", "result" | "detail"} as workers finish them.
+    Items still pending when the client goes away are dropped from the queue.
+    """
+    poll = float(os.getenv("WORKER_POLL_SECONDS", "0.25"))
+    pending = {}
+    for index, item in enumerate(items):
+        pending[await asyncio.to_thread(backend.enqueue, BATCH_JOB_QUEUE, orjson.dumps({**item, "tenant": tenant_name}))] = index
+    try:
+        while pending:
+            for job_id in list(pending):
+                result = await asyncio.to_thread(backend.take_result, job_id)
+                if result is not None:
+                    yield {"index": pending.pop(job_id), **orjson.loads(result)}
+            if pending:
+                await asyncio.sleep(poll)
+    finally:
+        if pending:
+            await asyncio.to_thread(discard_jobs, backend, list(pending))
+
+
+def discard_jobs(backend, job_ids: list) -> None:
+    for job_id in job_ids:
+        backend.discard(job_id)
+
+
+async def run_batch_job(backend, job_id: str, payload: bytes) -> None:
+    request_id.set(f"job-{job_id}")
+    item = orjson.loads(payload)
+    current_tenant.set(get_tenant_registry().tenants.get(item.pop("tenant", None)))
+    try:
+        response = await run_analysis(MarkdownAnalysisRequest(**item))
+        outcome = {"status_code": 200, "result": dict(response) if isinstance(response, BaseModel) else response}
+    except HTTPException as e:
+        outcome = {"status_code": e.status_code, "detail": e.detail}
+    except ValidationError as e:
+        outcome = {"status_code": 422, "detail": str(e)}
+    await asyncio.to_thread(backend.complete, job_id, orjson.dumps(outcome))
+
+
+async def consume_batch_jobs(backend) -> None:
+    """
+    Runs batch items from the shared queue, up to WORKER_JOB_CONCURRENCY
+    (default 2) at a time in this worker. A job is leased for one request
+    deadline; if this worker dies, another worker picks it up after that.
+    """
+    slots = asyncio.Semaphore(int(os.getenv("WORKER_JOB_CONCURRENCY", "2")))
+    poll = float(os.getenv("WORKER_POLL_SECONDS", "0.25"))
+    lease = request_deadline_seconds() + 60
+    running = set()
+    try:
+        while True:
+            await slots.acquire()
+            job = await asyncio.to_thread(backend.claim, BATCH_JOB_QUEUE, WORKER_ID, lease)
+            if job is None:
+                slots.release()
+                await asyncio.sleep(poll)
+                continue
+            task = asyncio.create_task(run_batch_job(backend, *job))
+            running.add(task)
+            task.add_done_callback(lambda t: (running.discard(t), slots.release()))
+    finally:
+        for task in running:
+            task.cancel()
+
+
+# Set to wake the snapshot refresher early, when a dashboard's source changes
+snapshot_sources_changed = asyncio.Event()
+
+
+async def refresh_snapshots() -> None:
+    """
+    Recomputes the snapshots whose source markdown changed, checking every
+    SNAPSHOT_REFRESH_SECONDS (default 30) or as soon as a source is updated.
+    Each source is claimed first, so only one worker refreshes it. A refresh
+    that fails or times out partly is retried after SNAPSHOT_RETRY_SECONDS
+    (default 300), doubling per failure on the same markdown up to
+    SNAPSHOT_RETRY_MAX_SECONDS (default 3600).
+    """
+    interval = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "30"))
+    retry_base = float(os.getenv("SNAPSHOT_RETRY_SECONDS", "300"))
+    retry_limit = float(os.getenv("SNAPSHOT_RETRY_MAX_SECONDS", "3600"))
+    lease = request_deadline_seconds() + 60
+    store = get_snapshot_store()
+    while True:
+        try:
+            await asyncio.wait_for(snapshot_sources_changed.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        snapshot_sources_changed.clear()
+        for source in await asyncio.to_thread(store.stale):
+            if not await asyncio.to_thread(store.claim, source, lease):
+                continue
+            request_id.set(f"refresh-{source.product}:{source.dashboard_key}")
+            try:
+                await analyze_sanitized(source.markdown_text, source.product, source.dashboard_key)
+                error = None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            snapshot = await asyncio.to_thread(store.get, source.product, source.dashboard_key)
+            if snapshot is not None and snapshot.input_hash == source.input_hash:
+                logger.info(f"Refreshed snapshot of dashboard '{source.dashboard_key}'")
+                continue
+            delay = await asyncio.to_thread(store.retry_later, source, retry_base, retry_limit)
+            logger.error(
+                f"Refreshing snapshot of dashboard '{source.dashboard_key}' "
+                f"{'failed: ' + error if error else 'was partial'}; retrying in {delay:.0f}s"
+            )
+
+
+@app.get("/dashboards/{product}/{dashboard_key}")
+async def get_dashboard_snapshot(
+    product: str,
+    dashboard_key: str,
+    http_request: Request,
+    token: str = Security(bearer_scheme)
+):
+    """
+    Serves the dashboard's last complete analysis without recomputing it.
+    Supports If-None-Match (304 when unchanged). X-Snapshot-Stale: true means
+    the source has changed and a refresh is pending.
+    """
+    authenticate(token)
+    product = product_name(product)
+    snapshot, source_hash = await asyncio.to_thread(get_snapshot_store().get_with_source_hash, product, dashboard_key)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No snapshot for dashboard '{dashboard_key}'")
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache",
+        "X-Snapshot-Stale": str(source_hash != snapshot.input_hash).lower(),
+    }
+    if_none_match = http_request.headers.get("if-none-match", "")
+    if snapshot.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
+
+
+@app.put("/dashboards/{product}/{dashboard_key}/source", status_code=202)
+async def put_dashboard_source(
+    product: str,
+    dashboard_key: str,
+    request: DashboardSourceRequest,
+    token: str = Security(bearer_scheme)
+):
+    """
+    Sets the dashboard's source markdown. If it changed, the background
+    refresher recomputes the snapshot; until then GET serves the previous one.
+    """
+    authenticate(token)
+    product = product_name(product)
+    markdown_text = sanitize_incoming_payload({"markdown_text": request.markdown_text, "product": product})["markdown_text"]
+    key = content_key(product, dashboard_key, markdown_text)
+    changed = await asyncio.to_thread(get_snapshot_store().set_source, product, dashboard_key, markdown_text, key)
+    if changed:
+        snapshot_sources_changed.set()
+    return {"changed": changed}
+
+
+def metrics_history():
+    history = get_metrics_history()
+    if history is None:
+        raise HTTPException(status_code=404, detail="Metrics history is disabled")
+    return history
+
+
+@app.get("/history/{product}/metrics")
+async def history_catalog(product: str, token: str = Security(bearer_scheme)):
+    """
+    Metrics recorded for the product, with their fields and version ranges.
+    """
+    authenticate(token)
+    product = product_name(product)
+    return await asyncio.to_thread(metrics_history().catalog, product)
+
+
+@app.get("/history/{product}/series")
+async def history_series(
+    product: str,
+    metric: str,
+    field: List[str] | None = Query(None),
+    from_version: str | None = None,
+    to_version: str | None = None,
+    token: str = Security(bearer_scheme)
+):
+    """
+    One metric across releases, from the recorded history (no LLM calls):
+    {"metric", "versions": [...], "fields": {field: [value per version]}}.
+    Filter fields with repeated `field=` and the range with from_version/to_version (inclusive).
+    """
+    authenticate(token)
+    product = product_name(product)
+    series = await asyncio.to_thread(metrics_history().series, product, metric, field, from_version, to_version)
+    if not series["versions"]:
+        raise HTTPException(status_code=404, detail=f"No history for metric '{metric}'")
+    return {"metric": metric, **series}
+
+
+@app.get("/tenants/metrics")
+async def tenant_metrics(token: str = Security(bearer_scheme)):
+    """
+    Usage and latency metrics for the calling tenant; admin tenants see every tenant.
+    """
+    tenant = authenticate(token)
+    tenants = get_tenant_registry().tenants.values() if tenant.admin else [tenant]
+    return {t.name: t.metrics.snapshot() for t in tenants}
+
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, token: str = Security(bearer_scheme)):
+    """
+    Per-stage profile of a request sent with `X-Profile: true` (admin tenants only),
+    by the request id returned in its X-Profile-Id header.
+    """
+    if not authenticate(token).admin:
+        raise HTTPException(status_code=403, detail="Profiles are restricted to admin tenants")
+    report = await asyncio.to_thread(load_profile, profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No profile for request '{profile_id}'")
+    return Response(content=report, media_type="application/json")
+
+
+@app.get("/metrics/llm_usage")
+async def llm_usage_metrics(token: str = Security(bearer_scheme)):
+    """
+    LLM calls and tokens used by this process, and how much of that went to
+    analyses cancelled because their clients disconnected, plus prompt cache hits.
+    """
+    authenticate(token)
+    cache = get_prompt_cache()
+    return {
+        "total": llm_usage.snapshot(),
+        "wasted": wasted_usage.snapshot(),
+        "prompt_cache": cache.stats() if cache else None,
+    }
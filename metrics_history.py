@@ -0,0 +1,179 @@
+# metrics_history.py
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+from app_config import ensure_env_loaded, env_flag
+from utils import version_sort_key
+
+# Field name for metrics the structurer reports as one value per release (e.g. "Target Customers")
+SCALAR_FIELD = "value"
+
+
+def version_order(version: str) -> str:
+    """
+    Text that sorts like `version_sort_key`, so version ranges can be queried in SQL.
+    """
+    return ".".join(f"{part:06d}" for part in version_sort_key(version))
+
+
+def flatten_metrics(metrics: dict, versions: List[str]) -> Iterator[Tuple[str, str, str, str, object]]:
+    """
+    Yields (section, metric, version, field, value) for structurer metrics
+    (section -> metric -> version -> fields). Entries not keyed by version are
+    attributed to the release when the metrics cover exactly one.
+    """
+    single = versions[0] if len(versions) == 1 else None
+    for section, entries in (metrics or {}).items():
+        if not isinstance(entries, dict):
+            continue
+        for metric, by_version in entries.items():
+            if not isinstance(by_version, dict) or not set(by_version) & set(versions):
+                if single is not None and by_version is not None:
+                    by_version = {single: by_version}
+                else:
+                    continue
+            for version, fields in by_version.items():
+                if version not in versions:
+                    continue
+                if not isinstance(fields, dict):
+                    fields = {SCALAR_FIELD: fields}
+                for field, value in fields.items():
+                    if value is not None:
+                        yield section, metric, version, field, value
+
+
+class MetricsHistory:
+    """
+    Per-release metrics of every analysis, one row per (product, metric,
+    field, version), indexed for range scans over versions.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS metric_values (
+                product TEXT NOT NULL,
+                section TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                field TEXT NOT NULL,
+                version TEXT NOT NULL,
+                version_order TEXT NOT NULL,
+                num REAL,
+                text TEXT,
+                recorded REAL NOT NULL,
+                PRIMARY KEY (product, metric, field, version)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS metric_values_series
+                ON metric_values (product, metric, version_order);
+        """)
+
+    def record(self, product: str, metrics: dict, versions: List[str]) -> int:
+        """
+        Stores the metrics of `versions`, replacing earlier values of the same releases.
+        Returns the number of values stored.
+        """
+        from release_diff import as_number  # imports numpy; keep it off the app's cold start
+
+        now = time.time()
+        rows = []
+        for section, metric, version, field, value in flatten_metrics(metrics, versions):
+            number = as_number(value)
+            rows.append((
+                product, section, metric, field, version, version_order(version),
+                None if math.isnan(number) else number,
+                value if isinstance(value, str) else None,
+                now,
+            ))
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO metric_values VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return len(rows)
+
+    def catalog(self, product: str) -> List[dict]:
+        """
+        Every recorded metric of `product` with its fields and version range.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT section, metric, group_concat(DISTINCT field), count(DISTINCT version), "
+                "min(version_order), max(version_order) FROM metric_values WHERE product = ? "
+                "GROUP BY section, metric ORDER BY section, metric", (product,)
+            ).fetchall()
+            versions_by_order = {
+                order: version for order, version in self._db.execute(
+                    "SELECT DISTINCT version_order, version FROM metric_values WHERE product = ?", (product,)
+                )
+            }
+        return [
+            {
+                "section": section,
+                "metric": metric,
+                "fields": sorted(fields.split(",")),
+                "releases": releases,
+                "first_version": versions_by_order[low],
+                "last_version": versions_by_order[high],
+            }
+            for section, metric, fields, releases, low, high in rows
+        ]
+
+    def series(
+        self,
+        product: str,
+        metric: str,
+        fields: List[str] | None = None,
+        from_version: str | None = None,
+        to_version: str | None = None,
+    ) -> dict:
+        """
+        Values of `metric` per release in version order, as columns:
+        {"versions": [...], "fields": {field: [value | None, ...]}}. Numeric
+        values ("25%" included) are returned as numbers, others as text.
+        """
+        query = "SELECT version, field, num, text FROM metric_values WHERE product = ? AND metric = ?"
+        params: list = [product, metric]
+        if from_version:
+            query += " AND version_order >= ?"
+            params.append(version_order(from_version))
+        if to_version:
+            query += " AND version_order <= ?"
+            params.append(version_order(to_version))
+        if fields:
+            query += f" AND field IN ({','.join('?' * len(fields))})"
+            params.extend(fields)
+        query += " ORDER BY version_order"
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        versions: List[str] = []
+        columns: Dict[str, Dict[str, object]] = {}
+        for version, field, number, text in rows:
+            if not versions or versions[-1] != version:
+                versions.append(version)
+            columns.setdefault(field, {})[version] = number if number is not None else text
+        return {
+            "versions": versions,
+            "fields": {field: [values.get(v) for v in versions] for field, values in sorted(columns.items())},
+        }
+
+
+@lru_cache(maxsize=1)
+def get_metrics_history() -> MetricsHistory | None:
+    """
+    Process-wide history at METRICS_HISTORY_PATH (default metrics_history.sqlite3),
+    or None when METRICS_HISTORY=false.
+    """
+    ensure_env_loaded()
+    if not env_flag("METRICS_HISTORY", default=True):
+        return None
+    return MetricsHistory(os.getenv("METRICS_HISTORY_PATH", "metrics_history.sqlite3"))
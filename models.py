@@ -1,5 +1,5 @@
-from typing import Dict
-from pydantic import BaseModel
+from typing import Dict, List
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Literal, Dict, Any 
 
 class MarkdownAnalysisRequest(BaseModel):
@@ -9,9 +9,15 @@ class MarkdownAnalysisRequest(BaseModel):
     Attributes:
         product (str): Product name ("TM" or "WST")
         markdown_text (str): Markdown string with one or more stitched files
+        dashboard_key (str | None): Stable dashboard identifier; when set, releases
+            unchanged since the dashboard's last analysis are not re-analyzed
+        stream (bool): For single-release payloads, stream the summary bullets
+            as NDJSON lines ({"bullet": ...}) while they are generated
     """
     markdown_text: str
     product: Literal["WST", "TM"]
+    dashboard_key: str | None = None
+    stream: bool = False
     #auth: str  # Add this field
 
 
@@ -31,9 +37,175 @@ class MultiFileAnalysisResponse(BaseModel):
         report (str): Markdown report
         evaluation (Dict): LLM-generated evaluation
         brief_summary (str): Bullet list summary
+        visualization_json (Dict | None): Chart.js configurations
+        timed_out (List[str]): Optional stages ("brief", "viz", "judge") that ran out of
+            time; their fields are left empty (evaluation / visualization_json are None,
+            brief_summary is "")
+        skipped (List[str]): Optional stages not run because pre-flight found their
+            prompt would not fit the model's context window (e.g. "judge")
     """
     metrics: Dict | None
     report: Dict[str, Any] | None
     evaluation: Dict | None
     brief_summary: str
-    visualization_json: Dict[str, Any]
+    visualization_json: Dict[str, Any] | None = None
+    timed_out: List[str] = []
+    skipped: List[str] = []
+
+
+class DashboardSourceRequest(BaseModel):
+    """
+    Body of PUT /dashboards/{product}/{dashboard_key}/source.
+
+    Attributes:
+        markdown_text (str): The dashboard's current stitched release markdown
+    """
+    markdown_text: str
+
+
+class BatchAnalysisRequest(BaseModel):
+    """
+    Input model for /analyze_markdown/batch endpoint.
+
+    Attributes:
+        items (List[MarkdownAnalysisRequest]): Dashboards to analyze in one batch
+    """
+    items: List[MarkdownAnalysisRequest]
+
+
+# ---------------------------------------------------------------------------
+# Structured-output schemas for the WST crew agents.
+# Field aliases match the canonical JSON keys the callbacks and frontend use,
+# so dumps should always use `model_dump(by_alias=True)`.
+# ---------------------------------------------------------------------------
+
+class _AliasedModel(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class ScopeCount(_AliasedModel):
+    Total: int | None = None
+    Open: int | None = None
+
+
+class SfdcDefectsFixed(_AliasedModel):
+    atls_fixed: int | None = Field(None, alias="ATLs Fixed")
+    btls_fixed: int | None = Field(None, alias="BTLs Fixed")
+
+
+class ReleaseScope(_AliasedModel):
+    target_customers: str | Dict[str, str | None] | None = Field(None, alias="Target Customers")
+    release_epics: Dict[str, ScopeCount] = Field(default_factory=dict, alias="Release Epics")
+    release_pirs: Dict[str, ScopeCount] = Field(default_factory=dict, alias="Release PIRs")
+    sfdc_defects_fixed: Dict[str, SfdcDefectsFixed] = Field(default_factory=dict, alias="SFDC Defects Fixed")
+
+
+class ValueStatus(_AliasedModel):
+    Value: float | None = None
+    Status: str | None = None
+
+
+class CountStatus(_AliasedModel):
+    Total: int | None = None
+    Open: int | None = None
+    Status: str | None = None
+
+
+class CriticalMetrics(_AliasedModel):
+    delivery_against_requirements: Dict[str, ValueStatus] = Field(default_factory=dict, alias="Delivery Against Requirements")
+    system_test_metrics: Dict[str, CountStatus] = Field(default_factory=dict, alias="System / Solution Test Metrics")
+    system_test_coverage: Dict[str, ValueStatus] = Field(default_factory=dict, alias="System / Solution Test Coverage")
+    system_test_pass_rate: Dict[str, ValueStatus] = Field(default_factory=dict, alias="System / Solution Test Pass Rate")
+    security_test_metrics: Dict[str, CountStatus] = Field(default_factory=dict, alias="Security Test Metrics")
+    performance_test_metrics: Dict[str, CountStatus] = Field(default_factory=dict, alias="Performance / Load Test Metrics")
+
+
+class HealthTrendEntry(_AliasedModel):
+    Criteria: str | None = None
+    Previous: str | None = None
+    Current: str | None = None
+    Status: str | None = None
+    Summary: str | None = None
+
+
+class HealthTrends(_AliasedModel):
+    unit_test_coverage: Dict[str, HealthTrendEntry] = Field(default_factory=dict, alias="Unit Test Coverage")
+    automation_test_coverage: Dict[str, HealthTrendEntry] = Field(default_factory=dict, alias="Automation Test Coverage")
+
+
+class WstMetrics(_AliasedModel):
+    """
+    Canonical structured metrics produced by the structurer agent.
+    Keyed by metric, then by release version.
+    """
+    release_scope: ReleaseScope
+    critical_metrics: CriticalMetrics
+    health_trends: HealthTrends
+
+
+class ScopeTrendRow(_AliasedModel):
+    version: str
+    total: int | None = None
+    open: int | None = None
+    value: int | None = None
+    trend: str = "↔"
+
+
+class CriticalTrendRow(_AliasedModel):
+    version: str
+    total: int | None = None
+    open: int | None = None
+    risk_status: str | None = None
+    comments: str | None = None
+    trend: str = "↔"
+
+
+class HealthTrendRow(_AliasedModel):
+    version: str
+    metric: str
+    criteria: str | None = None
+    previous: str | None = None
+    current: str | None = None
+    status: str | None = None
+    summary: str | None = None
+    trend: str = "↔"
+
+
+class MetricsSummary(_AliasedModel):
+    release_scope_metrics: Dict[str, List[ScopeTrendRow]]
+    critical_metrics: Dict[str, List[CriticalTrendRow]]
+    health_trends: List[HealthTrendRow]
+
+
+class WstReport(_AliasedModel):
+    """
+    Structured report produced by the reporter agent.
+    """
+    overview: str = Field(alias="Overview")
+    metrics_summary: MetricsSummary = Field(alias="Metrics Summary")
+    key_findings: str = Field(alias="Key findings")
+    recommendations: str = Field(alias="Recommendations")
+
+
+class ChartDataset(_AliasedModel):
+    label: str
+    data: List[Any]
+    fill: bool = False
+
+
+class ChartData(_AliasedModel):
+    labels: List[Any]
+    datasets: List[ChartDataset]
+
+
+class ChartSpec(_AliasedModel):
+    type: Literal["bar", "line"]
+    data: ChartData
+    options: Dict[str, Any] = Field(default_factory=dict)
+
+
+class ChartBundle(_AliasedModel):
+    """
+    Chart.js configurations produced by the visualization agent.
+    """
+    charts: List[ChartSpec]
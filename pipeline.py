@@ -0,0 +1,580 @@
+# pipeline.py
+import asyncio
+import os
+import sqlite3
+import orjson
+from contextlib import asynccontextmanager, nullcontext
+from typing import AsyncIterator, Dict, List
+
+from fastapi import HTTPException
+
+from app_config import ensure_env_loaded
+from app_logging import Truncated, logger
+from deadlines import CpuBudget, StageTimeout, run_stage, stage_timeout
+from llm_usage import record_llm_usage
+from metrics_history import get_metrics_history
+from dashboard_store import DashboardAnalysis, DashboardStore, get_dashboard_store, get_summary_cache
+from models import MultiFileAnalysisResponse
+from preflight import MAP_REDUCE, SUMMARY, PreflightPlan, plan_analysis
+from products import ProductPlugin, get_product, product_limiter
+from profiling import profile_stage, profiled
+from singleflight import content_key
+from utils import (
+    split_release_chunks,
+    generate_single_file_summary,
+    stream_single_file_summary,
+    evaluate_with_llm_judge,
+    merge_version_metrics,
+    sanitize_incoming_payload,
+)
+# Single-release summaries use the WST extractor for every product (TM shares the format)
+from wst_markdown_processor import Wst_MarkdownExtractor
+
+
+RELEASE_MARKER = "End of Release Extract"
+
+
+def is_single_release(markdown_text: str) -> bool:
+    """
+    True when the payload holds one release (no stitching markers), checked before any other parsing.
+    """
+    return RELEASE_MARKER not in markdown_text
+
+
+@asynccontextmanager
+async def _llm_slot(product: str, limiter: asyncio.Semaphore | None = None):
+    """
+    Holds one slot of `limiter` (e.g. a batch's budget) if given, then one of the product's budget.
+    """
+    async with limiter if limiter is not None else nullcontext():
+        async with product_limiter(product):
+            yield
+
+
+async def _llm_thread(product: str, limiter: asyncio.Semaphore | None, fn, *args, **kwargs) -> asyncio.Future:
+    """
+    Starts blocking `fn` in a worker thread holding one LLM slot (as `_llm_slot`
+    does) and returns its future. A worker thread cannot be interrupted, so the
+    slot is released when the thread finishes, not when the caller is cancelled
+    or times out: abandoned LLM calls keep counting against the budget.
+    """
+    held = []
+
+    def release(_=None):
+        for semaphore in held:
+            semaphore.release()
+
+    try:
+        for semaphore in (limiter, product_limiter(product)):
+            if semaphore is not None:
+                await semaphore.acquire()
+                held.append(semaphore)
+        call = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+    except BaseException:
+        release()
+        raise
+    call.add_done_callback(release)
+    return call
+
+
+def split_releases(markdown_text: str) -> Dict[str, str]:
+    """
+    Splits stitched markdown into {version: release chunk}, in numeric version order.
+    Each chunk is labelled with the version in its own header.
+    """
+    releases = {}
+    for version, (start, end) in split_release_chunks(markdown_text):
+        if version in releases:
+            logger.warning(f"Version {version} appears in more than one release chunk; using the last one")
+        releases[version] = markdown_text[start:end]
+    return releases
+
+
+@profiled("extract")
+def extract_release(plugin: ProductPlugin, version: str, chunk: str) -> str:
+    try:
+        return plugin.extractor(chunk).extract()
+    except Exception as e:
+        logger.error(f"Extractor failed for version {version}: {e}")
+        raise HTTPException(status_code=500, detail=f"Extractor failed for version {version}")
+
+
+def extract_releases(
+    plugin: ProductPlugin,
+    markdown_text: str,
+    extraction_cache: Dict[str, str] | None = None,
+) -> Dict[str, str]:
+    """
+    Splits stitched markdown into release chunks and runs the product's extractor on each.
+    Returns {version: extracted markdown}. Chunks already in `extraction_cache` are not re-extracted.
+    422 once extraction goes over its CPU budget (see `CpuBudget`).
+    """
+    version_to_extracted_md = {}
+    budget = CpuBudget("extract")
+    for version, chunk in split_releases(markdown_text).items():
+        if extraction_cache is not None and chunk in extraction_cache:
+            extracted_md = extraction_cache[chunk]
+        else:
+            extracted_md = extract_release(plugin, version, chunk)
+            if extraction_cache is not None:
+                extraction_cache[chunk] = extracted_md
+        version_to_extracted_md[version] = extracted_md
+        budget.check()
+    return version_to_extracted_md
+
+
+def _kickoff(crew, inputs: dict):
+    # Pooled crews accumulate token counts across kickoffs, so record the difference
+    before = crew.calculate_usage_metrics()
+    output = crew.kickoff(inputs=inputs)
+    after = output.token_usage
+    record_llm_usage(
+        calls=after.successful_requests - before.successful_requests,
+        prompt_tokens=after.prompt_tokens - before.prompt_tokens,
+        completion_tokens=after.completion_tokens - before.completion_tokens,
+    )
+    return output
+
+
+async def run_crew(crew, inputs: dict, product: str, state, limiter: asyncio.Semaphore | None = None):
+    """
+    Runs a blocking crew kickoff in a worker thread, holding one LLM slot until
+    it finishes (see `_llm_thread`). The kickoff is recorded in `state.running`:
+    if the caller is cancelled or times out the thread carries on, and the crew
+    bundle only goes back to the pool once it has finished.
+    """
+    kickoff = await _llm_thread(product, limiter, _kickoff, crew, inputs)
+    state.running.append(kickoff)
+    return await asyncio.shield(kickoff)
+
+
+async def structure_metrics(
+    plugin: ProductPlugin,
+    harmonized_text: str,
+    versions: List[str],
+    limiter: asyncio.Semaphore | None = None,
+) -> dict:
+    """
+    Runs the product's structurer crew and returns its metrics (504 if it runs out of time).
+    The metrics are also added to the product's metrics history.
+    """
+    with plugin.checkout_crews() as ((data_crew, _, _, _), state):
+        crew_inputs = plugin.crew_inputs(harmonized_text, versions)
+        await run_stage("structurer", run_crew(data_crew, crew_inputs, plugin.name, state, limiter))
+        metrics = state.metrics
+
+    history = get_metrics_history()
+    if history is not None:
+        try:
+            await asyncio.to_thread(history.record, plugin.name, metrics, versions)
+        except sqlite3.Error as e:
+            logger.error(f"Could not record metrics history for {versions}: {e}")
+    return metrics
+
+
+def map_gate() -> asyncio.Semaphore:
+    """
+    Bounds how many releases of one request (or batch) are structured at once
+    (MAP_CONCURRENCY, default 4). Each holds a crew bundle while it runs, so
+    this also caps how many bundles a large payload checks out; a batch's
+    report/brief/viz runs (`write_outputs`) take the same gate.
+    """
+    ensure_env_loaded()
+    return asyncio.Semaphore(int(os.getenv("MAP_CONCURRENCY", "4")))
+
+
+async def structure_release(
+    plugin: ProductPlugin,
+    version: str,
+    extracted_md: str,
+    limiter: asyncio.Semaphore | None = None,
+    section_cache: dict | None = None,
+    gate: asyncio.Semaphore | None = None,
+) -> dict:
+    """
+    Map step of map-reduce: harmonizes and structures one release on its own,
+    holding a slot of `gate` (see `map_gate`). The per-release metrics are
+    merged with `merge_version_metrics`.
+    """
+    async with gate if gate is not None else nullcontext():
+        with profile_stage("harmonize"):
+            harmonized_text = plugin.harmonizer(section_cache).harmonize({version: extracted_md})
+        return await structure_metrics(plugin, harmonized_text, [version], limiter)
+
+
+async def write_outputs(
+    plugin: ProductPlugin,
+    harmonized_text: str,
+    versions: List[str],
+    metrics: dict,
+    limiter: asyncio.Semaphore | None = None,
+    skipped: List[str] = (),
+    gate: asyncio.Semaphore | None = None,
+) -> MultiFileAnalysisResponse:
+    """
+    Runs the product's report, brief and viz crews on `metrics` in parallel, then the LLM judge.
+    Each runs within its stage budget (see deadlines.py). The report is required;
+    brief, viz and judge are left empty and listed in `timed_out` when they overrun.
+    Stages in `skipped` (pre-flight found they would not fit the model's context) are not run.
+    The crew bundle is checked out while holding a slot of `gate` (see `map_gate`), if given.
+    """
+    timed_out = []
+    async with gate if gate is not None else nullcontext():
+        with plugin.checkout_crews() as ((_, report_crew, brief_crew, viz_crew), state):
+            state.metrics = metrics
+            crew_inputs = plugin.crew_inputs(harmonized_text, versions, metrics)
+            results = await asyncio.gather(
+                run_stage("reporter", run_crew(report_crew, crew_inputs, plugin.name, state, limiter)),
+                run_stage("brief", run_crew(brief_crew, crew_inputs, plugin.name, state, limiter)),
+                run_stage("viz", run_crew(viz_crew, crew_inputs, plugin.name, state, limiter)),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, StageTimeout):
+                    timed_out.append(result.stage)
+                elif isinstance(result, BaseException):
+                    raise result
+            report = state.report_parts.get("structured_report", {})
+            brief_summary = "" if "brief" in timed_out else state.report_parts.get("brief_summary", "")
+            visualization_json = None if "viz" in timed_out else state.visualization_json
+
+    async def judge():
+        return await asyncio.shield(await _llm_thread(
+            plugin.name,
+            limiter,
+            evaluate_with_llm_judge,
+            source_text=harmonized_text,
+            generated_report=orjson.dumps(report).decode(),
+        ))
+
+    try:
+        evaluation_result = None if "judge" in skipped else await run_stage("judge", judge())
+    except StageTimeout:
+        evaluation_result = None
+        timed_out.append("judge")
+
+    # Built from already-validated crew outputs, so skip re-validating them
+    return MultiFileAnalysisResponse.model_construct(
+        metrics=metrics,
+        report=report,
+        evaluation=evaluation_result,
+        brief_summary=brief_summary,
+        visualization_json=visualization_json,
+        timed_out=timed_out,
+        skipped=list(skipped),
+    )
+
+
+@profiled("extract")
+def summary_source(markdown_text: str) -> str:
+    """
+    The part of a single release worth summarizing: its extracted sections, or
+    the whole text when the extractor recognizes none of them or the sections
+    are no shorter than the text (their boundaries were not found).
+    """
+    extracted_md = Wst_MarkdownExtractor(markdown_text).extract()
+    found = [
+        line for line in extracted_md.splitlines()
+        if line.strip() and not line.startswith("#") and line.strip() != "*Section Not Found*"
+    ]
+    return extracted_md if found and len(extracted_md) < len(markdown_text) else markdown_text
+
+
+async def summarize_single_release(markdown_text: str, product: str, limiter: asyncio.Semaphore | None = None) -> MultiFileAnalysisResponse:
+    """
+    Summarizes the extracted sections of a single release; summaries are cached by content hash.
+    """
+    source = summary_source(markdown_text)
+    cache_key = content_key(product, source)
+    summary = get_summary_cache().get(cache_key)
+    if summary is None:
+        async def summarize():
+            async with _llm_slot(product, limiter):
+                return await generate_single_file_summary(source, product)
+
+        summary = await run_stage("summary", summarize())
+        get_summary_cache().put(cache_key, summary)
+    return MultiFileAnalysisResponse.model_construct(
+        metrics=None,
+        report=None,
+        evaluation=None,
+        brief_summary=summary
+    )
+
+
+async def stream_single_release_summary(markdown_text: str, product: str) -> AsyncIterator[str]:
+    """
+    Yields the summary bullets of a single release as they are generated (all at
+    once when cached), within the summary stage budget. The full summary is cached
+    once complete; a timeout ends the stream early.
+    """
+    source = summary_source(markdown_text)
+    cache_key = content_key(product, source)
+    cached = get_summary_cache().get(cache_key)
+    if cached is not None:
+        for line in cached.splitlines():
+            if line.strip():
+                yield line.strip()
+        return
+
+    bullets = []
+    async with _llm_slot(product):
+        async with asyncio.timeout(stage_timeout("summary")):
+            async for bullet in stream_single_file_summary(source, product):
+                bullets.append(bullet)
+                yield bullet
+    get_summary_cache().put(cache_key, "\n".join(bullets))
+
+
+@profiled("harmonize")
+def harmonize_releases(
+    plugin: ProductPlugin,
+    version_to_extracted_md: Dict[str, str],
+    section_cache: dict | None = None,
+) -> str:
+    harmonized_text = plugin.harmonizer(section_cache).harmonize(version_to_extracted_md)
+    logger.info("============= Final Harmonized Markdown =============")
+    logger.info("%s", Truncated(harmonized_text, 1000))
+    return harmonized_text
+
+
+def parse_releases(
+    plugin: ProductPlugin,
+    markdown_text: str,
+    extraction_cache: Dict[str, str] | None = None,
+) -> tuple[Dict[str, str], str]:
+    """
+    Extraction then harmonization, the synchronous parsing half of an analysis.
+    Callers run it in a worker thread so large payloads never hold up the event
+    loop; the extraction CPU budget is measured per thread, so it still applies.
+    """
+    version_to_extracted_md = extract_releases(plugin, markdown_text, extraction_cache)
+    return version_to_extracted_md, harmonize_releases(plugin, version_to_extracted_md)
+
+
+@profiled("preflight")
+def preflight(markdown_text: str) -> PreflightPlan:
+    """
+    Pre-flight check of a sanitized payload (413 if it cannot fit the model's context).
+    """
+    return plan_analysis(markdown_text, is_single_release(markdown_text))
+
+
+async def analyze_markdown_text(
+    markdown_text: str,
+    product: str,
+    limiter: asyncio.Semaphore | None = None,
+    plan: PreflightPlan | None = None,
+) -> MultiFileAnalysisResponse:
+    """
+    Full analysis of one sanitized payload: a summary for a single release,
+    otherwise extract -> harmonize -> structure -> report/brief/viz -> judge.
+    The structurer sees all releases in one prompt, or each release on its own
+    when pre-flight chose map-reduce.
+    """
+    plan = plan or await asyncio.to_thread(preflight, markdown_text)
+    if plan.strategy == SUMMARY:
+        return await summarize_single_release(markdown_text, product, limiter)
+
+    plugin = get_product(product)
+    version_to_extracted_md, harmonized_text = await asyncio.to_thread(parse_releases, plugin, markdown_text)
+    versions = list(version_to_extracted_md)
+
+    if plan.strategy == MAP_REDUCE:
+        gate = map_gate()
+        per_version = await asyncio.gather(*(
+            structure_release(plugin, v, md, limiter, gate=gate) for v, md in version_to_extracted_md.items()
+        ))
+        metrics = merge_version_metrics(dict(zip(versions, per_version)))
+    else:
+        metrics = await structure_metrics(plugin, harmonized_text, versions, limiter)
+    return await write_outputs(plugin, harmonized_text, versions, metrics, limiter, plan.skipped)
+
+
+async def analyze_dashboard(
+    markdown_text: str,
+    product: str,
+    dashboard_key: str,
+    store: DashboardStore | None = None,
+    limiter: asyncio.Semaphore | None = None,
+    plan: PreflightPlan | None = None,
+) -> MultiFileAnalysisResponse:
+    """
+    Incremental analysis for a dashboard that was analyzed before.
+    Diffs the release chunks against the dashboard's last analysis and:
+    - reuses extractions and harmonizer sections of unchanged releases
+    - runs the structurer only for releases whose extracted markdown changed
+    - reuses the previous report, brief, viz and evaluation if the merged
+      metrics are identical to last time
+    Releases are structured individually so their metrics can be reused later.
+    Dashboards are stored per product, so keys only need to be unique within a product.
+    """
+    plan = plan or await asyncio.to_thread(preflight, markdown_text)
+    if plan.strategy == SUMMARY:
+        return await analyze_markdown_text(markdown_text, product, limiter, plan)
+
+    plugin = get_product(product)
+    store = store or get_dashboard_store()
+    store_key = f"{product}:{dashboard_key}"
+    previous = store.get(store_key) or DashboardAnalysis()
+    current = DashboardAnalysis()
+
+    section_cache = previous.section_cache
+
+    def parse():
+        # Extraction: only chunks not seen in the last analysis
+        version_to_extracted_md = {}
+        budget = CpuBudget("extract")
+        for version, chunk in split_releases(markdown_text).items():
+            extracted_md = previous.chunk_extractions.get(chunk)
+            if extracted_md is None:
+                extracted_md = extract_release(plugin, version, chunk)
+            current.chunk_extractions[chunk] = extracted_md
+            version_to_extracted_md[version] = extracted_md
+            budget.check()
+        # Harmonization: sections of unchanged releases come from the cache
+        return version_to_extracted_md, harmonize_releases(plugin, version_to_extracted_md, section_cache)
+
+    # Parsed in a worker thread, off the event loop (see `parse_releases`)
+    version_to_extracted_md, harmonized_text = await asyncio.to_thread(parse)
+    versions = list(version_to_extracted_md)
+
+    # Structuring: only releases whose extracted markdown changed
+    changed = [
+        v for v, md in version_to_extracted_md.items()
+        if previous.release_metrics.get(v, (None, None))[0] != md
+    ]
+    for version, extracted_md in version_to_extracted_md.items():
+        if version not in changed:
+            current.release_metrics[version] = previous.release_metrics[version]
+        current.section_cache[extracted_md] = section_cache[extracted_md]
+
+    try:
+        gate = map_gate()
+        structuring = {
+            v: asyncio.ensure_future(
+                structure_release(plugin, v, version_to_extracted_md[v], limiter, section_cache, gate)
+            )
+            for v in changed
+        }
+        try:
+            await asyncio.gather(*structuring.values())
+        finally:
+            # Keep every release that finished, even if another one failed or was cancelled
+            for version, task in structuring.items():
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    current.release_metrics[version] = (version_to_extracted_md[version], task.result())
+                else:
+                    task.cancel()
+
+        current.metrics = merge_version_metrics({v: m for v, (_, m) in current.release_metrics.items()})
+
+        # Report, brief, viz and judge only when the metrics actually changed
+        outputs_reused = (
+            previous.response is not None
+            and not previous.response.timed_out
+            and current.metrics == previous.metrics
+        )
+        if outputs_reused:
+            current.response = previous.response
+        else:
+            current.response = await write_outputs(
+                plugin, harmonized_text, versions, current.metrics, limiter, plan.skipped
+            )
+    except asyncio.CancelledError:
+        # Client went away: keep what was computed so the next request resumes from there
+        store.put(store_key, current)
+        raise
+
+    store.put(store_key, current)
+    logger.info(
+        f"Dashboard '{dashboard_key}': restructured {len(changed)}/{len(versions)} releases, "
+        f"outputs {'reused' if outputs_reused else 'regenerated'}"
+    )
+    return current.response
+
+
+def _batch_result(index: int, future: asyncio.Future) -> dict:
+    error = future.exception()
+    if error is None:
+        return {"index": index, "status_code": 200, "result": dict(future.result())}
+    if isinstance(error, HTTPException):
+        return {"index": index, "status_code": error.status_code, "detail": error.detail}
+    logger.error(f"Batch item {index} failed: {error}")
+    return {"index": index, "status_code": 500, "detail": str(error)}
+
+
+class BatchAnalyzer:
+    """
+    Runs many analysis requests as one batch:
+    - identical items (same product and sanitized markdown) are analyzed once
+    - identical release chunks are extracted once
+    - each distinct release is structured once and its metrics are merged into
+      every item that contains it
+    - all LLM calls share one concurrency budget (on top of each product's own)
+    Caches are kept per product.
+    Results are yielded per item as soon as they complete.
+    """
+
+    def __init__(self, concurrency: int):
+        self.limiter = asyncio.Semaphore(concurrency)
+        self.gate = map_gate()
+        self.extraction_caches: Dict[str, Dict[str, str]] = {}
+        self._structured: Dict[tuple, asyncio.Future] = {}
+        self._items: Dict[tuple, asyncio.Future] = {}
+
+    def _structure_release(self, plugin: ProductPlugin, version: str, extracted_md: str) -> asyncio.Future:
+        key = (plugin.name, version, extracted_md)
+        if key not in self._structured:
+            self._structured[key] = asyncio.ensure_future(
+                structure_release(plugin, version, extracted_md, self.limiter, gate=self.gate)
+            )
+        return self._structured[key]
+
+    async def _analyze_item(self, markdown_text: str, product: str) -> MultiFileAnalysisResponse:
+        plan = await asyncio.to_thread(preflight, markdown_text)
+        if plan.strategy == SUMMARY:
+            return await analyze_markdown_text(markdown_text, product, self.limiter, plan)
+
+        plugin = get_product(product)
+        extraction_cache = self.extraction_caches.setdefault(product, {})
+        version_to_extracted_md, harmonized_text = await asyncio.to_thread(
+            parse_releases, plugin, markdown_text, extraction_cache
+        )
+        versions = list(version_to_extracted_md)
+
+        per_version = await asyncio.gather(
+            *(self._structure_release(plugin, v, md) for v, md in version_to_extracted_md.items())
+        )
+        metrics = merge_version_metrics(dict(zip(versions, per_version)))
+        return await write_outputs(
+            plugin, harmonized_text, versions, metrics, self.limiter, plan.skipped, gate=self.gate
+        )
+
+    async def run(self, items: List[dict]) -> AsyncIterator[dict]:
+        waiting: Dict[asyncio.Future, List[int]] = {}
+        try:
+            for index, item in enumerate(items):
+                try:
+                    sanitized = sanitize_incoming_payload(item)
+                except HTTPException as e:
+                    yield {"index": index, "status_code": e.status_code, "detail": e.detail}
+                    continue
+
+                key = (sanitized["product"], sanitized["markdown_text"])
+                if key not in self._items:
+                    self._items[key] = asyncio.ensure_future(
+                        self._analyze_item(sanitized["markdown_text"], sanitized["product"])
+                    )
+                    waiting[self._items[key]] = []
+                waiting[self._items[key]].append(index)
+
+            while waiting:
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    for index in waiting.pop(future):
+                        yield _batch_result(index, future)
+        finally:
+            # Client went away or the batch failed: stop work nobody will read
+            for future in list(self._items.values()) + list(self._structured.values()):
+                future.cancel()
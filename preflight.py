@@ -0,0 +1,191 @@
+# preflight.py
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+from app_config import ensure_env_loaded
+from app_logging import logger
+from utils import split_release_chunks
+
+# Context windows of the Azure deployments' base models, in tokens; override with MODEL_CONTEXT_TOKENS
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128_000,
+    "gpt-4o-mini": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-4.1-mini": 1_047_576,
+    "gpt-4-turbo": 128_000,
+    "gpt-4-32k": 32_768,
+    "gpt-4": 8_192,
+    "gpt-35-turbo": 16_385,
+}
+DEFAULT_CONTEXT_WINDOW = 128_000
+
+# Tokens each stage adds around its input: prompt template, crewAI agent/task scaffolding
+# and the response it may generate
+STAGE_OVERHEAD_TOKENS = {
+    "summary": 200 + 1024,
+    "structurer": 2_500 + 1_500,
+    "reporter": 2_500 + 2_000,
+    "brief": 1_000 + 500,
+    "viz": 1_500 + 2_000,
+    "judge": 500 + 512,
+}
+
+# Structured metrics per release, as the reporter / brief / viz prompts receive them
+METRICS_TOKENS_PER_RELEASE = 600
+# Structurer output per release, on top of its fixed overhead
+STRUCTURER_OUTPUT_TOKENS_PER_RELEASE = 700
+
+# Stages the response can do without; skipped when they alone would not fit
+SKIPPABLE_STAGES = ("judge",)
+
+SINGLE_PASS, MAP_REDUCE, SUMMARY = "single_pass", "map_reduce", "summary"
+MAP_REDUCE_MODES = ("auto", "always", "never")
+
+_SECTION_HEADER = re.compile(r"#{2,4} ")
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    """
+    The deployment's tokenizer, or None when tiktoken cannot load it (its BPE
+    files are fetched on first use unless TIKTOKEN_CACHE_DIR has them).
+    """
+    try:
+        import tiktoken
+
+        model = os.getenv("DEPLOYMENT_NAME", "gpt-4o")
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable ({e}); estimating 1 token per 3 characters")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoder = _encoder()
+    if encoder is None:
+        return math.ceil(len(text) / 3)  # errs high for markdown tables
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def context_window() -> int:
+    ensure_env_loaded()
+    configured = os.getenv("MODEL_CONTEXT_TOKENS")
+    if configured:
+        return int(configured)
+    return CONTEXT_WINDOWS.get(os.getenv("DEPLOYMENT_NAME", "").lower(), DEFAULT_CONTEXT_WINDOW)
+
+
+def map_reduce_mode() -> str:
+    """
+    MAP_REDUCE_MODE: "auto" (default) structures releases one by one when there
+    are at least MAP_REDUCE_MIN_RELEASES (default 4) of them or they do not fit
+    one prompt; "always" does so for every multi-release payload; "never" keeps
+    one structurer prompt (413 when it does not fit).
+    """
+    ensure_env_loaded()
+    mode = os.getenv("MAP_REDUCE_MODE", "auto").strip().lower()
+    if mode not in MAP_REDUCE_MODES:
+        raise ValueError(f"Unknown MAP_REDUCE_MODE '{mode}', expected auto, always or never")
+    return mode
+
+
+@dataclass
+class PreflightPlan:
+    """
+    What pre-flight found in a payload and how it will be analyzed.
+    `stage_tokens` are estimated prompt + response tokens per LLM call of each
+    stage under the chosen strategy; `budget` is the usable part of the window.
+    """
+    strategy: str
+    releases: int
+    sections: int
+    input_tokens: int
+    largest_release_tokens: int
+    budget: int
+    stage_tokens: Dict[str, int] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+
+
+def plan_analysis(markdown_text: str, single_release: bool) -> PreflightPlan:
+    """
+    Profiles a sanitized payload and picks a strategy before any LLM call:
+    - "summary" for a single release
+    - "map_reduce": each release is structured on its own, in parallel, and
+      the metrics are merged (see `map_reduce_mode` for when)
+    - "single_pass": all releases in one structurer prompt
+    Raises 413 when even one release, or the merged metrics, would overflow
+    the context window. Optional stages that alone would overflow (the judge,
+    which reads the whole payload) are listed in `skipped`.
+
+    The payload's tokens stand in for the harmonized text the prompts get:
+    extraction keeps the release sections and drops the rest.
+    PREFLIGHT_WINDOW_FRACTION (default 0.85) of the window is usable, leaving
+    room for estimation error.
+    """
+    ensure_env_loaded()
+    budget = int(context_window() * float(os.getenv("PREFLIGHT_WINDOW_FRACTION", "0.85")))
+    input_tokens = count_tokens(markdown_text)
+    sections = len(_SECTION_HEADER.findall(markdown_text))
+
+    if single_release:
+        plan = PreflightPlan(SUMMARY, 1, sections, input_tokens, input_tokens, budget,
+                             {"summary": input_tokens + STAGE_OVERHEAD_TOKENS["summary"]})
+        return _checked(plan)
+
+    chunks = split_release_chunks(markdown_text)
+    releases = max(len(chunks), 1)
+    largest = max((count_tokens(markdown_text[start:end]) for _, (start, end) in chunks), default=input_tokens)
+    metrics_tokens = releases * METRICS_TOKENS_PER_RELEASE
+    outputs = {
+        "reporter": 2 * metrics_tokens + STAGE_OVERHEAD_TOKENS["reporter"],  # facts + trends
+        "brief": metrics_tokens + STAGE_OVERHEAD_TOKENS["brief"],
+        "viz": metrics_tokens + STAGE_OVERHEAD_TOKENS["viz"],
+        "judge": input_tokens + metrics_tokens + STAGE_OVERHEAD_TOKENS["judge"],
+    }
+
+    mode = map_reduce_mode()
+    single_pass = input_tokens + releases * STRUCTURER_OUTPUT_TOKENS_PER_RELEASE + STAGE_OVERHEAD_TOKENS["structurer"]
+    if mode == "always" or (
+        mode == "auto"
+        and (single_pass > budget or releases >= int(os.getenv("MAP_REDUCE_MIN_RELEASES", "4")))
+    ):
+        strategy = MAP_REDUCE
+        structurer = largest + STRUCTURER_OUTPUT_TOKENS_PER_RELEASE + STAGE_OVERHEAD_TOKENS["structurer"]
+    else:
+        strategy, structurer = SINGLE_PASS, single_pass
+
+    plan = PreflightPlan(strategy, releases, sections, input_tokens, largest, budget, {"structurer": structurer, **outputs})
+    plan.skipped = [stage for stage in SKIPPABLE_STAGES if plan.stage_tokens[stage] > budget]
+    return _checked(plan)
+
+
+def _checked(plan: PreflightPlan) -> PreflightPlan:
+    over = {
+        stage: tokens for stage, tokens in plan.stage_tokens.items()
+        if tokens > plan.budget and stage not in plan.skipped
+    }
+    logger.info(
+        f"Pre-flight: {plan.releases} release(s), {plan.sections} sections, ~{plan.input_tokens} tokens "
+        f"-> {plan.strategy}{' (over budget: ' + ', '.join(over) + ')' if over else ''}"
+        f"{' skipping ' + ', '.join(plan.skipped) if plan.skipped else ''}"
+    )
+    if over:
+        worst = max(over, key=over.get)
+        raise HTTPException(
+            status_code=413,
+            detail=(
+                f"Payload too large: the {worst} stage needs ~{over[worst]} tokens, over the "
+                f"{plan.budget}-token budget of the model's context window "
+                f"({plan.releases} release(s), largest ~{plan.largest_release_tokens} tokens)"
+            ),
+        )
+    return plan
@@ -0,0 +1,85 @@
+# products.py
+import asyncio
+import importlib
+import os
+from functools import lru_cache
+from typing import Callable, Dict
+
+from fastapi import HTTPException
+
+from app_config import ensure_env_loaded
+
+
+class ProductPlugin:
+    """
+    Everything the multi-release pipeline needs for one product:
+
+    - extractor: class whose `extract()` reduces one release chunk to its sections
+    - harmonizer: class (taking an optional section cache) whose `harmonize()`
+      merges {version: extracted markdown} into one document
+    - checkout_crews: context manager lending ((data, report, brief, viz) crews, state)
+    - crew_inputs: builds the crew kickoff inputs (harmonized_text, versions, metrics)
+    """
+    def __init__(
+        self,
+        name: str,
+        extractor: type,
+        harmonizer: type,
+        checkout_crews: Callable,
+        crew_inputs: Callable,
+    ):
+        self.name = name
+        self.extractor = extractor
+        self.harmonizer = harmonizer
+        self.checkout_crews = checkout_crews
+        self.crew_inputs = crew_inputs
+
+
+# product -> ("module:attribute" of its ProductPlugin, default LLM concurrency)
+_registry: Dict[str, tuple] = {}
+
+
+def register_product(name: str, plugin_path: str, concurrency: int = 4) -> None:
+    """
+    Registers a product by the import path of its ProductPlugin. The module is
+    only imported when the product is first analyzed.
+    """
+    _registry[name.upper()] = (plugin_path, concurrency)
+    get_product.cache_clear()
+
+
+def product_name(name: str) -> str:
+    """
+    The registered name of product `name` (case-insensitive), without importing
+    its plugin (and so crewAI). Unknown products are a 400, as in `get_product`.
+    """
+    name = name.upper()
+    if name not in _registry:
+        raise HTTPException(status_code=400, detail=f"Unsupported product type: {name}")
+    return name
+
+
+@lru_cache(maxsize=None)
+def get_product(name: str) -> ProductPlugin:
+    """
+    Imports and returns the product's plugin. Unknown products are a 400.
+    """
+    if name not in _registry:
+        raise HTTPException(status_code=400, detail=f"Unsupported product type: {name}")
+    module_name, attribute = _registry[name][0].split(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+@lru_cache(maxsize=None)
+def product_limiter(name: str) -> asyncio.Semaphore:
+    """
+    The product's LLM concurrency budget, shared by all its requests in this
+    process. Overridable with <PRODUCT>_LLM_CONCURRENCY (e.g. TM_LLM_CONCURRENCY).
+    """
+    ensure_env_loaded()
+    default = _registry[name][1] if name in _registry else 4
+    return asyncio.Semaphore(int(os.getenv(f"{name}_LLM_CONCURRENCY", str(default))))
+
+
+register_product("WST", "wst_product_config:WST_PRODUCT")
+register_product("TM", "tm_product_config:TM_PRODUCT")
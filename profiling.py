@@ -0,0 +1,178 @@
+# profiling.py
+"""
+On-demand profiling of the non-LLM stages of one request (sanitize, split,
+extract, harmonize, preflight, JSON parsing), for inputs that are slow in
+production but cannot be reproduced offline.
+
+An admin sends /analyze_markdown with `X-Profile: true`; each stage then runs
+under cProfile and the per-stage report is stored under the request id (see
+`store_profile`), readable at GET /profiles/{request_id}. Stages are marked
+with `@profiled(stage)` / `with profile_stage(stage):`; when the request is
+not profiled they cost one context variable lookup.
+"""
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+import orjson
+
+from app_config import ensure_env_loaded
+from app_logging import logger
+from shared_backend import get_shared_backend
+
+# Set for the duration of a profiled request; inherited by its tasks and worker threads
+current_profile: ContextVar["RequestProfile | None"] = ContextVar("current_profile", default=None)
+
+# The stage being profiled on this thread; stages called inside it count towards it
+_active = threading.local()
+
+
+class RequestProfile:
+    """
+    cProfile stats and wall time per stage, accumulated over every time the
+    stage runs during one request, from any thread.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats: dict[str, pstats.Stats] = {}
+        self.seconds: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+
+    def start(self, stage: str):
+        profiler = cProfile.Profile()
+        _active.stage = stage
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None  # another profiler owns this thread; record wall time only
+        return stage, profiler, time.perf_counter()
+
+    def stop(self, started) -> None:
+        stage, profiler, start = started
+        if profiler is not None:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+        _active.stage = None
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            if profiler is not None:
+                if stage in self.stats:
+                    self.stats[stage].add(profiler)
+                else:
+                    self.stats[stage] = pstats.Stats(profiler)
+
+    def report(self, top: int = 25) -> dict:
+        """
+        {stage: {"calls", "seconds", "functions": [the `top` functions by cumulative time]}}
+        """
+        report = {}
+        with self._lock:
+            for stage in sorted(self.seconds, key=self.seconds.get, reverse=True):
+                functions = []
+                stats = self.stats.get(stage)
+                if stats is not None:
+                    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+                    for (filename, line, name), (_, ncalls, tottime, cumtime, _) in rows:
+                        functions.append({
+                            "function": f"{os.path.basename(filename)}:{line}({name})",
+                            "ncalls": ncalls,
+                            "tottime": round(tottime, 6),
+                            "cumtime": round(cumtime, 6),
+                        })
+                report[stage] = {
+                    "calls": self.calls[stage],
+                    "seconds": round(self.seconds[stage], 6),
+                    "functions": functions,
+                }
+        return report
+
+    def dump(self, directory: str, name: str) -> None:
+        """
+        Writes each stage's stats as <name>-<stage>.prof (pstats / snakeviz format).
+        """
+        with self._lock:
+            for stage, stats in self.stats.items():
+                stats.dump_stats(os.path.join(directory, f"{name}-{stage}.prof"))
+
+
+def profiled(stage: str):
+    """
+    Decorator: runs the function as `stage` of the current profiled request, if any.
+    The function must not await (cProfile follows one thread).
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None or getattr(_active, "stage", None):
+                return fn(*args, **kwargs)
+            started = profile.start(stage)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.stop(started)
+        return wrapper
+    return decorate
+
+
+class profile_stage:
+    """
+    Context manager form of `profiled` for a synchronous block.
+    """
+    __slots__ = ("stage", "_profile", "_started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self._profile = current_profile.get()
+        if self._profile is not None and getattr(_active, "stage", None):
+            self._profile = None
+        if self._profile is not None:
+            self._started = self._profile.start(self.stage)
+
+    def __exit__(self, *exc):
+        if self._profile is not None:
+            self._profile.stop(self._started)
+        return False
+
+
+_local_profiles: "OrderedDict[str, bytes]" = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def store_profile(request_id: str, profile: RequestProfile) -> None:
+    """
+    Keeps the report of a profiled request: in the shared backend in
+    multi-worker mode, so any worker can serve it, for PROFILE_TTL_SECONDS
+    (default 3600), otherwise in this process (the last PROFILE_KEEP, default 100).
+    With PROFILE_DIR set, the raw stats are also written there as .prof files.
+    """
+    ensure_env_loaded()
+    report = orjson.dumps({"request_id": request_id, "stages": profile.report()})
+    backend = get_shared_backend()
+    if backend is not None:
+        backend.put(f"profile:{request_id}", report, float(os.getenv("PROFILE_TTL_SECONDS", "3600")))
+    else:
+        with _local_lock:
+            _local_profiles[request_id] = report
+            while len(_local_profiles) > int(os.getenv("PROFILE_KEEP", "100")):
+                _local_profiles.popitem(last=False)
+    directory = os.getenv("PROFILE_DIR")
+    if directory:
+        profile.dump(directory, request_id)
+    logger.info(f"Stored profile of request {request_id}")
+
+
+def load_profile(request_id: str) -> bytes | None:
+    backend = get_shared_backend()
+    if backend is not None:
+        return backend.get(f"profile:{request_id}")
+    with _local_lock:
+        return _local_profiles.get(request_id)
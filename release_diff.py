@@ -0,0 +1,144 @@
+# release_diff.py
+import re
+from typing import Any, Dict, List
+
+import numpy as np
+
+from utils import version_sort_key
+
+TREND_UP, TREND_DOWN, TREND_FLAT = "↑", "↓", "↔"
+
+# Risk statuses ranked by severity; anything else is treated as unknown
+RISK_RANKS = {
+    "green": 0, "low": 0, "on track": 0, "no risk": 0, "low risk": 0,
+    "amber": 1, "yellow": 1, "medium": 1, "at risk": 1, "medium risk": 1,
+    "red": 2, "high": 2, "critical": 2, "high risk": 2,
+}
+
+# Field whose version-over-version change is a metric's "trend", in order of preference
+TREND_FIELDS = ("Total", "Value", "Current")
+
+_NUMBER = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*%?\s*$")
+
+
+def as_number(value: Any) -> float:
+    """
+    Numeric value of a metric field (11, 92.5, "25%"), or NaN.
+    """
+    if isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _NUMBER.match(value)
+        if match:
+            return float(match.group(1))
+    return np.nan
+
+
+def _risk_rank(status: Any) -> float:
+    if not isinstance(status, str):
+        return np.nan
+    return RISK_RANKS.get(status.strip().lower(), np.nan)
+
+
+def _previous_valid(valid: np.ndarray) -> np.ndarray:
+    """
+    For each position, the index of the closest earlier valid entry (-1 if none).
+    """
+    positions = np.where(valid, np.arange(len(valid)), -1)
+    last_valid = np.maximum.accumulate(positions)
+    return np.concatenate(([-1], last_valid[:-1]))
+
+
+def _changes(values: np.ndarray) -> np.ndarray:
+    """
+    Change of each value against the previous non-null one; NaN where either is missing.
+    """
+    valid = ~np.isnan(values)
+    previous = _previous_valid(valid)
+    has_previous = valid & (previous >= 0)
+    return np.where(has_previous, values - values[np.maximum(previous, 0)], np.nan)
+
+
+def _trends(changes: np.ndarray) -> List[str]:
+    return np.select([changes > 0, changes < 0], [TREND_UP, TREND_DOWN], TREND_FLAT).tolist()
+
+
+def _json_number(value: float):
+    if np.isnan(value):
+        return None
+    return int(value) if float(value).is_integer() else round(float(value), 4)
+
+
+def _metric_facts(metric: str, by_version: Dict[str, dict], escalations: List[dict]) -> List[dict]:
+    versions = sorted(by_version, key=version_sort_key)
+    rows = [{"version": v, **by_version[v]} for v in versions]
+    fields = list(dict.fromkeys(f for v in versions for f in by_version[v]))
+
+    numeric = {f: np.array([as_number(by_version[v].get(f)) for v in versions]) for f in fields}
+    numeric = {f: values for f, values in numeric.items() if not np.isnan(values).all()}
+
+    # One trend per row on the headline field; metrics without one (e.g. SFDC
+    # ATLs/BTLs) get a trend per numeric field
+    primary = next((f for f in TREND_FIELDS if f in numeric), None)
+    trend_fields = [primary] if primary else list(numeric)
+    for field in trend_fields:
+        changes = _changes(numeric[field])
+        prefix = "" if primary else f"{field} "
+        for row, change, trend in zip(rows, changes, _trends(changes)):
+            if not np.isnan(change):
+                row[f"{prefix}change"] = _json_number(change)
+            row[f"{prefix}trend"] = trend
+
+    if "Total" in numeric and "Open" in numeric:
+        total, open_ = numeric["Total"], numeric["Open"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(total > 0, open_ / total, np.nan)
+        for row, value in zip(rows, ratio):
+            if not np.isnan(value):
+                row["open_ratio"] = _json_number(value)
+
+    if "Status" in fields:
+        ranks = np.array([_risk_rank(by_version[v].get("Status")) for v in versions])
+        previous = _previous_valid(~np.isnan(ranks))
+        escalated = np.flatnonzero((previous >= 0) & (ranks > ranks[np.maximum(previous, 0)]))
+        for i in escalated:
+            escalations.append({
+                "metric": metric,
+                "from_version": versions[previous[i]],
+                "to_version": versions[i],
+                "from_status": by_version[versions[previous[i]]]["Status"],
+                "to_status": by_version[versions[i]]["Status"],
+            })
+
+    return rows
+
+
+def compute_release_facts(metrics: dict | None) -> dict:
+    """
+    Precomputes the version-over-version facts the reporter would otherwise
+    work out itself from the structured metrics (section -> metric -> version -> fields):
+
+    - per metric, one row per version (numeric version order) with the original
+      fields plus "change" / "trend" of its Total, Value or Current against the
+      previous non-null value (first value and gaps are "↔"; metrics with none
+      of those get "<field> change" / "<field> trend" per numeric field), and
+      "open_ratio" for Total/Open counts
+    - "risk_escalations": status transitions to a more severe risk level
+    - scalar entries such as "Target Customers" are passed through unchanged
+    """
+    facts = {"versions": [], "risk_escalations": []}
+    versions = set()
+    for section, entries in (metrics or {}).items():
+        if not isinstance(entries, dict):
+            continue
+        section_facts = facts.setdefault(section, {})
+        for metric, by_version in entries.items():
+            if isinstance(by_version, dict) and by_version and all(isinstance(v, dict) for v in by_version.values()):
+                section_facts[metric] = _metric_facts(metric, by_version, facts["risk_escalations"])
+                versions.update(by_version)
+            else:
+                section_facts[metric] = by_version
+    facts["versions"] = sorted(versions, key=version_sort_key)
+    return facts
@@ -0,0 +1,287 @@
+# shared_backend.py
+"""
+State shared between worker processes when the app runs as several uvicorn
+workers (`uvicorn main:app --workers N`): cached analysis results, the
+cross-process single-flight locks and the batch job queue.
+
+WORKER_BACKEND selects the backend:
+- "none" (default): single-process mode, nothing is shared
+- "sqlite": a SQLite database in WAL mode at WORKER_BACKEND_PATH
+  (default workers.sqlite3), for workers on one host
+- "redis": any Redis-compatible server at REDIS_URL (requires the redis package)
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from app_config import ensure_env_loaded
+from app_logging import logger
+
+# Identifies this process as a lock owner / job consumer
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class SqliteSharedBackend:
+    """
+    Shared results, locks and job queue in one SQLite database. WAL mode lets
+    workers read while another writes; writes take the database lock briefly
+    (BEGIN IMMEDIATE), so claims and lock grabs are atomic across processes.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                owner TEXT,
+                lease_expires REAL,
+                result BLOB
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queue_status ON jobs (queue, status, id);
+        """)
+
+    def _write(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    # Results
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM results WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+
+        def write(db):
+            db.execute("DELETE FROM results WHERE expires <= ?", (now,))
+            db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, value, now + ttl))
+
+        self._write(write)
+
+    # Locks
+
+    def try_lock(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+
+        def write(db):
+            row = db.execute("SELECT owner, expires FROM locks WHERE key = ?", (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            db.execute("INSERT OR REPLACE INTO locks VALUES (?, ?, ?)", (key, owner, now + ttl))
+            return True
+
+        return self._write(write)
+
+    def unlock(self, key: str, owner: str) -> None:
+        self._write(lambda db: db.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner)))
+
+    # Job queue
+
+    def enqueue(self, queue: str, payload: bytes) -> str:
+        return str(self._write(
+            lambda db: db.execute("INSERT INTO jobs (queue, payload) VALUES (?, ?)", (queue, payload)).lastrowid
+        ))
+
+    def claim(self, queue: str, owner: str, lease: float) -> tuple[str, bytes] | None:
+        """
+        Takes the oldest queued job, or a running one whose consumer's lease expired.
+        """
+        now = time.time()
+
+        def write(db):
+            row = db.execute(
+                "SELECT id, payload FROM jobs WHERE queue = ? AND "
+                "(status = 'queued' OR (status = 'running' AND lease_expires < ?)) ORDER BY id LIMIT 1",
+                (queue, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, lease_expires = ? WHERE id = ?",
+                (owner, now + lease, row[0]),
+            )
+            return str(row[0]), row[1]
+
+        return self._write(write)
+
+    def complete(self, job_id: str, result: bytes) -> None:
+        def write(db):
+            db.execute("UPDATE jobs SET status = 'done', result = ? WHERE id = ? AND status = 'running'",
+                       (result, int(job_id)))
+            db.execute("DELETE FROM jobs WHERE id = ? AND status = 'dropped'", (int(job_id),))
+
+        self._write(write)
+
+    def take_result(self, job_id: str) -> bytes | None:
+        def write(db):
+            row = db.execute(
+                "SELECT result FROM jobs WHERE id = ? AND status = 'done'", (int(job_id),)
+            ).fetchone()
+            if row is not None:
+                db.execute("DELETE FROM jobs WHERE id = ?", (int(job_id),))
+            return row[0] if row else None
+
+        return self._write(write)
+
+    def discard(self, job_id: str) -> None:
+        """
+        Drops a job nobody will read: deleted now if not running, otherwise when it completes.
+        """
+        def write(db):
+            db.execute("DELETE FROM jobs WHERE id = ? AND status != 'running'", (int(job_id),))
+            db.execute("UPDATE jobs SET status = 'dropped' WHERE id = ?", (int(job_id),))
+
+        self._write(write)
+
+
+# Deletes the lock only if `owner` still holds it
+_REDIS_UNLOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Takes a running job whose lease expired, else the oldest queued one, and leases it until ARGV[2]
+_REDIS_CLAIM = """
+local job_id = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, 1)[1]
+if not job_id then
+    job_id = redis.call('LPOP', KEYS[1])
+end
+if not job_id then
+    return false
+end
+redis.call('ZADD', KEYS[2], ARGV[2], job_id)
+return {job_id, redis.call('HGET', ARGV[3] .. 'jobdata:' .. job_id, 'payload')}
+"""
+
+# Ends a job's lease and drops its payload; stores the result unless the job was discarded
+_REDIS_FINISH = """
+local queue = redis.call('HGET', KEYS[1], 'queue')
+if queue then
+    redis.call('ZREM', ARGV[1] .. 'running:' .. queue, ARGV[2])
+end
+redis.call('DEL', KEYS[1])
+if ARGV[3] ~= '' and redis.call('EXISTS', KEYS[3]) == 0 then
+    redis.call('SET', KEYS[2], ARGV[3], 'PX', ARGV[4])
+end
+"""
+
+
+class RedisSharedBackend:
+    """
+    The same operations on a Redis-compatible server. `client` is a redis-py
+    client or anything exposing the calls used here (get, set with nx/px,
+    delete, hset, rpush, register_script). Locks are released and jobs claimed
+    with Lua scripts, so each is atomic. As with the SQLite backend, a claimed
+    job is leased: if its worker dies, another worker claims it again once the
+    lease expires.
+    """
+    def __init__(self, client, prefix: str = "release-analysis:"):
+        self.client = client
+        self.prefix = prefix
+        self._unlock = client.register_script(_REDIS_UNLOCK)
+        self._claim = client.register_script(_REDIS_CLAIM)
+        self._finish = client.register_script(_REDIS_FINISH)
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(f"{self.prefix}result:{key}")
+
+    def put(self, key: str, value: bytes, ttl: float) -> None:
+        self.client.set(f"{self.prefix}result:{key}", value, px=int(ttl * 1000))
+
+    def try_lock(self, key: str, owner: str, ttl: float) -> bool:
+        name = f"{self.prefix}lock:{key}"
+        if self.client.set(name, owner, nx=True, px=int(ttl * 1000)):
+            return True
+        current = self.client.get(name)
+        return current is not None and current.decode() == owner
+
+    def unlock(self, key: str, owner: str) -> None:
+        self._unlock(keys=[f"{self.prefix}lock:{key}"], args=[owner])
+
+    def enqueue(self, queue: str, payload: bytes) -> str:
+        job_id = uuid.uuid4().hex
+        self.client.hset(f"{self.prefix}jobdata:{job_id}", mapping={"queue": queue, "payload": payload})
+        self.client.rpush(f"{self.prefix}queue:{queue}", job_id)
+        return job_id
+
+    def claim(self, queue: str, owner: str, lease: float) -> tuple[str, bytes] | None:
+        """
+        Takes the oldest queued job, or a running one whose consumer's lease expired.
+        """
+        while True:
+            now = time.time()
+            claimed = self._claim(
+                keys=[f"{self.prefix}queue:{queue}", f"{self.prefix}running:{queue}"],
+                args=[now, now + lease, self.prefix],
+            )
+            if not claimed:
+                return None
+            job_id, payload = claimed[0].decode(), claimed[1] if len(claimed) > 1 else None
+            if payload is not None and not self._dropped(job_id):
+                return job_id, payload
+            self._finish_job(job_id, b"")
+
+    def complete(self, job_id: str, result: bytes) -> None:
+        self._finish_job(job_id, result)
+
+    def _finish_job(self, job_id: str, result: bytes) -> None:
+        self._finish(
+            keys=[f"{self.prefix}jobdata:{job_id}", f"{self.prefix}job:{job_id}", f"{self.prefix}dropped:{job_id}"],
+            args=[self.prefix, job_id, result, 3600 * 1000],
+        )
+
+    def take_result(self, job_id: str) -> bytes | None:
+        result = self.client.get(f"{self.prefix}job:{job_id}")
+        if result is not None:
+            self.client.delete(f"{self.prefix}job:{job_id}")
+        return result
+
+    def discard(self, job_id: str) -> None:
+        self.client.set(f"{self.prefix}dropped:{job_id}", b"1", px=3600 * 1000)
+
+    def _dropped(self, job_id: str) -> bool:
+        return self.client.get(f"{self.prefix}dropped:{job_id}") is not None
+
+
+@lru_cache(maxsize=1)
+def get_shared_backend():
+    """
+    The backend selected by WORKER_BACKEND, or None in single-process mode.
+    """
+    ensure_env_loaded()
+    name = os.getenv("WORKER_BACKEND", "none").strip().lower()
+    if name == "none":
+        return None
+    if name == "sqlite":
+        backend = SqliteSharedBackend(os.getenv("WORKER_BACKEND_PATH", "workers.sqlite3"))
+    elif name == "redis":
+        import redis
+
+        backend = RedisSharedBackend(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    else:
+        raise ValueError(f"Unknown WORKER_BACKEND '{name}', expected none, sqlite or redis")
+    logger.info(f"Worker {WORKER_ID} sharing state through the {name} backend")
+    return backend
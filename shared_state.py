@@ -5,13 +5,23 @@ from threading import Lock
 class SharedState:
     """
     Thread-safe container to hold shared state across analysis pipeline.
+    Each pooled crew bundle owns one, so concurrent requests do not overwrite
+    each other's results.
     Used mainly for:
     - Storing structured metrics
     - Storing generated report parts
+    - Storing visualization JSON
+    - Tracking crew kickoffs still running in worker threads
     """
     def __init__(self):
         self.lock = Lock()
-        self.metrics = None
-        self.report_parts = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.metrics = None
+            self.report_parts = {}
+            self.visualization_json = None
+            self.running = []
 
 shared_state = SharedState()
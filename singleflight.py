@@ -0,0 +1,203 @@
+# singleflight.py
+import asyncio
+import hashlib
+import os
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+import orjson
+from pydantic import BaseModel
+
+from app_logging import logger
+from deadlines import request_deadline_seconds
+from shared_backend import WORKER_ID, get_shared_backend
+
+
+def content_key(*parts: str | None) -> str:
+    """
+    Stable hash of the given payload parts (None and "" are distinct from each other).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(b"\x00" if part is None else b"\x01" + part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller starts the work as a task; callers arriving while it runs
+    await the same task and get the same result (or exception). A caller that
+    is cancelled stops waiting without cancelling the work, unless it was the
+    last one waiting, in which case the work is cancelled too.
+    """
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(work()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            logger.info(f"Joining in-flight analysis {key[:12]} ({flight.waiters} waiting)")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to read the result; later callers start afresh
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.items: list = []
+        self.updated = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.readers = 0
+
+    def notify(self) -> None:
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+
+class StreamSingleFlight:
+    """
+    Single-flight for streamed results. The first caller's stream runs as a
+    task; every caller with the same key, including ones arriving while it
+    runs, reads all of its items from the start as they are produced, then its
+    exception if it failed. The work is cancelled when its last reader leaves.
+    """
+    def __init__(self):
+        self._flights: Dict[str, _StreamFlight] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def stream(self, key: str, work: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            flight.task = asyncio.ensure_future(self._produce(flight, work()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            logger.info(f"Joining in-flight stream {key[:12]} ({flight.readers} reading)")
+
+        flight.readers += 1
+        try:
+            position = 0
+            while True:
+                updated = flight.updated
+                while position < len(flight.items):
+                    yield flight.items[position]
+                    position += 1
+                if flight.task.done():
+                    break
+                await updated.wait()
+            if not flight.task.cancelled() and flight.task.exception() is not None:
+                raise flight.task.exception()
+        finally:
+            flight.readers -= 1
+            if flight.readers == 0 and not flight.task.done():
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    @staticmethod
+    async def _produce(flight: _StreamFlight, stream: AsyncIterator[Any]) -> None:
+        try:
+            async for item in stream:
+                flight.items.append(item)
+                flight.notify()
+        finally:
+            flight.notify()
+
+    def _forget(self, key: str, flight: _StreamFlight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+class WorkerFlight:
+    """
+    Single-flight across worker processes, through a shared backend (see
+    shared_backend.py). Calls are first coalesced within the process; then one
+    worker takes the key's lock and runs the work while the others poll for
+    its result, which stays cached in the backend for `result_ttl` seconds.
+    Results cross processes as JSON, so callers may get a dict back instead
+    of the model the work returned.
+    """
+    def __init__(self, backend, owner: str, lock_ttl: float, result_ttl: float, poll: float = 0.25):
+        self.backend = backend
+        self.owner = owner
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll = poll
+        self.local = SingleFlight()
+
+    def in_flight(self) -> int:
+        return self.local.in_flight()
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        return await self.local.do(key, lambda: self._across_workers(key, work))
+
+    async def _across_workers(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            cached = await asyncio.to_thread(self.backend.get, key)
+            if cached is not None:
+                return orjson.loads(cached)
+            if await asyncio.to_thread(self.backend.try_lock, key, self.owner, self.lock_ttl):
+                break
+            await asyncio.sleep(self.poll)  # another worker is running it
+
+        try:
+            result = await work()
+            shared = dict(result) if isinstance(result, BaseModel) else result
+            await asyncio.to_thread(self.backend.put, key, orjson.dumps(shared), self.result_ttl)
+            return result
+        finally:
+            # Off the event loop; if this task is cancelled again meanwhile, the thread still releases the lock
+            await asyncio.to_thread(self.backend.unlock, key, self.owner)
+
+
+# Process-wide coalescing of identical /analyze_markdown requests, and of identical streamed summaries
+analysis_flights = SingleFlight()
+summary_stream_flights = StreamSingleFlight()
+
+
+@lru_cache(maxsize=1)
+def get_analysis_flights() -> SingleFlight | WorkerFlight:
+    """
+    Coalescing for /analyze_markdown: within this process, or across workers
+    when a shared backend is configured. Locks outlive a crashed worker by at
+    most one request deadline; shared results are kept WORKER_RESULT_TTL
+    seconds (default 600).
+    """
+    backend = get_shared_backend()
+    if backend is None:
+        return analysis_flights
+    return WorkerFlight(
+        backend,
+        WORKER_ID,
+        lock_ttl=request_deadline_seconds() + 60,
+        result_ttl=float(os.getenv("WORKER_RESULT_TTL", "600")),
+    )
@@ -0,0 +1,184 @@
+# snapshots.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import List, NamedTuple
+
+import orjson
+from pydantic import BaseModel
+
+from app_config import ensure_env_loaded
+
+
+class Snapshot(NamedTuple):
+    product: str
+    dashboard_key: str
+    input_hash: str   # content key of the markdown the snapshot was computed from
+    etag: str
+    body: bytes       # the encoded MultiFileAnalysisResponse
+    created: float
+
+
+class StaleSource(NamedTuple):
+    product: str
+    dashboard_key: str
+    markdown_text: str
+    input_hash: str
+
+
+class SnapshotStore:
+    """
+    Last complete analysis per dashboard, stored encoded so reads are a single
+    lookup, plus the dashboard's latest source markdown. A snapshot is stale
+    when the source's hash differs from the one it was computed from.
+    Backed by SQLite in WAL mode, so all workers on a host share it and
+    snapshots survive restarts.
+
+    Background refreshes claim a source first (see `claim`), so one worker
+    recomputes it at a time, and a source whose refresh failed or came back
+    partial is retried with exponential backoff rather than on every pass.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                product TEXT NOT NULL, dashboard_key TEXT NOT NULL, input_hash TEXT NOT NULL,
+                etag TEXT NOT NULL, body BLOB NOT NULL, created REAL NOT NULL,
+                PRIMARY KEY (product, dashboard_key)
+            );
+            CREATE TABLE IF NOT EXISTS sources (
+                product TEXT NOT NULL, dashboard_key TEXT NOT NULL, markdown_text TEXT NOT NULL,
+                input_hash TEXT NOT NULL, updated REAL NOT NULL,
+                PRIMARY KEY (product, dashboard_key)
+            );
+        """)
+        # Last refresh attempt: the hash it was for, how many times in a row, and
+        # when the source may be claimed again (added to stores created without them)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(sources)")}
+        for column, kind in (("attempt_hash", "TEXT"), ("attempts", "INTEGER NOT NULL DEFAULT 0"), ("retry_at", "REAL")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE sources ADD COLUMN {column} {kind}")
+
+    def get(self, product: str, dashboard_key: str) -> Snapshot | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT product, dashboard_key, input_hash, etag, body, created FROM snapshots "
+                "WHERE product = ? AND dashboard_key = ?", (product, dashboard_key)
+            ).fetchone()
+        return Snapshot(*row) if row else None
+
+    def get_with_source_hash(self, product: str, dashboard_key: str) -> tuple[Snapshot | None, str | None]:
+        """
+        The dashboard's snapshot and the hash of its current source, read in one query.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT p.product, p.dashboard_key, p.input_hash, p.etag, p.body, p.created, s.input_hash "
+                "FROM snapshots p LEFT JOIN sources s ON s.product = p.product AND s.dashboard_key = p.dashboard_key "
+                "WHERE p.product = ? AND p.dashboard_key = ?", (product, dashboard_key)
+            ).fetchone()
+        return (Snapshot(*row[:6]), row[6]) if row else (None, None)
+
+    def set_source(self, product: str, dashboard_key: str, markdown_text: str, input_hash: str) -> bool:
+        """
+        Records the dashboard's current markdown. Returns whether it changed.
+        """
+        with self._lock:
+            changed = self._db.execute(
+                "SELECT 1 FROM sources WHERE product = ? AND dashboard_key = ? AND input_hash = ?",
+                (product, dashboard_key, input_hash),
+            ).fetchone() is None
+            if changed:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sources (product, dashboard_key, markdown_text, input_hash, updated) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (product, dashboard_key, markdown_text, input_hash, time.time()),
+                )
+        return changed
+
+    def save(self, product: str, dashboard_key: str, input_hash: str, response) -> Snapshot | None:
+        """
+        Stores `response` as the dashboard's snapshot, unless it is partial
+        (some stages timed out) or its source has changed since it was computed.
+        """
+        content = dict(response) if isinstance(response, BaseModel) else response
+        if content.get("timed_out"):
+            return None
+        body = orjson.dumps(content)
+        snapshot = Snapshot(
+            product, dashboard_key, input_hash, f'"{hashlib.sha256(body).hexdigest()[:32]}"', body, time.time()
+        )
+        with self._lock:
+            current = self._db.execute(
+                "SELECT input_hash FROM sources WHERE product = ? AND dashboard_key = ?", (product, dashboard_key)
+            ).fetchone()
+            if current and current[0] != input_hash:
+                return None
+            self._db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)", snapshot)
+        return snapshot
+
+    def stale(self) -> List[StaleSource]:
+        """
+        Sources with no snapshot, or whose snapshot was computed from other
+        markdown, except those being refreshed or waiting to be retried.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT s.product, s.dashboard_key, s.markdown_text, s.input_hash FROM sources s "
+                "LEFT JOIN snapshots p ON p.product = s.product AND p.dashboard_key = s.dashboard_key "
+                "WHERE (p.input_hash IS NULL OR p.input_hash != s.input_hash) "
+                "AND (s.attempt_hash IS NULL OR s.attempt_hash != s.input_hash OR s.retry_at <= ?) "
+                "ORDER BY s.updated", (time.time(),)
+            ).fetchall()
+        return [StaleSource(*row) for row in rows]
+
+    def claim(self, source: StaleSource, lease: float) -> bool:
+        """
+        Claims `source` for one refresh attempt, for `lease` seconds. Fails if
+        its markdown changed since `stale()`, another worker holds it, or its
+        last attempt on this markdown is still backing off.
+        """
+        now = time.time()
+        with self._lock:
+            claimed = self._db.execute(
+                "UPDATE sources SET attempts = CASE WHEN attempt_hash = input_hash THEN attempts + 1 ELSE 1 END, "
+                "attempt_hash = input_hash, retry_at = ? "
+                "WHERE product = ? AND dashboard_key = ? AND input_hash = ? "
+                "AND (attempt_hash IS NULL OR attempt_hash != input_hash OR retry_at <= ?)",
+                (now + lease, source.product, source.dashboard_key, source.input_hash, now),
+            ).rowcount
+        return claimed == 1
+
+    def retry_later(self, source: StaleSource, base: float, limit: float) -> float:
+        """
+        Ends a claimed attempt that produced no snapshot: the source is not
+        claimed again for base * 2^(attempts - 1) seconds, at most `limit`.
+        Returns that delay.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT attempts FROM sources WHERE product = ? AND dashboard_key = ? AND attempt_hash = ?",
+                (source.product, source.dashboard_key, source.input_hash),
+            ).fetchone()
+            if row is None:
+                return 0.0  # the markdown changed meanwhile; the new one is due now
+            delay = min(base * 2 ** max(row[0] - 1, 0), limit)
+            self._db.execute(
+                "UPDATE sources SET retry_at = ? WHERE product = ? AND dashboard_key = ? AND attempt_hash = ?",
+                (time.time() + delay, source.product, source.dashboard_key, source.input_hash),
+            )
+        return delay
+
+
+@lru_cache(maxsize=1)
+def get_snapshot_store() -> SnapshotStore:
+    """
+    Process-wide store at SNAPSHOT_DB_PATH (default snapshots.sqlite3).
+    """
+    ensure_env_loaded()
+    return SnapshotStore(os.getenv("SNAPSHOT_DB_PATH", "snapshots.sqlite3"))
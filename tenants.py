@@ -0,0 +1,255 @@
+# tenants.py
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict
+
+from fastapi import HTTPException
+
+from app_config import ensure_env_loaded
+from app_logging import logger
+from llm_usage import LlmUsage
+
+# Token accepted before tenants were configured; maps to the "default" tenant
+# when no TENANTS_CONFIG file is given (override with API_TOKEN).
+LEGACY_TOKEN = "asdfghjkl123456788"
+
+DEFAULT_LIMITS = {
+    "max_concurrency": 4,   # analyses running at once
+    "max_queue": 16,        # admitted requests waiting for a running slot
+    "queue_timeout": 30.0,  # seconds a request may wait in the queue
+    "rate_per_minute": 60,  # token-bucket refill rate
+    "burst": 10,            # token-bucket capacity
+}
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `capacity` tokens, refilled at `rate` tokens per second.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, cost: float = 1.0) -> float:
+        """
+        Takes `cost` tokens. Returns 0 on success, otherwise the seconds until
+        enough tokens will be available (nothing is taken).
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= cost:
+                self.tokens -= cost
+                return 0.0
+            return (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class TenantMetrics:
+    """
+    Per-tenant usage and latency counters, reported by GET /tenants/metrics.
+    """
+    def __init__(self, window: int = 512):
+        self.requests = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.failed = 0
+        self.items = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.latencies = deque(maxlen=window)  # seconds, most recent requests
+        self.llm_usage = LlmUsage()  # LLM calls and tokens of the runs this tenant started
+
+    def reject(self, reason: str) -> None:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def average_latency(self, default: float = 1.0) -> float:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else default
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def percentile(p: float):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3) if ordered else None
+
+        return {
+            "requests": self.requests,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "failed": self.failed,
+            "items": self.items,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "latency_seconds": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+            "llm_usage": self.llm_usage.snapshot(),
+        }
+
+
+class Tenant:
+    """
+    One API client: its limits, token bucket, admission queue and metrics.
+    """
+    def __init__(self, name: str, limits: dict, admin: bool = False):
+        self.name = name
+        self.admin = admin
+        self.limits = {**DEFAULT_LIMITS, **limits}
+        self.bucket = TokenBucket(self.limits["rate_per_minute"] / 60.0, self.limits["burst"])
+        self.metrics = TenantMetrics()
+        self._slots = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # Created on first use so it binds to the serving event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limits["max_concurrency"])
+        return self._slots
+
+    def _reject(self, reason: str, retry_after: float) -> HTTPException:
+        self.metrics.reject(reason)
+        logger.warning(f"Tenant '{self.name}' request rejected ({reason}), retry after {retry_after:.1f}s")
+        return HTTPException(
+            status_code=429,
+            detail=f"Too many requests for tenant '{self.name}' ({reason})",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    async def acquire(self, cost: int = 1) -> float:
+        """
+        Admits one request costing `cost` rate-limit tokens, waiting in the
+        tenant's queue for a running slot if needed. Raises 429 with
+        Retry-After when the rate limit is exhausted, the queue is full or the
+        queue wait times out, and 413 when `cost` exceeds the tenant's burst
+        (the bucket could never hold that many tokens). Returns the request's
+        start time for `release`, so recorded latency includes time spent queued.
+        """
+        started = time.perf_counter()
+        self.metrics.requests += 1
+        if cost > self.limits["burst"]:
+            self.metrics.reject("too_large")
+            logger.warning(f"Tenant '{self.name}' request rejected (too_large), cost {cost}")
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request costs {cost} rate-limit tokens; tenant '{self.name}' "
+                       f"allows at most {self.limits['burst']} at once",
+            )
+        wait = self.bucket.take(cost)
+        if wait:
+            raise self._reject("rate_limit", wait)
+
+        if self.slots.locked():
+            if self.metrics.queued >= self.limits["max_queue"]:
+                raise self._reject("queue_full", self.metrics.average_latency())
+            self.metrics.queued += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.limits["queue_timeout"])
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout", self.metrics.average_latency())
+            finally:
+                self.metrics.queued -= 1
+        else:
+            await self.slots.acquire()
+
+        self.metrics.admitted += 1
+        self.metrics.items += cost
+        self.metrics.in_flight += 1
+        return started
+
+    def release(self, started: float, failed: bool = False) -> None:
+        self.slots.release()
+        self.metrics.in_flight -= 1
+        self.metrics.latencies.append(time.perf_counter() - started)
+        if failed:
+            self.metrics.failed += 1
+
+    @asynccontextmanager
+    async def admission(self, cost: int = 1):
+        started = await self.acquire(cost)
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.release(started, failed)
+
+
+# Tenant of the request being served; runs it starts charge their LLM usage to it (see `run_usage`)
+current_tenant: ContextVar["Tenant | None"] = ContextVar("current_tenant", default=None)
+
+
+def run_usage() -> LlmUsage:
+    """
+    Usage counter for a new analysis run, adding into the current tenant's
+    metrics as it goes. Runs shared by identical requests are charged to the
+    tenant that started them.
+    """
+    tenant = current_tenant.get()
+    return LlmUsage(parent=tenant.metrics.llm_usage if tenant is not None else None)
+
+
+class TenantRegistry:
+    """
+    Maps bearer tokens to tenants.
+    """
+    def __init__(self, tenants: Dict[str, Tenant], tokens: Dict[str, str]):
+        self.tenants = tenants
+        self.tokens = tokens
+
+    @classmethod
+    def from_config(cls, config: dict) -> "TenantRegistry":
+        """
+        Config format:
+            {"tenants": {"<name>": {"tokens": ["..."], "admin": false, "max_concurrency": 4, ...}}}
+        Limits not given fall back to DEFAULT_LIMITS.
+        """
+        tenants, tokens = {}, {}
+        for name, settings in config.get("tenants", {}).items():
+            settings = dict(settings)
+            tenant_tokens = settings.pop("tokens", [])
+            admin = bool(settings.pop("admin", False))
+            tenants[name] = Tenant(name, settings, admin)
+            for token in tenant_tokens:
+                tokens[token] = name
+        return cls(tenants, tokens)
+
+    def authenticate(self, token: str) -> Tenant:
+        name = self.tokens.get(token)
+        if name is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return self.tenants[name]
+
+
+@lru_cache(maxsize=1)
+def get_tenant_registry() -> TenantRegistry:
+    """
+    Loads tenants from the JSON file at TENANTS_CONFIG. Without one, a single
+    "default" tenant accepts API_TOKEN (or the legacy token) with default limits.
+    Admin rights are only granted by TENANTS_CONFIG, never to the default tenant.
+    """
+    ensure_env_loaded()
+    path = os.getenv("TENANTS_CONFIG")
+    if path:
+        with open(path) as f:
+            config = json.load(f)
+    else:
+        config = {"tenants": {"default": {"tokens": [os.getenv("API_TOKEN", LEGACY_TOKEN)]}}}
+    registry = TenantRegistry.from_config(config)
+    logger.info(f"Loaded {len(registry.tenants)} tenant(s)")
+    return registry
+
+
+def authenticate(token) -> Tenant:
+    """
+    Resolves the bearer credentials to a tenant, or raises 401.
+    """
+    return get_tenant_registry().authenticate(token.credentials)
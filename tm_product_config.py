@@ -0,0 +1,17 @@
+# tm_product_config.py
+from functools import partial
+
+from products import ProductPlugin
+from wst_markdown_processor import Wst_MarkdownExtractor, Wst_MarkdownHarmonizer
+from wst_product_config import checkout_wst_crews, wst_crew_inputs
+
+# TM release extracts come from the same dashboard export as WST (same release
+# scope / critical metrics / health trends sections), so TM reuses the WST
+# markdown processing and crew templates with TM-specific prompts and its own crew pool.
+TM_PRODUCT = ProductPlugin(
+    name="TM",
+    extractor=Wst_MarkdownExtractor,
+    harmonizer=Wst_MarkdownHarmonizer,
+    checkout_crews=partial(checkout_wst_crews, product="TM"),
+    crew_inputs=wst_crew_inputs,
+)
@@ -1,16 +1,19 @@
 # utils.py
+import itertools
 import re
 import os
-from typing import Dict,List
-from dotenv import load_dotenv
-from langchain_openai import AzureChatOpenAI
+from functools import lru_cache
+from typing import AsyncIterator,Dict,Iterator,List,Tuple
+from app_config import ensure_env_loaded
 from app_logging import logger
+from llm_usage import record_llm_usage
+from deadlines import llm_timeout
+from llm_cache import cache_applies, langchain_prompt_cache
+from profiling import profiled
 import json
 import re
 from fastapi import HTTPException, Header, Body
 
-load_dotenv()
-
 
 
 # def sanitize_incoming_payload(payload: dict) -> dict:
@@ -55,11 +58,13 @@ load_dotenv()
 #         "product": product,
 #         "auth": auth_token  # Include in return dict
 #     }
+@profiled("sanitize")
 def sanitize_incoming_payload(payload: dict) -> dict:
     """
     Ensures the incoming payload is well-formed:
     - Escapes control characters in markdown_text
     - Validates required fields
+    - Rejects markdown_text over MAX_MARKDOWN_CHARS (default 2,000,000) with a 413
     - Converts malformed inputs to usable format
     """
     if not isinstance(payload, dict):
@@ -73,6 +78,11 @@ def sanitize_incoming_payload(payload: dict) -> dict:
     raw_markdown = payload.get("markdown_text")
     if not isinstance(raw_markdown, str):
         raise HTTPException(status_code=400, detail="`markdown_text` must be a string.")
+    ensure_env_loaded()
+    max_chars = int(os.getenv("MAX_MARKDOWN_CHARS", "2000000"))
+    if len(raw_markdown) > max_chars:
+        # Parsing is linear in the input; this caps it before any of it runs
+        raise HTTPException(status_code=413, detail=f"`markdown_text` is over {max_chars} characters.")
 
     # Escape problematic control characters
     clean_markdown = raw_markdown.replace('\\', '\\\\')  # escape backslashes
@@ -96,34 +106,184 @@ def extract_versions_wst(text):
     # Matches version numbers like 45.1.15.0 or 12.34.56.78
     version_pattern = r'\b\d{2}\.\d{1,2}\.\d{1,2}\.\d{1,2}\b'
     versions = re.findall(version_pattern, text)
-    return sorted(set(versions))  # remove duplicates and sort
+    return sorted(set(versions), key=version_sort_key)  # remove duplicates and sort
+
+
+def version_sort_key(version: str) -> tuple:
+    """
+    Sort key ordering release versions numerically (45.1.9.0 before 45.1.15.0).
+    """
+    return tuple(int(part) if part.isdigit() else 0 for part in version.split("."))
+
+
+_VERSION = re.compile(r"\d{2}\.\d{1,2}\.\d{1,2}\.\d{1,2}")
+
+
+def _release_entry(version: str, value):
+    """
+    The part of one release's structurer value that belongs to `version`:
+    value[version] when keyed by versions (other versions' keys are dropped:
+    the release's prompt never showed them), otherwise the value itself.
+    None when only other versions' keys are present.
+    """
+    if not isinstance(value, dict):
+        return value
+    if version in value:
+        return value[version]
+    if any(isinstance(key, str) and _VERSION.fullmatch(key) for key in value):
+        return None
+    return value
+
+
+def merge_version_metrics(per_version_metrics: Dict[str, dict]) -> dict:
+    """
+    Reduce step of map-reduce: deterministically merges structurer outputs
+    produced for individual releases into one canonical metrics dict
+    (section -> metric -> version -> fields), in version order.
+    Each release contributes only its own version (see `_release_entry`);
+    scalar per-release values (e.g. "Target Customers") become {version: value}.
+    """
+    merged = {}
+    dropped = set()
+    for version in sorted(per_version_metrics, key=version_sort_key):
+        metrics = per_version_metrics[version] or {}
+        for section, entries in metrics.items():
+            if not isinstance(entries, dict):
+                continue
+            target = merged.setdefault(section, {})
+            for metric, value in entries.items():
+                if isinstance(value, dict):
+                    dropped.update(key for key in value if key != version and _VERSION.fullmatch(str(key)))
+                entry = _release_entry(version, value)
+                if entry is not None:
+                    target.setdefault(metric, {})[version] = entry
+    if dropped:
+        logger.warning(
+            "Dropped structurer values for versions outside their release: %s",
+            ", ".join(sorted(dropped, key=version_sort_key)),
+            extra={"event": "foreign_version"},
+        )
+    return merged
+
+
+_MARKER_PHRASE = "End of Release Extract"
+_MARKER_CHARS = frozenset("-=~*#")
+_VERSION_IN_TEXT = re.compile(r"\b\d{2}\.\d{1,2}\.\d{1,2}\.\d{1,2}\b")
+
+
+def find_release_markers(text: str, pos: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the (start, end) span of each 'End of Release Extract' marker from
+    `pos` on: the phrase between two runs of at least two of -=~*#, whitespace
+    allowed in between (e.g. '----- End of Release Extract -----').
+    Finds what `[-=~*#]{2,}\s*End of Release Extract\s*[-=~*#]{2,}` would, in
+    linear time: it scans outwards from each occurrence of the phrase, where
+    the regex backtracks quadratically on long runs of marker characters.
+    """
+    floor = pos  # the regex would not reuse characters of the previous marker
+    phrase = text.find(_MARKER_PHRASE, pos)
+    while phrase != -1:
+        start = phrase
+        while start > floor and text[start - 1].isspace():
+            start -= 1
+        run_end = start
+        while start > floor and text[start - 1] in _MARKER_CHARS:
+            start -= 1
+        end = phrase + len(_MARKER_PHRASE)
+        while end < len(text) and text[end].isspace():
+            end += 1
+        run_start = end
+        while end < len(text) and text[end] in _MARKER_CHARS:
+            end += 1
+        if run_end - start >= 2 and end - run_start >= 2:
+            yield start, end
+            floor = end
+            phrase = text.find(_MARKER_PHRASE, end)
+        else:
+            phrase = text.find(_MARKER_PHRASE, phrase + 1)
+
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+@profiled("split")
+def split_release_chunks(markdown_text: str) -> List[Tuple[str, Tuple[int, int]]]:
+    """
+    Splits stitched markdown on 'End of Release Extract' markers and labels each
+    chunk with the first version number in it (the one in its release header),
+    in a single left-to-right pass over the text (see `find_release_markers`).
+
+    Returns (version, (start, end)) pairs sorted numerically by version; the span
+    is the stripped chunk within `markdown_text`. Chunks without a version are
+    skipped with a warning.
+    """
+    pairs = []
+    chunk_start = 0
+    markers = itertools.chain(find_release_markers(markdown_text), [(len(markdown_text), None)])
+    for chunk_end, next_start in markers:
+        span = _strip_span(markdown_text, chunk_start, chunk_end)
+        if span[0] < span[1]:
+            version = _VERSION_IN_TEXT.search(markdown_text, chunk_start, chunk_end)
+            if version:
+                pairs.append((version.group(), span))
+            else:
+                logger.warning(f"Skipping release chunk at {span} without a version number in its header")
+        chunk_start = next_start
+
+    pairs.sort(key=lambda pair: version_sort_key(pair[0]))
+    return pairs
 
 
 def split_joined_markdown_text(markdown_text: str) -> List[str]:
     """
     Splits stitched markdown using flexible 'End of Release Extract' markers with variable dashes.
     """
-    pattern = r"[-=~*#]{2,}\s*End of Release Extract\s*[-=~*#]{2,}"
-    parts = re.split(pattern, markdown_text)
+    parts, start = [], 0
+    for marker_start, marker_end in find_release_markers(markdown_text):
+        parts.append(markdown_text[start:marker_start])
+        start = marker_end
+    parts.append(markdown_text[start:])
     return [part.strip() for part in parts if part.strip()]
 
 
-
-async def generate_single_file_summary(markdown_text: str, product: str) -> str:
+@lru_cache(maxsize=None)
+def get_azure_chat_llm(max_tokens: int):
     """
-    Summarizes a single markdown string using Azure OpenAI.
+    Returns a shared AzureChatOpenAI client for the given token limit.
+    LangChain is imported on first use so the app starts without it.
     """
-    llm = AzureChatOpenAI(
+    from langchain_openai import AzureChatOpenAI
+
+    ensure_env_loaded()
+    temperature = 0
+    return AzureChatOpenAI(
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_version=os.getenv("AZURE_API_VERSION"),
         azure_deployment=os.getenv("DEPLOYMENT_NAME"),
-        temperature=0,
-        max_tokens=1024,
-        timeout=None
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=llm_timeout(),
+        cache=langchain_prompt_cache() if cache_applies(temperature) else False,
     )
 
-    prompt = f"""
+
+
+def record_langchain_usage(response) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        # Served from the prompt cache; no call was made
+        return
+    record_llm_usage(prompt_tokens=usage.get("input_tokens", 0), completion_tokens=usage.get("output_tokens", 0))
+
+
+def single_file_summary_prompt(markdown_text: str, product: str) -> str:
+    return f"""
 You are a release readiness analyst.
 
 Summarize the following {product} release markdown into 4–5 bullet points:
@@ -137,19 +297,40 @@ Rules:
 - Output plain bullet points.
 - Do not add headings, intros, or conclusions.
 """
-    response = await llm.ainvoke(prompt)
+
+
+async def generate_single_file_summary(markdown_text: str, product: str) -> str:
+    """
+    Summarizes a single markdown string using Azure OpenAI.
+    """
+    llm = get_azure_chat_llm(max_tokens=1024)
+    response = await llm.ainvoke(single_file_summary_prompt(markdown_text, product))
+    record_langchain_usage(response)
     return response.content.strip()
 
+
+async def stream_single_file_summary(markdown_text: str, product: str) -> AsyncIterator[str]:
+    """
+    Like `generate_single_file_summary`, but yields the summary one line (bullet) at a time
+    as the model generates it. The last chunk carries the token usage
+    (`stream_usage`, passed as Azure's stream_options by langchain-openai 0.2).
+    """
+    llm = get_azure_chat_llm(max_tokens=1024)
+    message, pending = None, ""
+    prompt = single_file_summary_prompt(markdown_text, product)
+    async for chunk in llm.astream(prompt, stream_options={"include_usage": True}):
+        message = chunk if message is None else message + chunk
+        pending += chunk.content
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if pending.strip():
+        yield pending.strip()
+    record_langchain_usage(message)
+
 def evaluate_with_llm_judge(source_text: str, generated_report: str) -> dict:
-    judge_llm = AzureChatOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        api_version=os.getenv("AZURE_API_VERSION"),
-        azure_deployment=os.getenv("DEPLOYMENT_NAME"),
-        temperature=0,
-        max_tokens=512,
-        timeout=None,
-    )
+    judge_llm = get_azure_chat_llm(max_tokens=512)
    
     prompt = f"""Act as an impartial judge evaluating report quality. You will be given:
 1. ORIGINAL SOURCE TEXT (extracted from PDF)
@@ -184,6 +365,7 @@ Your evaluation:"""
 
     try:
         response = judge_llm.invoke(prompt)
+        record_langchain_usage(response)
         response_text = response.content
 
         # Robust extraction: matches label anywhere on line, any case, extra spaces, "35/50" or "35"
@@ -1,37 +1,28 @@
 import os
 import re
-from dotenv import load_dotenv
 import json
-from openai import AzureOpenAI
+from functools import lru_cache
+from app_config import ensure_env_loaded
+from deadlines import llm_timeout
+from llm_cache import cached_call
 
-# Load environment variables
-load_dotenv()
 
+@lru_cache(maxsize=1)
+def get_client():
+    """
+    Returns the shared AzureOpenAI client, built on first use.
+    """
+    from openai import AzureOpenAI
 
-client = AzureOpenAI(
-    api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-)
+    ensure_env_loaded()
+    return AzureOpenAI(
+        api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        timeout=llm_timeout(),
+    )
 
-def visualize(data):
-    json = f"{data}"
-    prompt = f"""   You are a data assistant designed to build visualizations.
-
-                    Users will paste json data and you will respond with configurations for four Chart.js components, following these guidelines:
-
-                    1. Chart Structure: Generate configurations for exactly four charts, with each chart corresponding to a different section of data.
-
-                    2. Chart Type Selection: For each chart, choose between a line chart or a bar chart based on the data characteristics. Do not use radar or pie charts.
-
-                    3. Data Integrity: Ensure every data point provided is included in the charts. Double-check that no data is omitted, and all values are represented accurately.
-
-                    4. Output Format: Present the results as a pure JSON. Do not include any preamble, explanation, code blocks, or additional wrappers.
-
-                    5. Verification: Before finalizing, verify that all provided data points are accounted for in the JSON output.
-
-                    Here is an example of your output JSON Format:
-                    {"""{"charts": [
+CHART_EXAMPLE = """{"charts": [
                     {
                         "type": "chart_type",
                         "data": {
@@ -74,15 +65,44 @@ def visualize(data):
                         }
                         }
                     }
-                    ]}"""}
+                    ]}"""
+
+def visualize(data, use_cache: bool = False):
+    """
+    Asks the model for Chart.js configurations of `data` and writes them to viz.json.
+    The call runs at the model's default temperature, so its response is only
+    cached when the caller opts in with `use_cache`.
+    """
+    json = f"{data}"
+    prompt = f"""   You are a data assistant designed to build visualizations.
+
+                    Users will paste json data and you will respond with configurations for four Chart.js components, following these guidelines:
+
+                    1. Chart Structure: Generate configurations for exactly four charts, with each chart corresponding to a different section of data.
+
+                    2. Chart Type Selection: For each chart, choose between a line chart or a bar chart based on the data characteristics. Do not use radar or pie charts.
+
+                    3. Data Integrity: Ensure every data point provided is included in the charts. Double-check that no data is omitted, and all values are represented accurately.
+
+                    4. Output Format: Present the results as a pure JSON. Do not include any preamble, explanation, code blocks, or additional wrappers.
+
+                    5. Verification: Before finalizing, verify that all provided data points are accounted for in the JSON output.
+
+                    Here is an example of your output JSON Format:
+                    {CHART_EXAMPLE}
                 """
     
-    response = client.chat.completions.create(
-        model=os.getenv('DEPLOYMENT_NAME'),
-        messages=[{"role": "system", "content": prompt},
-                  {"role": "user", "content": json}]
-        )
-    out = response.choices[0].message.content
+    messages = [{"role": "system", "content": prompt},
+                {"role": "user", "content": json}]
+
+    def complete():
+        response = get_client().chat.completions.create(
+            model=os.getenv('DEPLOYMENT_NAME'),
+            messages=messages
+            )
+        return response.choices[0].message.content
+
+    out = cached_call(os.getenv('DEPLOYMENT_NAME'), None, messages, complete, opt_in=use_cache)
     with open("viz.json", 'w') as file:
         file.write(out)
     return out
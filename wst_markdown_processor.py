@@ -2,6 +2,14 @@ import re
 
 import re
 
+from utils import version_sort_key
+
+# Column label on its own line. The lookbehind starts a match only at the first
+# newline of a run, so long runs of blank lines are not rescanned from every
+# position (quadratic); the splits are the same.
+_STAKEHOLDER_COLUMN = re.compile(r"(?<!\n)\n+(Functional Group|Approver|Functional Lead)\n+")
+
+
 class Wst_MarkdownExtractor:
     def __init__(self, markdown_text: str):
         self.markdown_text = markdown_text
@@ -75,7 +83,7 @@ class Wst_MarkdownExtractor:
         return match.group(1).strip() if match else "*Section Not Found*"
 
     def _preprocess_key_stakeholders(self, section_text):
-        parts = re.split(r"\n+(Functional Group|Approver|Functional Lead)\n+", section_text)
+        parts = _STAKEHOLDER_COLUMN.split(section_text)
         if len(parts) < 5: return section_text
         fg_block, approver_block, lead_block = parts[0], parts[2], parts[4]
         fg = [re.sub(r"^\*\*|\*\*$", "", line.strip()) for line in fg_block.split("\n") if line.strip()]
@@ -111,8 +119,10 @@ class Wst_MarkdownExtractor:
 
 
 class Wst_MarkdownHarmonizer:
-    def __init__(self):
-        pass
+    def __init__(self, section_cache: dict | None = None):
+        # Optional {extracted markdown: sections} cache shared across calls,
+        # so unchanged releases are not re-parsed on incremental re-analysis
+        self.section_cache = section_cache
 
     def harmonize(self, version_to_extracted_md: dict) -> str:
         sections = {
@@ -123,56 +133,70 @@ class Wst_MarkdownHarmonizer:
         }
 
         for version, md_text in version_to_extracted_md.items():
-            release_scope_section = self._extract_section(md_text, ["## 📦 Release Scope", "### 🧩 Release Scope Metrics (Epics, PIRs)"])
-            release_scope_section = self._add_table_headers_if_missing(release_scope_section, "Release Scope")
-            sections["release_scope"][version] = release_scope_section
-
-            critical_section = self._extract_section(md_text, [
-                "## 📊 Critical Release Metrics", 
-                "### 📊 Critical Release Metrics", 
-                "### Critical Release Metrics"
-            ])
-            critical_section = self._add_table_headers_if_missing(critical_section, "Critical Metrics")
-            sections["critical_metrics"][version] = critical_section
-
-            health_trends_section = self._extract_section(md_text, [
-                "## 📈 Release Health Trends", 
-                "### Release Health Trends", 
-                "**Release Health Trends:**"
-            ])
-            health_trends_section = self._add_table_headers_if_missing(health_trends_section, "Health Trends")
-            sections["health_trends"][version] = health_trends_section
-
-            sections["key_stakeholders"][version] = self._extract_section(md_text, [
-                "## 👥 Key Stakeholders", 
-                "### Key Stakeholders", 
-                "**Key Stakeholders:**"
-            ])
+            if self.section_cache is not None and md_text in self.section_cache:
+                version_sections = self.section_cache[md_text]
+            else:
+                version_sections = self._version_sections(md_text)
+                if self.section_cache is not None:
+                    self.section_cache[md_text] = version_sections
+            for name, section in version_sections.items():
+                sections[name][version] = section
 
         combined_markdown = ""
 
         combined_markdown += "## 📦 Release Scope\n"
-        for version in sorted(sections["release_scope"].keys()):
+        for version in sorted(sections["release_scope"].keys(), key=version_sort_key):
             combined_markdown += f"\n### Version {version}\n"
             combined_markdown += sections["release_scope"][version] + "\n"
 
         combined_markdown += "\n## 📊 Critical Release Metrics\n"
-        for version in sorted(sections["critical_metrics"].keys()):
+        for version in sorted(sections["critical_metrics"].keys(), key=version_sort_key):
             combined_markdown += f"\n### Version {version}\n"
             combined_markdown += sections["critical_metrics"][version] + "\n"
 
         combined_markdown += "\n## 📈 Release Health Trends\n"
-        for version in sorted(sections["health_trends"].keys()):
+        for version in sorted(sections["health_trends"].keys(), key=version_sort_key):
             combined_markdown += f"\n### Version {version}\n"
             combined_markdown += sections["health_trends"][version] + "\n"
 
         combined_markdown += "\n## 👥 Key Stakeholders\n"
-        for version in sorted(sections["key_stakeholders"].keys()):
+        for version in sorted(sections["key_stakeholders"].keys(), key=version_sort_key):
             combined_markdown += f"\n### Version {version}\n"
             combined_markdown += sections["key_stakeholders"][version] + "\n"
 
         return combined_markdown.strip()
 
+    def _version_sections(self, md_text: str) -> dict:
+        release_scope_section = self._extract_section(md_text, ["## 📦 Release Scope", "### 🧩 Release Scope Metrics (Epics, PIRs)"])
+        release_scope_section = self._add_table_headers_if_missing(release_scope_section, "Release Scope")
+
+        critical_section = self._extract_section(md_text, [
+            "## 📊 Critical Release Metrics", 
+            "### 📊 Critical Release Metrics", 
+            "### Critical Release Metrics"
+        ])
+        critical_section = self._add_table_headers_if_missing(critical_section, "Critical Metrics")
+
+        health_trends_section = self._extract_section(md_text, [
+            "## 📈 Release Health Trends", 
+            "### Release Health Trends", 
+            "**Release Health Trends:**"
+        ])
+        health_trends_section = self._add_table_headers_if_missing(health_trends_section, "Health Trends")
+
+        key_stakeholders_section = self._extract_section(md_text, [
+            "## 👥 Key Stakeholders", 
+            "### Key Stakeholders", 
+            "**Key Stakeholders:**"
+        ])
+
+        return {
+            "release_scope": release_scope_section,
+            "critical_metrics": critical_section,
+            "health_trends": health_trends_section,
+            "key_stakeholders": key_stakeholders_section
+        }
+
     def _extract_section(self, markdown_text, heading_candidates):
         for heading in heading_candidates:
             pattern = rf"{re.escape(heading)}\s*\n([\s\S]*?)(?=\n## |\n### |\Z)"
@@ -1,217 +1,157 @@
 import os
-from dotenv import load_dotenv
+import asyncio
+import functools
+import queue
+from contextlib import contextmanager
+from functools import lru_cache
 from crewai import Agent, Task, Crew, Process, LLM
-from shared_state import shared_state
-import re
+from app_config import ensure_env_loaded, env_flag
+from deadlines import llm_timeout
+from llm_cache import cached_call, crew_cache_opt_in
+from crew_memory import CrewMemory, new_crew_memory
+from shared_state import SharedState, shared_state
+from json_locator import locate_json_object
+from profiling import profiled
+from release_diff import compute_release_facts
+from models import WstMetrics, WstReport, ChartBundle
+from products import ProductPlugin
+from wst_markdown_processor import Wst_MarkdownExtractor, Wst_MarkdownHarmonizer
 import json
 import logging
+from app_logging import Truncated
 
 
-# Load environment variables
-load_dotenv()
-
 # Logging setup
 logger = logging.getLogger(__name__)
 
-# Initialize Azure LLM
-llm = LLM(
-    model=f"azure/{os.getenv('DEPLOYMENT_NAME')}",
-    api_version=os.getenv("AZURE_API_VERSION"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    base_url=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    temperature=0.1,
-    top_p=0.95,
-)
 
-def extract_json_from_output(raw_output: str) -> dict:
+class CachedLLM(LLM):
     """
-    Extracts JSON from an LLM output, whether in a code block or loose format.
-    Raises ValueError if no valid JSON found.
+    crewAI LLM whose plain-text completions go through the prompt cache.
+    Calls that pass tools are never cached, since their results carry side effects.
     """
-    # Try to extract from ```json ... ``` block
-    match = re.search(r"```json\s*(\{.*?\})\s*```", raw_output, re.DOTALL)
-    if match:
-        return json.loads(match.group(1))
-
-    # Fallback: extract any {...} block
-    match = re.search(r"(\{.*?\})", raw_output, re.DOTALL)
-    if match:
-        return json.loads(match.group(1))
-
-    raise ValueError("No valid JSON found in agent output")
-
-def save_wst_metrics(output):
-    # logger.info("🔎 RAW OUTPUT from Structurer Agent:\n" + output.raw)
-
-    structured = extract_json_from_output(output.raw)
-
-    # logger.info("📦 STRUCTURED JSON Parsed:\n" + json.dumps(structured, indent=2))
-
-    # Step 2.2: Validate expected keys and values
-    release_scope = structured.get("release_scope", {})
-    required_scope_keys = ["Release Epics", "Release PIRs", "SFDC Defects Fixed"]
-
-    for key in required_scope_keys:
-        if key not in release_scope:
-            logger.warning(f"🚨 MISSING KEY in release_scope: {key}")
-            continue
+    def __init__(self, *args, cache_opt_in: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_opt_in = cache_opt_in
 
-        version_data = release_scope[key]
-        if not isinstance(version_data, dict):
-            logger.warning(f"⚠️ Unexpected format for {key}: {version_data}")
-            continue
+    def call(self, messages, tools=None, callbacks=None, available_functions=None):
+        def complete():
+            return super(CachedLLM, self).call(messages, tools, callbacks, available_functions)
 
-        for version, metrics in version_data.items():
-            if not isinstance(metrics, dict):
-                logger.warning(f"⚠️ Unexpected structure for {key} -> {version}: {metrics}")
-                continue
-            for metric_name, value in metrics.items():
-                if value is None:
-                    logger.warning(f"❌ NULL VALUE: {key} -> {version} -> {metric_name}")
+        if tools:
+            return complete()
+        return cached_call(self.model, self.temperature, messages, complete, opt_in=self.cache_opt_in)
 
-    # Optional: Add similar validation for critical_metrics
-    critical_metrics = structured.get("critical_metrics", {})
-    for metric, version_data in critical_metrics.items():
-        for version, fields in version_data.items():
-            for field_name, value in fields.items():
-                if value is None:
-                    logger.warning(f"❌ NULL VALUE: {metric} -> {version} -> {field_name}")
 
-    # Optional: Add validation for health_trends
-    health_trends = structured.get("health_trends", {})
-    for metric, details in health_trends.items():
-        for field in ["Criteria", "Previous", "Current", "Status", "Summary"]:
-            if field not in details or details[field] in [None, ""]:
-                logger.warning(f"⚠️ Incomplete {metric}: Missing or empty '{field}'")
-
-    # Final assignment to shared state
-    shared_state.metrics = structured
-
-
-def setup_crew_wst(extracted_text: str, versions: list):
+@lru_cache(maxsize=1)
+def get_llm() -> LLM:
     """
-    Sets up CrewAI agents for WST analysis.
-    Returns: (data_crew, report_crew, brief_summary_crew)
+    Returns the process-wide Azure LLM used by all product agents, built on first use.
     """
-    version_string = ", ".join(versions)
-
-    # 1️⃣ Structuring Agent
-    structurer = Agent(
-        role="Data Architect",
-        goal="Extract structured WST release metrics into canonical JSON format",
-        backstory="Expert in parsing WST markdown release reports into structured JSON datasets",
-        llm=llm,
-        verbose=False,
-        memory=True,
+    ensure_env_loaded()
+    return CachedLLM(
+        model=f"azure/{os.getenv('DEPLOYMENT_NAME')}",
+        api_version=os.getenv("AZURE_API_VERSION"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        base_url=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        temperature=0.1,
+        top_p=0.95,
+        timeout=llm_timeout(),
+        cache_opt_in=crew_cache_opt_in(),
     )
-    
-    # logger.info("\n=========================MARKDOWN INPUT TO STRUCTURER====================================\n")
-    # print(extracted_text)
-    # logger.info("============================Testing ends here========================================\n")
 
-    STRUCTURER_PROMPT = f"""
-You are given extracted WST markdown release reports. Extract structured data into valid JSON.
-
-Input markdown contains sections with:
-1. Release scope tables (Epics, PIRs, SFDC defects)
-2. Critical metrics tables
-3. Qualitative risk metrics
-4. Health trends
+# Structured-output mode: tasks carry Pydantic schemas (output_pydantic) and the
+# model's JSON-schema/tool-calling output is validated once by the models in models.py.
+STRUCTURED_OUTPUT = env_flag("WST_STRUCTURED_OUTPUT")
 
-Extract exactly the following structured JSON:
+# Output format blocks spelled out in the prompts when structured-output mode is off.
+# With structured output the Pydantic schema is handed to the model instead.
+STRUCTURER_JSON_FORMAT = """Extract exactly the following structured JSON:
 
-{{
-  "release_scope": {{
+{
+  "release_scope": {
     "Target Customers": "<extract target customers>",
-    "Release Epics": {{
-      "<version>": {{
+    "Release Epics": {
+      "<version>": {
         "Total": <integer from Total column>,
         "Open": <integer from Open column>
-      }}
-    }},
-    "Release PIRs": {{
-      "<version>": {{
+      }
+    },
+    "Release PIRs": {
+      "<version>": {
         "Total": <integer from Total column>,
         "Open": <integer from Open column>
-      }}
-    }},
-    "SFDC Defects Fixed": {{
-      "<version>": {{
+      }
+    },
+    "SFDC Defects Fixed": {
+      "<version>": {
         "ATLs Fixed": <integer from ATL column>,
         "BTLs Fixed": <integer from BTL column>
-      }}
-    }}
-  }},
-  "critical_metrics": {{
-    "Delivery Against Requirements": {{
-      "<version>": {{
+      }
+    }
+  },
+  "critical_metrics": {
+    "Delivery Against Requirements": {
+      "<version>": {
         "Value": <percentage value>,
         "Status": "<risk status>"
-      }}
-    }},
-    "System / Solution Test Metrics": {{
-      "<version>": {{
+      }
+    },
+    "System / Solution Test Metrics": {
+      "<version>": {
         "Total": <integer>,
         "Open": <integer>,
         "Status": "<risk status>"
-      }}
-    }},
-    "System / Solution Test Coverage": {{
-      "<version>": {{
+      }
+    },
+    "System / Solution Test Coverage": {
+      "<version>": {
         "Value": <percentage>,
         "Status": "<risk status>"
-      }}
-    }},
-    "System / Solution Test Pass Rate": {{
-      "<version>": {{
+      }
+    },
+    "System / Solution Test Pass Rate": {
+      "<version>": {
         "Value": <percentage>,
         "Status": "<risk status>"
-      }}
-    }},
-    "Security Test Metrics": {{
-      "<version>": {{
+      }
+    },
+    "Security Test Metrics": {
+      "<version>": {
         "Total": <integer>,
         "Open": <integer>,
         "Status": "<risk status>"
-      }}
-    }},
-    "Performance / Load Test Metrics": {{
-      "<version>": {{
+      }
+    },
+    "Performance / Load Test Metrics": {
+      "<version>": {
         "Total": <integer>,
         "Open": <integer>,
         "Status": "<risk status>"
-      }}
-    }}
-  }},
-  "health_trends": {{
-    "Unit Test Coverage": {{
-      "<version>": {{
+      }
+    }
+  },
+  "health_trends": {
+    "Unit Test Coverage": {
+      "<version>": {
         "Criteria": "<criteria text>",
         "Previous": "<previous value>",
         "Current": "<current value>",
         "Status": "<status text>",
         "Summary": "<summary text>"
-      }}
-    }},
-    "Automation Test Coverage": {{
-      "<version>": {{
+      }
+    },
+    "Automation Test Coverage": {
+      "<version>": {
         "Criteria": "<criteria text>",
         "Previous": "<previous value>",
         "Current": "<current value>",
         "Status": "<status text>",
         "Summary": "<summary text>"
-      }}
-    }}
-  }}
-}}
-
-SPECIFIC INSTRUCTIONS:
-1. For tables, extract values from the correct columns
-2. For qualitative metrics (like Delivery Against Requirements), extract the percentage and status
-3. For health trends, extract all available fields per version
-4. If a value is missing, set it to null (not 0)
-5. Only use data that is explicitly shown in the input
-6. Pay special attention to version numbers matching the data
+      }
+    }
+  }
+}
 
 Example of table extraction:
 Input:
@@ -220,48 +160,16 @@ Input:
 | 45.1.15.0     | 11    | 0    |
 
 Output:
-"Release Epics": {{
-  "45.1.15.0": {{
+"Release Epics": {
+  "45.1.15.0": {
     "Total": 11,
     "Open": 0
-  }}
-}}
+  }
+}
 
-Input markdown:
-{extracted_text}
 """
 
-
-
-    structurer_task = Task(
-    description=STRUCTURER_PROMPT,
-    agent=structurer,
-    async_execution=False,
-    expected_output="Valid JSON",
-    callback=save_wst_metrics
-)
-
-    data_crew = Crew(
-        agents=[structurer],
-        tasks=[structurer_task],
-        process=Process.sequential,
-        verbose=False 
-    )
-
-    # 2️⃣ Report Agent
-    reporter = Agent(
-        role="Technical Writer",
-        goal="Write professional WST markdown reports",
-        backstory="Expert at converting structured data into clean release documentation",
-        llm=llm,
-        verbose=False,
-        memory=True,
-    )
-
-    REPORT_PROMPT = """
-You are given structured WST release metrics and must return a structured report as valid JSON. Do not return markdown.
-
-Use this exact structure in your output:
+REPORT_JSON_FORMAT = """Use this exact structure in your output:
 {
   "Overview": "<Mention the versions being analyzed> \\n<Short paragraph summarizing overall release quality and trends>",
   "Metrics Summary": {
@@ -328,7 +236,212 @@ Use this exact structure in your output:
   "Recommendations": "<Bullet points or brief paragraph suggesting corrective actions or improvements>"
 }
 
-Instructions:
+"""
+
+VIZ_JSON_FORMAT = """    - Output format:
+      {
+        "charts": [
+          {
+            "type": "bar" | "line",
+            "data": {
+              "labels": [...],
+              "datasets": [
+                {
+                  "label": "...",
+                  "data": [...],
+                  "fill": false
+                }
+              ]
+            },
+            "options": {
+              "responsive": true,
+              "plugins": {
+                "legend": { "position": "top" },
+                "title": { "display": true, "text": "..." }
+              },
+              "scales": {
+                "x": { "beginAtZero": true },
+                "y": { "beginAtZero": true }
+              }
+            }
+          },
+          ...
+        ]
+      }
+
+"""
+
+
+@profiled("json_parse")
+def extract_json_from_output(raw_output: str) -> dict:
+    """
+    Extracts the outermost JSON object from an LLM output, whether in a code block or loose format.
+    Delegates to `locate_json_object`, which tries each plausible opening brace
+    (inside a ```json fence first) with json's raw_decode, giving up after
+    MAX_FAILED_CANDIDATES failures, so nested objects are returned whole.
+    Raises ValueError if no valid JSON found.
+    """
+    structured = locate_json_object(raw_output)
+    if structured is None:
+        raise ValueError("No valid JSON found in agent output")
+    return structured
+
+@profiled("json_parse")
+def parse_task_output(output, schema=None) -> dict:
+    """
+    Returns a task output as a plain dict keyed by the canonical JSON names.
+    Uses the already-validated Pydantic result in structured-output mode, and
+    falls back to locating JSON in the raw text (validated against `schema` if given).
+    """
+    if getattr(output, "pydantic", None) is not None:
+        return output.pydantic.model_dump(by_alias=True)
+    structured = extract_json_from_output(output.raw)
+    if schema is not None:
+        structured = schema.model_validate(structured).model_dump(by_alias=True)
+    return structured
+
+def save_wst_metrics(output, state: SharedState = shared_state):
+    # logger.info("🔎 RAW OUTPUT from Structurer Agent:\n" + output.raw)
+
+    # Schema-validated output needs no key-by-key checks
+    if isinstance(getattr(output, "pydantic", None), WstMetrics):
+        state.metrics = parse_task_output(output)
+        return
+
+    structured = extract_json_from_output(output.raw)
+
+    # logger.info("📦 STRUCTURED JSON Parsed:\n" + json.dumps(structured, indent=2))
+
+    # Step 2.2: Validate expected keys and values
+    release_scope = structured.get("release_scope", {})
+    required_scope_keys = ["Release Epics", "Release PIRs", "SFDC Defects Fixed"]
+
+    for key in required_scope_keys:
+        if key not in release_scope:
+            logger.warning("🚨 MISSING KEY in release_scope: %s", key)
+            continue
+
+        version_data = release_scope[key]
+        if not isinstance(version_data, dict):
+            logger.warning("⚠️ Unexpected format for %s: %s", key, Truncated(str(version_data), 200))
+            continue
+
+        for version, metrics in version_data.items():
+            if not isinstance(metrics, dict):
+                logger.warning("⚠️ Unexpected structure for %s -> %s: %s", key, version, Truncated(str(metrics), 200))
+                continue
+            for metric_name, value in metrics.items():
+                if value is None:
+                    logger.warning("❌ NULL VALUE: %s -> %s -> %s", key, version, metric_name, extra={"event": "null_metric"})
+
+    # Optional: Add similar validation for critical_metrics
+    critical_metrics = structured.get("critical_metrics", {})
+    for metric, version_data in critical_metrics.items():
+        for version, fields in version_data.items():
+            for field_name, value in fields.items():
+                if value is None:
+                    logger.warning("❌ NULL VALUE: %s -> %s -> %s", metric, version, field_name, extra={"event": "null_metric"})
+
+    # Optional: Add validation for health_trends
+    health_trends = structured.get("health_trends", {})
+    for metric, details in health_trends.items():
+        for field in ["Criteria", "Previous", "Current", "Status", "Summary"]:
+            if field not in details or details[field] in [None, ""]:
+                logger.warning("⚠️ Incomplete %s: Missing or empty '%s'", metric, field, extra={"event": "incomplete_metric"})
+
+    # Final assignment to shared state
+    state.metrics = structured
+
+
+def setup_crew_wst(
+    structured_output: bool = STRUCTURED_OUTPUT,
+    memory: CrewMemory | None = None,
+    state: SharedState = shared_state,
+    product: str = "WST",
+):
+    """
+    Sets up CrewAI agents for `product` analysis (WST by default) as reusable templates.
+    Per-request data is bound at kickoff through crewAI `inputs` interpolation
+    (see `wst_crew_inputs`): {harmonized_text} for the structurer and
+    {structured_data} / {release_facts} for the report, brief and viz agents,
+    so the crews after the structurer can run from any metrics (fresh, cached or merged).
+    Task callbacks write into `state`. Agent memory is off; crew memory
+    follows `memory` (see crew_memory.py), defaulting to no memory.
+    With `structured_output`, the structurer, reporter and viz tasks return
+    schema-validated Pydantic models and the prompts omit the JSON format examples.
+    Returns: (data_crew, report_crew, brief_summary_crew, viz_crew)
+    """
+    llm = get_llm()
+    memory_kwargs = (memory or CrewMemory("none", 0)).crew_kwargs()
+    structurer_format = "" if structured_output else STRUCTURER_JSON_FORMAT
+    report_format = "" if structured_output else REPORT_JSON_FORMAT
+    viz_format = "" if structured_output else VIZ_JSON_FORMAT
+
+    # 1️⃣ Structuring Agent
+    structurer = Agent(
+        role="Data Architect",
+        goal=f"Extract structured {product} release metrics into canonical JSON format",
+        backstory=f"Expert in parsing {product} markdown release reports into structured JSON datasets",
+        llm=llm,
+        verbose=False,
+        memory=False,
+    )
+    
+
+    STRUCTURER_PROMPT = f"""
+You are given extracted {product} markdown release reports. Extract structured data into valid JSON.
+
+Input markdown contains sections with:
+1. Release scope tables (Epics, PIRs, SFDC defects)
+2. Critical metrics tables
+3. Qualitative risk metrics
+4. Health trends
+
+{structurer_format}SPECIFIC INSTRUCTIONS:
+1. For tables, extract values from the correct columns
+2. For qualitative metrics (like Delivery Against Requirements), extract the percentage and status
+3. For health trends, extract all available fields per version
+4. If a value is missing, set it to null (not 0)
+5. Only use data that is explicitly shown in the input
+6. Pay special attention to version numbers matching the data
+
+Input markdown:
+{{harmonized_text}}
+"""
+
+
+
+    structurer_task = Task(
+    description=STRUCTURER_PROMPT,
+    agent=structurer,
+    async_execution=False,
+    expected_output="Valid JSON",
+    output_pydantic=WstMetrics if structured_output else None,
+    callback=functools.partial(save_wst_metrics, state=state)
+)
+
+    data_crew = Crew(
+        agents=[structurer],
+        tasks=[structurer_task],
+        process=Process.sequential,
+        verbose=False,
+        **memory_kwargs
+    )
+
+    # 2️⃣ Report Agent
+    reporter = Agent(
+        role="Technical Writer",
+        goal=f"Write professional {product} markdown reports",
+        backstory="Expert at converting structured data into clean release documentation",
+        llm=llm,
+        verbose=False,
+        memory=False,
+    )
+
+    REPORT_PROMPT = f"""
+You are given structured {product} release metrics and must return a structured report as valid JSON. Do not return markdown.
+
+{report_format}Instructions:
 - For "release_scope_metrics", output **two completely separate tables**:
   1. One for "Release Epics" (only Epics data)
   2. One for "Release PIRs" (only PIRs data)
@@ -343,24 +456,21 @@ Instructions:
 - For "health_trends":
   - Output one entry per metric **per version**.
   - Each entry must include: version, metric, criteria, previous, current, status, summary, and trend.
-  - Compute `trend` across entries of the **same metric** in version order:
-    - For the **first version**, always use `"↔"` (no comparison available)
-    - For subsequent versions:
-      - "↑" if current > previous
-      - "↓" if current < previous
-      - "↔" if unchanged
 - Use the structured input values — do not combine multiple metrics into the same row.
 - Avoid any markdown, bullet points, or explanatory text in the output — return pure JSON only.
 
-Trend Calculation Rules:
-- Compute "trend" as:
-  - "↑" if the current value is higher than the previous
-  - "↓" if the current value is lower than the previous
-  - "↔" if unchanged
-- If there are fewer than 2 valid (non-null) values across versions for a metric, set trend to "↔"
-- Skip null values in comparisons — do not compute trends across nulls
+Precomputed release facts:
+- The input below already lists every metric as one row per version, in version order.
+- Each row has "trend" ("↑", "↓" or "↔") and "change" (difference from the previous non-null value),
+  computed on Total, Value or Current; SFDC Defects rows have "ATLs Fixed trend" / "BTLs Fixed trend".
+  Copy these trends into the report; do not recompute them.
+- "open_ratio" is Open / Total; "risk_escalations" lists status changes to a more severe risk level.
+  Use both in "Key findings".
 - Do not invent or hallucinate any data
 - All output must be strictly valid JSON only — no markdown or extra formatting
+
+Release facts JSON:
+{{release_facts}}
 """
 
 
@@ -368,10 +478,10 @@ Trend Calculation Rules:
     report_task = Task(
     description=REPORT_PROMPT,
     agent=reporter,
-    context=[structurer_task],
     expected_output="Structured JSON report",
-    callback=lambda output: shared_state.report_parts.update({
-        "structured_report": extract_json_from_output(output.raw)
+    output_pydantic=WstReport if structured_output else None,
+    callback=lambda output: state.report_parts.update({
+        "structured_report": parse_task_output(output)
     })
 )
 
@@ -381,7 +491,8 @@ Trend Calculation Rules:
         agents=[reporter],
         tasks=[report_task],
         process=Process.sequential,
-        verbose=False
+        verbose=False,
+        **memory_kwargs
     )
 
     # 3️⃣ Brief Summary Agent
@@ -391,11 +502,11 @@ Trend Calculation Rules:
         backstory="Expert at condensing metrics into crisp summaries",
         llm=llm,
         verbose=False,
-        memory=True,
+        memory=False,
     )
 
-    BRIEF_PROMPT = """
-Generate a concise executive summary based strictly on the structured WST release metrics.
+    BRIEF_PROMPT = f"""
+Generate a concise executive summary based strictly on the structured {product} release metrics.
 
 - Output exactly 3-5 bullet points.
 - Start each bullet with '-'
@@ -404,14 +515,16 @@ Generate a concise executive summary based strictly on the structured WST releas
 - Absolutely no headers, intros, or conclusions.
 - Use only the provided structured metrics.
 - No hallucination or invented information.
+
+Structured metrics JSON:
+{{structured_data}}
 """
 
     brief_task = Task(
     description=BRIEF_PROMPT,
     agent=brief_writer,
-    context=[structurer_task],
     expected_output="Bullet list",
-    callback=lambda output: shared_state.report_parts.update({"brief_summary": output.raw})
+    callback=lambda output: state.report_parts.update({"brief_summary": output.raw})
 )
 
 
@@ -419,55 +532,25 @@ Generate a concise executive summary based strictly on the structured WST releas
         agents=[brief_writer],
         tasks=[brief_task],
         process=Process.sequential,
-        verbose=False
+        verbose=False,
+        **memory_kwargs
     )
   # 4️⃣ Visualization Agent
     viz_writer = Agent(
         role="Data Visualization Assistant",
-        goal="Generate valid Chart.js JSON configurations from structured WST metrics",
-        backstory="Expert at converting structured WST release metrics into interactive chart specifications using Chart.js.",
+        goal=f"Generate valid Chart.js JSON configurations from structured {product} metrics",
+        backstory=f"Expert at converting structured {product} release metrics into interactive chart specifications using Chart.js.",
         llm=llm,
         verbose=False,
-        memory=True,
+        memory=False,
     )
 
-    VIZ_PROMPT = """
-    You are a visualization expert. Convert the following structured WST release metrics JSON into a valid configuration for exactly 4 charts using Chart.js.
+    VIZ_PROMPT = f"""
+    You are a visualization expert. Convert the following structured {product} release metrics JSON into a valid configuration for exactly 4 charts using Chart.js.
 
     Instructions:
     - Output **pure JSON only** (no markdown, no explanations, no code blocks).
-    - Output format:
-      {
-        "charts": [
-          {
-            "type": "bar" | "line",
-            "data": {
-              "labels": [...],
-              "datasets": [
-                {
-                  "label": "...",
-                  "data": [...],
-                  "fill": false
-                }
-              ]
-            },
-            "options": {
-              "responsive": true,
-              "plugins": {
-                "legend": { "position": "top" },
-                "title": { "display": true, "text": "..." }
-              },
-              "scales": {
-                "x": { "beginAtZero": true },
-                "y": { "beginAtZero": true }
-              }
-            }
-          },
-          ...
-        ]
-      }
-
-    Guidelines:
+{viz_format}    Guidelines:
     - Chart 1: Total Release Epics across versions (bar chart)
     - Chart 2: Release PIRs Total across versions (bar or line)
     - Chart 3: System / Solution Test Metrics (ATL) – total vs open (line chart)
@@ -476,23 +559,93 @@ Generate a concise executive summary based strictly on the structured WST releas
     Use only values from the input. If data is missing or null, skip that entry.
 
     Here is the structured metrics JSON:
-    {structured_data}
+    {{structured_data}}
     """
 
 
     viz_task = Task(
-    description=VIZ_PROMPT.format(structured_data=json.dumps(shared_state.metrics, indent=2)),
+    description=VIZ_PROMPT,
     agent=viz_writer,
-    context=[structurer_task],
     expected_output="Chart.js config JSON",
-    callback=lambda output: shared_state.__setattr__("visualization_json", extract_json_from_output(output.raw))
+    output_pydantic=ChartBundle if structured_output else None,
+    callback=lambda output: state.__setattr__("visualization_json", parse_task_output(output))
     )
 
     viz_crew = Crew(
     agents=[viz_writer],
     tasks=[viz_task],
     process=Process.sequential,
-    verbose=False
+    verbose=False,
+    **memory_kwargs
     )
 
     return data_crew, report_crew, brief_summary_crew, viz_crew
+
+
+def wst_crew_inputs(harmonized_text: str, versions: list, metrics: dict | None = None) -> dict:
+    """
+    Builds the crewAI kickoff inputs that bind a request to the crew templates.
+    Pass the structurer's `metrics` when kicking off the report, brief and viz crews;
+    the reporter gets them as compact precomputed facts (see release_diff.py).
+    """
+    return {
+        "harmonized_text": harmonized_text,
+        "versions": ", ".join(versions),
+        "structured_data": json.dumps(metrics, indent=2),
+        "release_facts": json.dumps(compute_release_facts(metrics), ensure_ascii=False, separators=(",", ":")),
+    }
+
+
+# Idle (crews, memory, state) bundles, keyed by (product, structured-output flag). A
+# bundle is checked out by one request at a time, so each request reads results
+# from its own state. At most CREW_POOL_MAX_IDLE (default 8) bundles are kept
+# idle per pool; bundles returned beyond that are dropped.
+_crew_pools = {}
+
+
+@lru_cache(maxsize=1)
+def crew_pool_max_idle() -> int:
+    ensure_env_loaded()
+    return int(os.getenv("CREW_POOL_MAX_IDLE", "8"))
+
+
+@contextmanager
+def checkout_wst_crews(structured_output: bool = STRUCTURED_OUTPUT, product: str = "WST"):
+    """
+    Lends a prebuilt bundle for the duration of one request, building a new one
+    only if none are idle. Yields ((data_crew, report_crew, brief_summary_crew, viz_crew), state)
+    where `state` collects the task callback results for this request.
+    Per-request ("ephemeral") crew memory is cleared when the bundle is returned.
+    A bundle whose kickoffs are still running in worker threads (recorded in
+    `state.running`, e.g. after a timeout) goes back to the pool once they finish.
+    """
+    pool = _crew_pools.setdefault((product, structured_output), queue.SimpleQueue())
+    try:
+        crews, memory, state = pool.get_nowait()
+    except queue.Empty:
+        memory = new_crew_memory()
+        state = SharedState()
+        crews = setup_crew_wst(structured_output, memory, state, product)
+    state.reset()
+    def release(_=None):
+        memory.end_request()
+        if pool.qsize() < crew_pool_max_idle():
+            pool.put((crews, memory, state))
+
+    try:
+        yield crews, state
+    finally:
+        running = [kickoff for kickoff in state.running if not kickoff.done()]
+        if running:
+            asyncio.gather(*running, return_exceptions=True).add_done_callback(release)
+        else:
+            release()
+
+
+WST_PRODUCT = ProductPlugin(
+    name="WST",
+    extractor=Wst_MarkdownExtractor,
+    harmonizer=Wst_MarkdownHarmonizer,
+    checkout_crews=checkout_wst_crews,
+    crew_inputs=wst_crew_inputs,
+)